@@ -0,0 +1,96 @@
+"""
+# bench_cold_start.py
+Cold start: import time and time to the first login page render.
+
+Each run starts a fresh interpreter in an empty working directory and
+measures:
+- `import app`
+- the first `app.main()` (startup work plus the login page) and a rerun
+- which heavy modules the login page loaded (none should be)
+- importing `bot_interaction`, the cost now deferred to the first chat
+  message
+
+Outside `streamlit run`, Streamlit renders in bare mode and prints warnings,
+which are discarded.
+
+Usage:
+    python benchmarks/bench_cold_start.py [--runs N]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+SRC = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src"))
+HEAVY_MODULES = (
+    "bot_interaction",
+    "document_processor",
+    "langchain_google_genai",
+    "langchain_chroma",
+    "chromadb",
+    "unstructured",
+)
+
+
+def child():
+    """Measure one cold start in this (fresh) interpreter."""
+    sys.path.insert(0, SRC)
+    timings = {}
+
+    started = time.perf_counter()
+    import app
+
+    timings["import app"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    app.main()
+    timings["first render"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    app.main()
+    timings["rerun"] = time.perf_counter() - started
+
+    loaded = [name for name in HEAVY_MODULES if name in sys.modules]
+
+    started = time.perf_counter()
+    import bot_interaction  # noqa: F401
+
+    timings["import bot_interaction"] = time.perf_counter() - started
+    print(json.dumps({"timings": timings, "loaded": loaded}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child()
+        return
+
+    results = []
+    for _ in range(args.runs):
+        with tempfile.TemporaryDirectory() as directory:
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child"],
+                cwd=directory,
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    for name in results[0]["timings"]:
+        median = statistics.median(result["timings"][name] for result in results)
+        print(f"{name}: {1000 * median:.2f}ms (median of {args.runs})")
+    loaded = sorted({name for result in results for name in result["loaded"]})
+    print(f"heavy modules loaded by the login page: {', '.join(loaded) or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+# bench_conversation_memory.py
+Prompt history size and Redis list length as a chat session grows.
+
+One session is grown to each of TURNS turns. Every turn goes through the
+same steps as the chat pipeline: `redis_store.aload_session`,
+`select_history` and `schedule_summary_refresh`, then the turn is appended
+with `redis_store.aappend_messages`. The summarizer is a local fake that
+keeps the last SUMMARY_WORDS words of the previous summary plus the new
+transcript, so no API key or network is needed. Its refresh is awaited before
+the next turn. `asave_summary` trims the summarized messages from the list.
+
+At each size it reports the prompt history tokens (summary plus verbatim
+window), what sending the whole conversation would cost, and the session's
+Redis list length. Both the prompt and the list should stay flat.
+
+Runs against fakeredis (in the dev dependency group) unless `--redis-url`
+points at a real server.
+
+Usage:
+    uv run --group dev python benchmarks/bench_conversation_memory.py
+        [--turns 10 50 200 1000] [--redis-url URL]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from langchain_core.messages import AIMessage, HumanMessage  # noqa: E402
+
+import redis_store  # noqa: E402
+from conversation_memory import (  # noqa: E402
+    message_tokens,
+    schedule_summary_refresh,
+    select_history,
+)
+
+SUMMARY_WORDS = 150
+QUESTION_WORDS = 25
+ANSWER_WORDS = 90
+VOCABULARY = (
+    "order refund invoice shipping account password billing delivery return "
+    "warranty product update support payment customer policy address tracking"
+).split()
+
+
+def _use_fakeredis():
+    """Point the shared Redis pools at an in-process fake server."""
+    # Imported here so a run against a real server does not need fakeredis
+    import fakeredis
+    import fakeredis.aioredis
+    import redis
+    import redis.asyncio as aioredis
+
+    server = fakeredis.FakeServer()
+    redis_store._async_pool = aioredis.BlockingConnectionPool(
+        connection_class=fakeredis.aioredis.FakeConnection,
+        server=server,
+        max_connections=redis_store.REDIS_POOL_SIZE,
+    )
+    redis_store._sync_pool = redis.BlockingConnectionPool(
+        connection_class=fakeredis.FakeConnection,
+        server=server,
+        max_connections=redis_store.REDIS_POOL_SIZE,
+    )
+
+
+async def _fake_summarize(previous_summary, transcript):
+    words = f"{previous_summary} {transcript}".split()
+    return " ".join(words[-SUMMARY_WORDS:])
+
+
+def _turn(i, rng):
+    question = " ".join(rng.choices(VOCABULARY, k=QUESTION_WORDS))
+    answer = " ".join(rng.choices(VOCABULARY, k=ANSWER_WORDS))
+    return [
+        HumanMessage(content=f"Question {i}: {question}?"),
+        AIMessage(content=f"Answer {i}: {answer}."),
+    ]
+
+
+async def _chat_turn(session_id, message_pair):
+    """Select the prompt history for one turn, as the pipeline does, and record it."""
+    messages, state = await redis_store.aload_session(session_id)
+    history, refresh_upto = select_history(messages, state)
+    if refresh_upto is not None:
+        schedule_summary_refresh(
+            session_id, messages, state, refresh_upto, _fake_summarize
+        )
+    await redis_store.aappend_messages(session_id, message_pair)
+    # Let the background refresh finish before the next turn loads the session
+    pending = asyncio.all_tasks() - {asyncio.current_task()}
+    await asyncio.gather(*pending)
+
+
+async def grow_session(session_id, turns, rng):
+    full_tokens = 0
+    started = time.perf_counter()
+    for i in range(turns):
+        message_pair = _turn(i, rng)
+        await _chat_turn(session_id, message_pair)
+        full_tokens += sum(message_tokens(message) for message in message_pair)
+    elapsed = time.perf_counter() - started
+
+    # The prompt the next turn would send
+    messages, state = await redis_store.aload_session(session_id)
+    history, _ = select_history(messages, state)
+    prompt_tokens = sum(message_tokens(message) for message in history)
+    list_length = await redis_store.get_async_redis().llen(
+        redis_store.HISTORY_KEY_PREFIX + session_id
+    )
+    print(
+        f"{turns:>5} turns: prompt history {prompt_tokens} tokens "
+        f"({len(history)} messages), full conversation {full_tokens} tokens, "
+        f"Redis list {list_length} messages, "
+        f"{1000 * elapsed / turns:.2f}ms/turn"
+    )
+
+
+async def run(turn_counts, seed):
+    rng = random.Random(seed)
+    for turns in turn_counts:
+        await grow_session(f"bench-{turns}", turns, rng)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--turns", type=int, nargs="+", default=[10, 50, 200, 1000])
+    parser.add_argument("--redis-url", help="Use a real Redis server")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    if args.redis_url:
+        redis_store.REDIS_URL = args.redis_url
+    else:
+        _use_fakeredis()
+    asyncio.run(run(args.turns, args.seed))
+
+
+if __name__ == "__main__":
+    main()
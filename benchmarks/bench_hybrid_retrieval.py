@@ -0,0 +1,147 @@
+"""
+# bench_hybrid_retrieval.py
+BM25 index cost and hybrid vs dense recall on a synthetic corpus.
+
+Every synthetic chunk is about 300 words of filler text plus an exact
+identifier (an error code such as "ERR-01042") and a few words of its own.
+The benchmark reports:
+- index build time, save + load time and the index file size
+- BM25 query latency
+- recall@k of dense retrieval alone, BM25 alone and the hybrid (reciprocal
+  rank fusion of both, as the chat pipeline does) for identifier queries
+  ("what does ERR-01042 mean?") and keyword queries (the chunk's own words,
+  no identifier)
+
+Dense retrieval is an exact cosine search over embeddings from
+`--provider` (default "hashing", which needs no model or network; "local"
+and "google" use the configured providers).
+
+Usage:
+    python benchmarks/bench_hybrid_retrieval.py [--chunks N] [--queries N]
+"""
+
+import argparse
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+from operator import mul
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from embedding_providers import PROVIDERS  # noqa: E402
+from lexical_index import LexicalIndex, reciprocal_rank_fusion  # noqa: E402
+
+WORDS_PER_CHUNK = 300
+FETCH_K = 12  # candidates per retriever, as CONTEXT_FETCH_K
+VOCABULARY = [
+    f"{stem}{suffix}"
+    for stem in (
+        "account", "billing", "refund", "order", "ship", "deliver", "invoice",
+        "payment", "customer", "support", "return", "policy", "service",
+        "product", "warranty", "update", "install", "config", "network",
+        "server", "login", "password", "report", "export", "import", "sync",
+    )
+    for suffix in ("", "s", "ed", "ing", "er", "ment", "al", "ly")
+]  # fmt: skip
+
+
+def _corpus(n, rng):
+    ids, texts, codes, phrases = [], [], [], []
+    for i in range(n):
+        code = f"ERR-{i:05d}"
+        phrase = [f"w{rng.randrange(50 * n)}" for _ in range(4)]
+        words = rng.choices(VOCABULARY, k=WORDS_PER_CHUNK - 8)
+        position = rng.randrange(len(words))
+        words[position:position] = [code, "means", *phrase]
+        ids.append(f"chunk-{i}")
+        texts.append(" ".join(words))
+        codes.append(code)
+        phrases.append(phrase)
+    return ids, texts, codes, phrases
+
+
+def _normalize(vector):
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+def _dense_search(vectors, ids, query_vector, k):
+    scores = [sum(map(mul, query_vector, vector)) for vector in vectors]
+    best = sorted(range(len(ids)), key=scores.__getitem__, reverse=True)[:k]
+    return [ids[i] for i in best]
+
+
+def _recall(rankings, expected, k):
+    hits = sum(target in ranking[:k] for ranking, target in zip(rankings, expected))
+    return hits / len(expected)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--chunks", type=int, default=10000)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--provider", default="hashing", choices=sorted(PROVIDERS))
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    ids, texts, codes, phrases = _corpus(args.chunks, rng)
+    sources = [f"doc-{i // 100}.pdf" for i in range(args.chunks)]
+
+    started = time.perf_counter()
+    index = LexicalIndex.build(ids, texts, sources)
+    build = time.perf_counter() - started
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bm25_index.json")
+        started = time.perf_counter()
+        index.save(path)
+        index = LexicalIndex.load(path)
+        save_load = time.perf_counter() - started
+        size_mb = os.path.getsize(path) / 1e6
+    print(
+        f"BM25 index of {args.chunks} chunks: build {build:.2f}s, "
+        f"save+load {save_load:.2f}s, {size_mb:.1f}MB"
+    )
+
+    provider = PROVIDERS[args.provider]()
+    started = time.perf_counter()
+    vectors = [_normalize(v) for v in provider.embed_documents(texts)]
+    print(f"Embedded with {args.provider} in {time.perf_counter() - started:.1f}s")
+
+    targets = rng.sample(range(args.chunks), args.queries)
+    query_sets = {
+        "identifier": [f"what does {codes[i]} mean?" for i in targets],
+        "keyword": [" ".join(phrases[i]) for i in targets],
+    }
+    expected = [ids[i] for i in targets]
+
+    for name, queries in query_sets.items():
+        dense, lexical, hybrid = [], [], []
+        lexical_seconds = 0.0
+        for query in queries:
+            dense_ids = _dense_search(
+                vectors, ids, _normalize(provider.embed_query(query)), FETCH_K
+            )
+            started = time.perf_counter()
+            lexical_ids = [chunk_id for chunk_id, _ in index.search(query, FETCH_K)]
+            lexical_seconds += time.perf_counter() - started
+            dense.append(dense_ids)
+            lexical.append(lexical_ids)
+            hybrid.append(
+                [c for c, _ in reciprocal_rank_fusion([dense_ids, lexical_ids])]
+            )
+        print(
+            f"{name} queries, recall@{args.k}: "
+            f"dense {_recall(dense, expected, args.k):.2f}, "
+            f"bm25 {_recall(lexical, expected, args.k):.2f}, "
+            f"hybrid {_recall(hybrid, expected, args.k):.2f}; "
+            f"bm25 {1000 * lexical_seconds / len(queries):.1f}ms/query"
+        )
+
+
+if __name__ == "__main__":
+    main()
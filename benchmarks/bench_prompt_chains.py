@@ -0,0 +1,125 @@
+"""
+# bench_prompt_chains.py
+Per-turn prompt chain overhead and sync vs async chain latency.
+
+1. Building the `prompt | llm | parser` chain on every turn (what
+   get_bot_response used to do) against a `prompt_chain_cache` lookup.
+2. TURNS turns through the cached chain with a fake LLM that takes
+   LLM_LATENCY seconds: invoked one after another (sync) against awaited
+   together on one event loop (the async pipeline).
+
+The LLM is a local fake, so no API key or network is needed.
+
+Usage:
+    python benchmarks/bench_prompt_chains.py [--iterations N] [--turns N]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from langchain_core.language_models.chat_models import BaseChatModel  # noqa: E402
+from langchain_core.messages import AIMessage  # noqa: E402
+from langchain_core.outputs import ChatGeneration, ChatResult  # noqa: E402
+
+import services  # noqa: E402
+
+LLM_LATENCY = 0.05
+BOT_CONFIG = [
+    "Helper",
+    "Acme {Corp}",
+    "billing",
+    "retail",
+    "Friendly, concise. Answers use {placeholders} literally.",
+]
+
+
+class FakeChatModel(BaseChatModel):
+    """Answers "ok" after `latency` seconds."""
+
+    latency: float = LLM_LATENCY
+
+    @property
+    def _llm_type(self):
+        return "fake-latency"
+
+    def _result(self):
+        return ChatResult(generations=[ChatGeneration(message=AIMessage("ok"))])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        return self._result()
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        return self._result()
+
+
+def _inputs(i):
+    return {
+        "input": f"Question {i}?",
+        "history": [],
+        "context": "Refunds {take} 5 days",
+    }
+
+
+def bench_construction(iterations):
+    from bot_interaction import build_chain
+    from prompt_chains import PromptChainCache
+
+    started = time.perf_counter()
+    for _ in range(iterations):
+        build_chain(BOT_CONFIG)
+    build = (time.perf_counter() - started) / iterations
+
+    cache = PromptChainCache()
+    cache.get(1, BOT_CONFIG, build_chain)
+    started = time.perf_counter()
+    for _ in range(iterations):
+        cache.get(1, BOT_CONFIG, build_chain)
+    lookup = (time.perf_counter() - started) / iterations
+
+    print(f"chain per turn: build {1e6 * build:.0f}us, cached {1e6 * lookup:.1f}us")
+
+
+def bench_pipeline(turns):
+    from bot_interaction import build_chain
+
+    chain = build_chain(BOT_CONFIG)
+    chain.invoke(_inputs(0))  # warm up
+
+    started = time.perf_counter()
+    for i in range(turns):
+        chain.invoke(_inputs(i))
+    sync = time.perf_counter() - started
+
+    async def concurrent():
+        await asyncio.gather(*(chain.ainvoke(_inputs(i)) for i in range(turns)))
+
+    started = time.perf_counter()
+    asyncio.run(concurrent())
+    concurrent_seconds = time.perf_counter() - started
+
+    print(
+        f"{turns} turns, LLM {1000 * LLM_LATENCY:.0f}ms: "
+        f"sync {1000 * sync:.0f}ms, async {1000 * concurrent_seconds:.0f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--turns", type=int, default=20)
+    args = parser.parse_args()
+
+    services.register("llm", FakeChatModel)
+    bench_construction(args.iterations)
+    bench_pipeline(args.turns)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+# bench_sqlite_connections.py
+Per-call SQLite connections against the pooled WAL connections.
+
+THREADS threads (concurrent Streamlit sessions) each run OPS operations,
+three reads (a bot lookup by owner) for every write (a chat_history
+insert):
+- per-call: a fresh default `sqlite3.connect` per operation in rollback
+  journal mode, as `get_connection` used to work
+- pooled: `database.connection()`, one WAL connection per thread with the
+  tuned pragmas
+
+Reports operations per second, write latency percentiles and the number of
+"database is locked" errors.
+
+Usage:
+    python benchmarks/bench_sqlite_connections.py [--threads N] [--ops N]
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import database  # noqa: E402
+from database import connection, migrate  # noqa: E402
+
+READ = "SELECT * FROM chatbots WHERE username=?"
+WRITE = """INSERT INTO chat_history (bot_id, role, content, timestamp)
+           VALUES (?,?,?,?)"""
+
+
+def _seed(conn):
+    conn.execute("INSERT INTO users VALUES ('u', 'u@example.com', 'p')")
+    conn.execute("INSERT INTO chatbots (id, username) VALUES (1, 'u')")
+    conn.commit()
+
+
+def _per_call_read(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(READ, ("u",)).fetchall()
+    finally:
+        conn.close()
+
+
+def _per_call_write(path):
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute(WRITE, (1, "user", "x" * 200, datetime.now()))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _pooled_read(path):
+    with connection() as conn:
+        return conn.execute(READ, ("u",)).fetchall()
+
+
+def _pooled_write(path):
+    with connection() as conn:
+        conn.execute(WRITE, (1, "user", "x" * 200, datetime.now()))
+
+
+def run(read, write, path, threads, ops):
+    latencies, errors = [], []
+
+    def session():
+        for n in range(ops):
+            try:
+                if n % 4 == 0:
+                    started = time.perf_counter()
+                    write(path)
+                    latencies.append(time.perf_counter() - started)
+                else:
+                    read(path)
+            except sqlite3.OperationalError:
+                errors.append(n)
+
+    workers = [threading.Thread(target=session) for _ in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    p50 = 1000 * latencies[len(latencies) // 2]
+    p95 = 1000 * latencies[int(len(latencies) * 0.95)]
+    return (
+        f"{threads * ops / elapsed:,.0f} ops/s, write p50 {p50:.2f}ms "
+        f"p95 {p95:.2f}ms, {len(errors)} errors"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--ops", type=int, default=400)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        # Same schema; only the per-call database stays in rollback journal mode
+        per_call_path = os.path.join(directory, "per_call.db")
+        conn = sqlite3.connect(per_call_path)
+        migrate(conn)
+        _seed(conn)
+        conn.close()
+
+        database.DB_PATH = os.path.join(directory, "pooled.db")
+        conn = database.get_connection()
+        migrate(conn)
+        _seed(conn)
+        conn.close()
+
+        per_call = run(
+            _per_call_read, _per_call_write, per_call_path, args.threads, args.ops
+        )
+        print(f"per-call: {per_call}")
+        pooled = run(
+            _pooled_read, _pooled_write, database.DB_PATH, args.threads, args.ops
+        )
+        print(f"pooled:   {pooled}")
+
+
+if __name__ == "__main__":
+    main()
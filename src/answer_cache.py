@@ -0,0 +1,181 @@
+"""
+# answer_cache.py
+Per-bot semantic answer cache.
+
+Stores (question embedding, answer, retrieved chunk ids) for first-turn
+questions and serves a cached answer when a new first-turn question is
+similar enough. Entries expire after a TTL and are tied to a fingerprint of
+the bot's configuration and document set, so they are dropped automatically
+when the system prompt or the documents change.
+"""
+
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from ingest_manifest import manifest_path
+from logger import setup_logger
+
+logger = setup_logger()
+
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "86400"))
+ANSWER_CACHE_MAX_PER_BOT = int(os.getenv("ANSWER_CACHE_MAX_PER_BOT", "256"))
+
+
+def bot_fingerprint(bot_config, persist_directory):
+    """
+    Fingerprint a bot's configuration and the state of its documents.
+
+    Args:
+        bot_config (dict): The fields the system prompt is built from.
+        persist_directory (str): The bot's Chroma persist directory; its
+            ingestion manifest changes whenever documents are (re)ingested.
+
+    Returns:
+        str: A short hex digest.
+    """
+    try:
+        documents_version = os.stat(manifest_path(persist_directory)).st_mtime_ns
+    except OSError:
+        documents_version = 0
+    payload = json.dumps([bot_config, documents_version], sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def _normalize(vector):
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+class SemanticAnswerCache:
+    """
+    Thread-safe in-process cache of answers per bot.
+
+    Args:
+        threshold (float): Minimum cosine similarity for a hit.
+        ttl (float): Seconds an answer stays valid.
+        max_per_bot (int): Entries kept per bot before LRU eviction.
+    """
+
+    def __init__(
+        self,
+        threshold=ANSWER_CACHE_THRESHOLD,
+        ttl=ANSWER_CACHE_TTL,
+        max_per_bot=ANSWER_CACHE_MAX_PER_BOT,
+    ):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_per_bot = max_per_bot
+        self._bots = {}  # bot_id -> {"fingerprint": str, "entries": OrderedDict}
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+    def _bot_entries(self, bot_id, fingerprint):
+        """Return a bot's entries, dropping them if the fingerprint changed."""
+        bot = self._bots.get(bot_id)
+        if bot is None or bot["fingerprint"] != fingerprint:
+            if bot is not None:
+                logger.info("Bot %s changed; dropping its cached answers", bot_id)
+            bot = {"fingerprint": fingerprint, "entries": OrderedDict()}
+            self._bots[bot_id] = bot
+        return bot["entries"]
+
+    def lookup(self, bot_id, fingerprint, query_vector):
+        """
+        Find the most similar cached answer above the threshold.
+
+        Args:
+            bot_id (int): The chatbot's ID.
+            fingerprint (str): Current `bot_fingerprint` of the bot.
+            query_vector (list): Embedding of the new question.
+
+        Returns:
+            dict or None: The entry (`answer`, `chunk_ids`, `similarity`,
+            `latency`), or None on a miss.
+        """
+        query = _normalize(query_vector)
+        now = time.monotonic()
+        with self._lock:
+            entries = self._bot_entries(bot_id, fingerprint)
+            best, best_score = None, self.threshold
+            for key, entry in list(entries.items()):
+                if entry["expires_at"] <= now:
+                    del entries[key]
+                    continue
+                score = sum(a * b for a, b in zip(query, entry["vector"]))
+                if score >= best_score:
+                    best, best_score = key, score
+
+            if best is None:
+                self.misses += 1
+                return None
+            entries.move_to_end(best)
+            entry = entries[best]
+            self.hits += 1
+            self.saved_seconds += entry["latency"]
+            return {
+                "answer": entry["answer"],
+                "chunk_ids": entry["chunk_ids"],
+                "similarity": best_score,
+                "latency": entry["latency"],
+            }
+
+    def store(self, bot_id, fingerprint, query_vector, answer, chunk_ids, latency):
+        """
+        Cache a freshly generated first-turn answer.
+
+        Args:
+            bot_id (int): The chatbot's ID.
+            fingerprint (str): Current `bot_fingerprint` of the bot.
+            query_vector (list): Embedding of the question.
+            answer (str): The generated answer.
+            chunk_ids (list): Ids of the chunks the answer was grounded on.
+            latency (float): Seconds it took to produce the answer.
+        """
+        with self._lock:
+            entries = self._bot_entries(bot_id, fingerprint)
+            self._next_id += 1
+            entries[self._next_id] = {
+                "vector": _normalize(query_vector),
+                "answer": answer,
+                "chunk_ids": list(chunk_ids),
+                "latency": latency,
+                "expires_at": time.monotonic() + self.ttl,
+            }
+            while len(entries) > self.max_per_bot:
+                entries.popitem(last=False)
+
+    def invalidate(self, bot_id):
+        """Drop every cached answer of a bot."""
+        with self._lock:
+            self._bots.pop(bot_id, None)
+
+    def stats(self):
+        """
+        Return cache counters.
+
+        Returns:
+            dict: `bots`, `entries`, `hits`, `misses`, `hit_rate` and
+            `saved_seconds` (generation time avoided by hits).
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "bots": len(self._bots),
+                "entries": sum(len(b["entries"]) for b in self._bots.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "saved_seconds": round(self.saved_seconds, 3),
+            }
+
+
+answer_cache = SemanticAnswerCache()
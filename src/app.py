@@ -8,13 +8,21 @@ based on the user's login status.
 
 import streamlit as st
 from database import init_db, init_file_storage
+from ingestion_queue import start_ingestion_workers
 from pages import login_page, main_app
+from services import run_once
 
 
-def main():
-    # Initialize the database and file storage at startup
+def startup():
+    """Initialize the database and file storage and start the ingestion workers."""
     init_db()
     init_file_storage()
+    start_ingestion_workers()
+
+
+def main():
+    # Startup work runs on the first script run of the process only
+    run_once("startup", startup)
 
     if "logged_in" not in st.session_state:
         st.session_state.logged_in = False
@@ -12,7 +12,8 @@ import shutil
 import os
 import streamlit as st
 
-from database import get_connection, validate_email
+from conversation_store import flush as flush_conversations
+from database import connection, validate_email
 from logger import setup_logger
 
 # Get the configured logger
@@ -36,15 +37,14 @@ def create_user(username: str, email: str, password: str) -> bool:
         logger.warning("Invalid email format: %s ", email)
         raise ValueError("Invalid email format")
 
-    conn = get_connection()
-    c = conn.cursor()
     hashed_pw = hashlib.sha256(password.encode()).hexdigest()
 
     try:
-        c.execute(
-            "INSERT INTO users VALUES (?,?,?)", (username, email.lower(), hashed_pw)
-        )
-        conn.commit()
+        with connection() as conn:
+            conn.execute(
+                "INSERT INTO users VALUES (?,?,?)",
+                (username, email.lower(), hashed_pw),
+            )
         logger.info("User created successfully: %s", username)
         return True
     except sqlite3.IntegrityError as e:
@@ -54,8 +54,6 @@ def create_user(username: str, email: str, password: str) -> bool:
         if "UNIQUE constraint failed: users.username" in str(e):
             raise ValueError("Username already exists") from e
         raise
-    finally:
-        conn.close()
 
 
 def verify_user(identifier: str, password: str) -> bool:
@@ -70,24 +68,20 @@ def verify_user(identifier: str, password: str) -> bool:
         bool: True if credentials are correct, False otherwise.
     """
     logger.info("Verifying user: %s", identifier)
-    conn = get_connection()
-    c = conn.cursor()
     hashed_pw = hashlib.sha256(password.encode()).hexdigest()
 
     try:
-        # Try both username and email
-        c.execute(
-            """SELECT * FROM users 
-                     WHERE (username=? OR email=?) AND password=?""",
-            (identifier, identifier.lower(), hashed_pw),
-        )
-        result = c.fetchone()
+        with connection() as conn:
+            # Try both username and email
+            result = conn.execute(
+                """SELECT * FROM users 
+                         WHERE (username=? OR email=?) AND password=?""",
+                (identifier, identifier.lower(), hashed_pw),
+            ).fetchone()
         return result is not None
     except sqlite3.DatabaseError as e:
         logger.error("Verification failed: %s", str(e))
         return False
-    finally:
-        conn.close()
 
 
 def delete_user_account(username):
@@ -104,20 +98,28 @@ def delete_user_account(username):
         bool: True if deletion is successful, False otherwise.
     """
     logger.critical("Deleting account %s", username)
-    conn = get_connection()
-    c = conn.cursor()
-
     try:
-        # Get all chatbot ids for this user
-        c.execute("SELECT id FROM chatbots WHERE username=?", (username,))
-        bot_ids = [row[0] for row in c.fetchall()]
-
-        for bot_id in bot_ids:
-            c.execute("DELETE FROM chat_history WHERE bot_id=?", (bot_id,))
-
-        c.execute("DELETE FROM chatbots WHERE username=?", (username,))
-        c.execute("DELETE FROM users WHERE username=?", (username,))
-        conn.commit()
+        # Commit buffered turns so none are written after the delete
+        flush_conversations()
+
+        with connection() as conn:
+            c = conn.cursor()
+            # Delete the data of all this user's chatbots
+            for table in (
+                "chat_history",
+                "ingestion_jobs",
+                "bot_stats",
+                "bot_latency_histogram",
+                "bot_daily_stats",
+            ):
+                c.execute(
+                    f"""DELETE FROM {table} WHERE bot_id IN
+                            (SELECT id FROM chatbots WHERE username=?)""",
+                    (username,),
+                )
+
+            c.execute("DELETE FROM chatbots WHERE username=?", (username,))
+            c.execute("DELETE FROM users WHERE username=?", (username,))
 
         # Delete user's file directory
         user_dir = os.path.join("user_docs", username)
@@ -133,5 +135,3 @@ def delete_user_account(username):
         st.error(f"File system error while deleting account: {str(e)}")
         logger.error("File system error while deleting account: %s", str(e))
         return False
-    finally:
-        conn.close()
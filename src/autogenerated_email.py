@@ -6,7 +6,7 @@ It fetches user emails from the database and sends chatbot completion notificati
 import yagmail
 import os
 from dotenv import load_dotenv
-from database import get_connection
+from database import connection
 
 load_dotenv()
 
@@ -60,9 +60,8 @@ def get_email_for_username(username):
     Returns:
         str or None: The user's email if found, else None.
     """
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("SELECT email FROM users WHERE username = ?", (username,))
-    result = c.fetchone()
-    conn.close()
+    with connection() as conn:
+        result = conn.execute(
+            "SELECT email FROM users WHERE username = ?", (username,)
+        ).fetchone()
     return result[0] if result else None
@@ -3,8 +3,11 @@ Bot Interaction Module
 Handles bot response generation with LangChain, Google Gemini, Redis, and Chroma.
 """
 
-from langchain.callbacks.tracers import LangChainTracer
+import asyncio
 import os
+import threading
+import time
+from datetime import datetime
 from dotenv import load_dotenv
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import (
@@ -13,90 +16,366 @@ from langchain_core.prompts import (
     HumanMessagePromptTemplate,
     MessagesPlaceholder,
 )
-from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
 from langchain_core.chat_history import BaseChatMessageHistory
-from langchain_core.runnables.history import RunnableWithMessageHistory
-from langchain_redis import RedisChatMessageHistory
-from langchain_chroma import Chroma
+from langchain_core.documents import Document
 from logger import setup_logger
+from answer_cache import answer_cache, bot_fingerprint
+from context_assembly import (
+    CONTEXT_FETCH_K,
+    DEFAULT_CONTEXT_BUDGET,
+    assemble_context,
+    log_context,
+)
+from conversation_memory import schedule_summary_refresh, select_history
+from conversation_store import aload_session, arecord_turn
+from embedding_cache import query_embedding_cache
+from lexical_index import get_bot_index, reciprocal_rank_fusion
+from prompt_chains import escape_braces, prompt_chain_cache
+from redis_store import (
+    EMPTY_SUMMARY,
+    PooledRedisChatHistory,
+    redis_stats,
+)
+from services import get_embeddings, get_llm
+from vector_stores import (
+    BOT_COLLECTION,
+    bot_directory,
+    persist_directory_for,
+    source_filter,
+    vector_store_pool,
+)
 
 # Load environment variables first
 load_dotenv()
 logger = setup_logger()
 
-langsmith_tracer = LangChainTracer()
+# Per-stage timeouts (seconds) of the async chat pipeline
+STAGE_TIMEOUTS = {
+    "history": float(os.getenv("HISTORY_TIMEOUT", "5")),
+    "embedding": float(os.getenv("EMBEDDING_TIMEOUT", "10")),
+    "retrieval": float(os.getenv("RETRIEVAL_TIMEOUT", "15")),
+    "llm": float(os.getenv("LLM_TIMEOUT", "120")),
+}
 
-REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
-logger.info("Connecting to Redis at: %s", REDIS_URL)
+# BM25 hits ranked this high are kept even when their embedding is not
+# similar to the query (exact identifiers, error codes, ...)
+LEXICAL_MATCH_TOP = 3
 
-gemini_api_key = os.getenv("GEMINI_API_KEY")
-llm = ChatGoogleGenerativeAI(model="gemini-1.5-flash", api_key=gemini_api_key)
+_RAISE = object()
 
-embeddings = GoogleGenerativeAIEmbeddings(
-    model="models/embedding-001",
-    google_api_key=os.getenv("GEMINI_API_KEY"),
-    task_type="retrieval_document",
-)
+_loop = None
+_loop_lock = threading.Lock()
 
 
-def get_relevant_documents_from_chroma(user_input: str, bot_name: str, username: str):
+def embed_query(user_input: str):
     """
-    Retrieves the most relevant documents from the user's Chroma database based on input.
+    Returns the embedding of a chat query, memoized across turns and sessions.
 
     Args:
         user_input (str): The query provided by the user.
-        bot_name (str): The chatbot's name.
-        username (str): The user's identifier.
 
     Returns:
-        tuple: A list of relevant documents and the username.
+        list: The query vector.
+    """
+    embeddings = get_embeddings()
+    return query_embedding_cache.get_or_compute(
+        embeddings.provider_id, user_input, embeddings.embed_query
+    )
+
+
+async def aembed_query(user_input: str):
+    """Async variant of `embed_query`."""
+    embeddings = get_embeddings()
+    return await query_embedding_cache.aget_or_compute(
+        embeddings.provider_id, user_input, embeddings.aembed_query
+    )
+
+
+def _get_event_loop():
+    """Returns the process-wide event loop that runs the async chat pipeline."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=_loop.run_forever, name="chat-pipeline", daemon=True
+            ).start()
+    return _loop
+
+
+def run_sync(coroutine):
+    """
+    Runs a coroutine on the pipeline event loop and waits for its result.
+
+    All sessions share one loop, so concurrent turns overlap their I/O
+    instead of each blocking its own script thread. If the caller is
+    interrupted, the coroutine is cancelled.
+
+    Args:
+        coroutine: The coroutine to run.
+
+    Returns:
+        The coroutine's result.
     """
+    future = asyncio.run_coroutine_threadsafe(coroutine, _get_event_loop())
     try:
-        directory_path = os.path.join("user_docs", username, str(bot_name))
-        if not os.path.isdir(directory_path):
-            logger.warning("Invalid directory: %s", directory_path)
-            return [], username
-
-        files = [
-            f
-            for f in os.listdir(directory_path)
-            if os.path.isfile(os.path.join(directory_path, f))
-        ]
-        if not files:
-            logger.warning("No files found in: %s", directory_path)
-            return [], username
+        return future.result()
+    finally:
+        future.cancel()
+
+
+async def _anext(async_iterator):
+    return await async_iterator.__anext__()
 
-        persist_directory = os.path.join(directory_path, "Chroma_db")
-        if not os.path.exists(persist_directory):
-            logger.warning("Chroma directory missing: %s", persist_directory)
-            return [], username
 
-        relevant_documents = []
+def iterate_sync(async_iterator):
+    """
+    Iterates an async generator from synchronous code.
+
+    Args:
+        async_iterator: The async generator to consume.
 
-        for file_name in files:
-            collection_name = os.path.splitext(file_name)[0]
+    Yields:
+        Its items, one at a time.
+    """
+    loop = _get_event_loop()
+    try:
+        while True:
+            future = asyncio.run_coroutine_threadsafe(_anext(async_iterator), loop)
             try:
-                vector_store = Chroma(
-                    collection_name=collection_name,
-                    persist_directory=persist_directory,
-                    embedding_function=embeddings,
-                )
-                logger.info("Processing collection: %s", vector_store._collection.name)
+                item = future.result()
+            except StopAsyncIteration:
+                return
+            finally:
+                future.cancel()
+            yield item
+    finally:
+        asyncio.run_coroutine_threadsafe(async_iterator.aclose(), loop).result()
 
-                query_embedding = embeddings.embed_query(user_input)
-                results = vector_store.similarity_search_by_vector(query_embedding, k=3)
-                relevant_documents.extend([doc.page_content for doc in results])
 
-            except Exception as e:
-                logger.error("Error processing %s: %s", collection_name, e)
+async def _stage(name: str, awaitable, default=_RAISE):
+    """
+    Awaits one pipeline stage under its timeout.
 
-        return relevant_documents, username
+    Args:
+        name (str): Key into `STAGE_TIMEOUTS`, also used in logs.
+        awaitable: The stage's coroutine or task; cancelled on timeout.
+        default: Returned instead of raising when the stage fails or times out.
+
+    Returns:
+        The stage's result, or `default`.
+    """
+    try:
+        return await asyncio.wait_for(awaitable, STAGE_TIMEOUTS[name])
+    except asyncio.TimeoutError:
+        logger.warning("Stage %s timed out after %ss", name, STAGE_TIMEOUTS[name])
+        if default is _RAISE:
+            raise
+    except Exception as e:
+        logger.error("Stage %s failed: %s", name, e)
+        if default is _RAISE:
+            raise
+    return default
+
+
+def _open_collection(persist_directory, collection_name):
+    """Returns the pooled vector store of a collection, opening it on a miss."""
+    return vector_store_pool.get(
+        persist_directory, get_embeddings(), collection_name=collection_name
+    )
+
+
+def _query_collection(vector_store, query_vector, k, where):
+    """Runs one Chroma query; returns candidate dicts with their embeddings."""
+    result = vector_store._collection.query(
+        query_embeddings=[list(query_vector)],
+        n_results=k,
+        where=where,
+        include=["documents", "metadatas", "distances", "embeddings"],
+    )
+    return [
+        {
+            "id": chunk_id,
+            "text": text,
+            "metadata": metadata or {},
+            "distance": distance,
+            "vector": list(vector),
+        }
+        for chunk_id, text, metadata, distance, vector in zip(
+            result["ids"][0],
+            result["documents"][0],
+            result["metadatas"][0],
+            result["distances"][0],
+            result["embeddings"][0],
+        )
+    ]
+
+
+async def _asearch_collection(
+    persist_directory, collection_name, query_vector, k, where
+):
+    """Runs one nearest-neighbour query over a collection."""
+    # Chroma's persistent client is synchronous; run it off the event loop. A
+    # pool miss opens the client and may build the embeddings service too
+    vector_store = await asyncio.to_thread(
+        _open_collection, persist_directory, collection_name
+    )
+    count = await asyncio.to_thread(vector_store._collection.count)
+    if count == 0:
+        logger.warning(
+            "No chunks in %s/%s; run migrate_collections.py for bots ingested "
+            "into per-file collections",
+            persist_directory,
+            collection_name,
+        )
+        return []
+    return await asyncio.to_thread(
+        _query_collection, vector_store, query_vector, min(k, count), where
+    )
+
+
+async def asearch_bot_candidates(
+    user_input: str,
+    bot_name: str,
+    username: str,
+    files=None,
+    k: int = 3,
+    collections=None,
+    query_vector=None,
+):
+    """
+    Searches a bot's collections concurrently and merges the global top-k.
+
+    Args:
+        user_input (str): The query provided by the user.
+        bot_name (str): The chatbot's name.
+        username (str): The user's identifier.
+        files (list, optional): File names to restrict the search to.
+        k (int): Number of chunks to return.
+        collections (list, optional): Collections to search; defaults to the
+            bot collection.
+        query_vector (list, optional): Precomputed embedding of `user_input`.
+
+    Returns:
+        list: Candidate dicts (`id`, `text`, `metadata`, `distance`,
+        `vector`), nearest first.
+    """
+    directory_path = bot_directory(username, bot_name)
+    persist_directory = persist_directory_for(directory_path)
+    if not os.path.exists(persist_directory):
+        logger.warning("Chroma directory missing: %s", persist_directory)
+        return []
+
+    if query_vector is None:
+        query_vector = await aembed_query(user_input)
+    collections = list(collections or [BOT_COLLECTION])
+    results = await asyncio.gather(
+        *(
+            _asearch_collection(
+                persist_directory, name, query_vector, k, source_filter(files)
+            )
+            for name in collections
+        ),
+        return_exceptions=True,
+    )
+
+    candidates = []
+    for name, result in zip(collections, results):
+        if isinstance(result, BaseException):
+            logger.error("Search of collection %s failed: %s", name, result)
+            continue
+        candidates.extend(result)
+    candidates.sort(key=lambda c: c["distance"])
+    return candidates[:k]
+
+
+async def asearch_bot_documents(
+    user_input: str, bot_name: str, username: str, files=None, k: int = 3
+):
+    """
+    Returns the global top-k chunks of a bot as LangChain Documents (with `id`).
+
+    Args:
+        user_input (str): The query provided by the user.
+        bot_name (str): The chatbot's name.
+        username (str): The user's identifier.
+        files (list, optional): File names to restrict the search to.
+        k (int): Number of chunks to return.
+
+    Returns:
+        list: The chunks, nearest first.
+    """
+    candidates = await asearch_bot_candidates(user_input, bot_name, username, files, k)
+    return [
+        Document(id=c["id"], page_content=c["text"], metadata=c["metadata"])
+        for c in candidates
+    ]
+
+
+def search_bot_documents(
+    user_input: str, bot_name: str, username: str, files=None, k: int = 3
+):
+    """
+    Synchronous wrapper around `asearch_bot_documents`.
+
+    Args:
+        user_input (str): The query provided by the user.
+        bot_name (str): The chatbot's name.
+        username (str): The user's identifier.
+        files (list, optional): File names to restrict the search to.
+        k (int): Number of chunks to return.
+
+    Returns:
+        list: The global top-k chunks as LangChain Documents (with `id`).
+    """
+    return run_sync(asearch_bot_documents(user_input, bot_name, username, files, k))
+
+
+def get_relevant_documents_from_chroma(
+    user_input: str, bot_name: str, username: str, files=None, k: int = 3
+):
+    """
+    Retrieves the most relevant documents from the user's Chroma database based on input.
+
+    A single nearest-neighbour query over the bot collection returns the
+    global top-k chunks across all of the bot's files.
+
+    Args:
+        user_input (str): The query provided by the user.
+        bot_name (str): The chatbot's name.
+        username (str): The user's identifier.
+        files (list, optional): File names to restrict the search to.
+        k (int): Number of chunks to return.
+
+    Returns:
+        tuple: A list of relevant documents and the username.
+    """
+    try:
+        results = search_bot_documents(user_input, bot_name, username, files, k)
+        return [doc.page_content for doc in results], username
 
     except Exception as e:
         logger.error("Error retrieving documents: %s", e)
         return [], username
 
 
+def get_retrieval_stats():
+    """
+    Returns monitoring counters of the retrieval caches.
+
+    Returns:
+        dict: `query_embeddings`, `vector_stores`, `answers`,
+        `prompt_chains` and `redis` statistics.
+    """
+    return {
+        "query_embeddings": query_embedding_cache.stats(),
+        "vector_stores": vector_store_pool.stats(),
+        "answers": answer_cache.stats(),
+        "prompt_chains": prompt_chain_cache.stats(),
+        "redis": redis_stats(),
+    }
+
+
 def build_system_prompt(
     bot_name: str, company_name: str, domain: str, industry: str, bot_behavior: str
 ) -> str:
@@ -140,6 +419,33 @@ def build_system_prompt(
     """
 
 
+def build_chain(bot_config: list):
+    """
+    Compiles the prompt chain of a bot.
+
+    The bot's fields are escaped into the template text; the retrieved
+    context, the history and the user input stay template variables.
+
+    Args:
+        bot_config (list): bot_name, company_name, domain, industry and
+            bot_behavior.
+
+    Returns:
+        Runnable: `prompt | llm | StrOutputParser()`.
+    """
+    system_prompt = escape_braces(build_system_prompt(*bot_config))
+    system_prompt += "\n\nRelevant Context:\n{context}"
+
+    prompt = ChatPromptTemplate.from_messages(
+        [
+            SystemMessagePromptTemplate.from_template(system_prompt),
+            MessagesPlaceholder(variable_name="history"),
+            HumanMessagePromptTemplate.from_template("{input}"),
+        ]
+    )
+    return prompt | get_llm() | StrOutputParser()
+
+
 def get_redis_history(session_id: str) -> BaseChatMessageHistory:
     """
     Retrieves chat history from Redis.
@@ -148,12 +454,268 @@ def get_redis_history(session_id: str) -> BaseChatMessageHistory:
         session_id (str): Unique session identifier.
 
     Returns:
-        RedisChatMessageHistory: Chat history object.
+        PooledRedisChatHistory: Chat history object on the shared pool.
+    """
+    return PooledRedisChatHistory(session_id)
+
+
+FALLBACK_RESPONSE = (
+    "Apologies, I'm experiencing technical difficulties. Please try again later."
+)
+
+
+SUMMARY_PROMPT = """Update the summary of a customer support conversation.
+Keep names, facts, decisions and open questions; drop greetings and filler.
+Answer with the updated summary only, in at most 200 words.
+
+Current summary:
+{summary}
+
+New messages:
+{transcript}
+"""
+
+
+async def _asummarize(previous_summary: str, transcript: str) -> str:
+    """Folds older messages into a session's rolling summary."""
+    result = await get_llm().ainvoke(
+        SUMMARY_PROMPT.format(
+            summary=previous_summary or "(none)", transcript=transcript
+        )
+    )
+    return result.content
+
+
+def _lexical_search(persist_directory: str, user_input: str, k: int):
+    """Ranks the bot's chunks against the query with its BM25 index."""
+    if not os.path.exists(persist_directory):
+        return []
+    return get_bot_index(persist_directory).search(user_input, k=k)
+
+
+def _get_chunks(persist_directory: str, ids: list):
+    """Fetches stored chunks (text, metadata, embedding) by id."""
+    vector_store = vector_store_pool.get(persist_directory, get_embeddings())
+    result = vector_store._collection.get(
+        ids=ids, include=["documents", "metadatas", "embeddings"]
+    )
+    return [
+        {
+            "id": chunk_id,
+            "text": text,
+            "metadata": metadata or {},
+            "distance": None,
+            "vector": list(vector),
+        }
+        for chunk_id, text, metadata, vector in zip(
+            result["ids"],
+            result["documents"],
+            result["metadatas"],
+            result["embeddings"],
+        )
+    ]
+
+
+async def _aretrieve(embed_task, user_input: str, bot_name: str, username: str):
     """
-    return RedisChatMessageHistory(session_id, redis_url=REDIS_URL)
+    Hybrid retrieval: BM25 and vector search, merged by reciprocal rank fusion.
+
+    The lexical search needs no network call, so it starts right away and
+    runs while the query is embedded. If the embedding fails or times out,
+    the turn is answered from the lexical results alone.
+    """
+    persist_directory = persist_directory_for(bot_directory(username, bot_name))
+    lexical_task = asyncio.create_task(
+        asyncio.to_thread(
+            _lexical_search, persist_directory, user_input, CONTEXT_FETCH_K
+        )
+    )
+    try:
+        # Shielded: the answer-cache lookup also awaits the embedding, and a
+        # retrieval timeout must not cancel it
+        query_vector = await asyncio.shield(embed_task)
+        if query_vector is None:
+            logger.warning("No query embedding; using lexical retrieval only")
+            vector_candidates = []
+        else:
+            vector_candidates = await asearch_bot_candidates(
+                user_input,
+                bot_name,
+                username,
+                k=CONTEXT_FETCH_K,
+                query_vector=query_vector,
+            )
+        try:
+            lexical_hits = await lexical_task
+        except Exception as e:
+            logger.error("Lexical search failed: %s", e)
+            lexical_hits = []
+    finally:
+        lexical_task.cancel()
+
+    fused = reciprocal_rank_fusion(
+        [
+            [c["id"] for c in vector_candidates],
+            [chunk_id for chunk_id, _ in lexical_hits],
+        ]
+    )[:CONTEXT_FETCH_K]
+    if not fused:
+        return []
+
+    by_id = {c["id"]: c for c in vector_candidates}
+    missing = [chunk_id for chunk_id, _ in fused if chunk_id not in by_id]
+    if missing:
+        for chunk in await asyncio.to_thread(_get_chunks, persist_directory, missing):
+            by_id[chunk["id"]] = chunk
+
+    strong_lexical = {chunk_id for chunk_id, _ in lexical_hits[:LEXICAL_MATCH_TOP]}
+    top_score = fused[0][1]
+    return [
+        dict(
+            by_id[chunk_id],
+            relevance=score / top_score,
+            lexical_match=chunk_id in strong_lexical,
+        )
+        for chunk_id, score in fused
+        if chunk_id in by_id
+    ]
+
+
+async def _aprepare_turn(
+    bot_name: str,
+    company_name: str,
+    domain: str,
+    industry: str,
+    bot_behavior: str,
+    user_input: str,
+    session_id: str,
+    bot_id: int,
+    username: str,
+    context_budget: int = None,
+) -> dict:
+    """
+    Runs everything before the LLM call: answer-cache lookup, retrieval,
+    context assembly and prompt/chain construction.
+
+    The Redis session load (history and summary in one round trip), the
+    query embedding and the vector searches run concurrently, each under its
+    own stage timeout. Stages still pending when the turn is decided (e.g.
+    on an answer-cache hit) are cancelled.
+
+    Returns:
+        dict: Either `cached` (the answer to return as-is) or the
+        `chain` and its `inputs`, plus what is needed to record the turn.
+    """
+    turn = {
+        "started": time.perf_counter(),
+        "received_at": datetime.now(),
+        "first_turn": False,
+        "session_id": session_id,
+    }
+
+    embed_task = asyncio.create_task(
+        _stage("embedding", aembed_query(user_input), default=None)
+    )
+    session_task = asyncio.create_task(
+        _stage("history", aload_session(session_id), default=None)
+    )
+    retrieval_task = asyncio.create_task(
+        _stage(
+            "retrieval",
+            _aretrieve(embed_task, user_input, bot_name, username),
+            default=[],
+        )
+    )
+    try:
+        messages, summary_state = await session_task or (None, EMPTY_SUMMARY)
+        # An unreadable history is treated as non-empty so no cached answer
+        # is served in the middle of a conversation
+        turn["first_turn"] = messages == []
+        turn["messages"] = messages or []
+
+        # First-turn questions may be answered from the semantic answer cache
+        if turn["first_turn"]:
+            turn["query_vector"] = await embed_task
+            turn["fingerprint"] = bot_fingerprint(
+                [bot_name, company_name, domain, industry, bot_behavior],
+                persist_directory_for(bot_directory(username, bot_name)),
+            )
+            cached = (
+                answer_cache.lookup(bot_id, turn["fingerprint"], turn["query_vector"])
+                if turn["query_vector"] is not None
+                else None
+            )
+            if cached:
+                logger.info(
+                    "Answer cache hit for bot %s (similarity %.3f)",
+                    bot_id,
+                    cached["similarity"],
+                )
+                turn["cached"] = cached["answer"]
+                turn["first_turn"] = False
+                return turn
+
+        candidates = await retrieval_task
+        if candidates:
+            turn["query_vector"] = await embed_task
+    finally:
+        for task in (embed_task, session_task, retrieval_task):
+            task.cancel()
+
+    history_messages, refresh_upto = select_history(turn["messages"], summary_state)
+    if refresh_upto:
+        schedule_summary_refresh(
+            session_id, turn["messages"], summary_state, refresh_upto, _asummarize
+        )
+
+    budget = context_budget or DEFAULT_CONTEXT_BUDGET
+    assembled = assemble_context(candidates, turn.get("query_vector") or [], budget)
+    log_context(bot_id, assembled, budget)
+    turn["chunk_ids"] = [chunk["id"] for chunk in assembled["included"]]
+
+    turn["chain"] = prompt_chain_cache.get(
+        bot_id, [bot_name, company_name, domain, industry, bot_behavior], build_chain
+    )
+    turn["inputs"] = {
+        "input": user_input,
+        "history": history_messages,
+        "context": assembled["context"],
+    }
+    return turn
+
+
+async def _afinish_turn(
+    turn: dict, bot_id: int, user_input: str, result: str, first_token_time=None
+):
+    """Records the turn in the conversation store and caches first-turn answers."""
+    await _stage(
+        "history",
+        arecord_turn(
+            bot_id,
+            turn["session_id"],
+            user_input,
+            result,
+            turn["received_at"],
+            time.perf_counter() - turn["started"],
+            first_token_time,
+        ),
+        default=None,
+    )
+    # The turn is buffered for SQLite as soon as it is recorded; a failure
+    # past this point must not record it again
+    turn["recorded"] = True
+    if turn["first_turn"] and turn.get("query_vector") is not None:
+        answer_cache.store(
+            bot_id,
+            turn["fingerprint"],
+            turn["query_vector"],
+            result,
+            turn["chunk_ids"],
+            time.perf_counter() - turn["started"],
+        )
 
 
-def get_bot_response(
+async def aget_bot_response(
     bot_name: str,
     company_name: str,
     domain: str,
@@ -163,6 +725,7 @@ def get_bot_response(
     session_id: str,
     bot_id: int,
     username: str,
+    context_budget: int = None,
 ) -> str:
     """
     Generates a chatbot response based on user input and context.
@@ -177,51 +740,167 @@ def get_bot_response(
         session_id (str): Unique session identifier.
         bot_id (int): Chatbot's ID.
         username (str): User's identifier.
+        context_budget (int, optional): The bot's context token budget;
+            defaults to `CONTEXT_TOKEN_BUDGET`.
 
     Returns:
         str: Chatbot response.
     """
     try:
         logger.info("Processing request for %s (bot %s)", username, bot_id)
-
-        relevant_documents, username = get_relevant_documents_from_chroma(
-            user_input, bot_name, username
-        )
-        context = (
-            "\n".join(relevant_documents)
-            if relevant_documents
-            else "No additional context available"
+        turn = await _aprepare_turn(
+            bot_name,
+            company_name,
+            domain,
+            industry,
+            bot_behavior,
+            user_input,
+            session_id,
+            bot_id,
+            username,
+            context_budget,
         )
+        if "cached" in turn:
+            result = turn["cached"]
+        else:
+            result = await _stage("llm", turn["chain"].ainvoke(turn["inputs"]))
+        await _afinish_turn(turn, bot_id, user_input, result)
+
+        logger.info("Successfully generated response for %s", username)
+        return result
+
+    except Exception as e:
+        logger.error("Error in get_bot_response: %s", str(e))
+        return FALLBACK_RESPONSE
+
+
+def get_bot_response(*args, **kwargs) -> str:
+    """Synchronous wrapper around `aget_bot_response`; same arguments."""
+    return run_sync(aget_bot_response(*args, **kwargs))
 
-        system_prompt = build_system_prompt(
-            bot_name, company_name, domain, industry, bot_behavior
+
+async def astream_bot_response(
+    bot_name: str,
+    company_name: str,
+    domain: str,
+    industry: str,
+    bot_behavior: str,
+    user_input: str,
+    session_id: str,
+    bot_id: int,
+    username: str,
+    context_budget: int = None,
+    timings: dict = None,
+):
+    """
+    Streams a chatbot response token by token.
+
+    Same pipeline as `aget_bot_response`; the turn is recorded once the
+    stream completes. The whole generation shares the "llm" stage
+    timeout.
+
+    Args:
+        bot_name (str): Chatbot's name.
+        company_name (str): Associated company.
+        domain (str): Bot's knowledge domain.
+        industry (str): Business industry.
+        bot_behavior (str): AI behavior and persona.
+        user_input (str): User's input query.
+        session_id (str): Unique session identifier.
+        bot_id (int): Chatbot's ID.
+        username (str): User's identifier.
+        context_budget (int, optional): The bot's context token budget;
+            defaults to `CONTEXT_TOKEN_BUDGET`.
+        timings (dict, optional): Filled with `time_to_first_token` and
+            `total` (seconds) when the stream ends.
+
+    Yields:
+        str: Response text chunks.
+    """
+    received_at = datetime.now()
+    started = time.perf_counter()
+    first_token_at = None
+    parts = []
+    turn = {}
+    try:
+        logger.info("Streaming request for %s (bot %s)", username, bot_id)
+        turn = await _aprepare_turn(
+            bot_name,
+            company_name,
+            domain,
+            industry,
+            bot_behavior,
+            user_input,
+            session_id,
+            bot_id,
+            username,
+            context_budget,
         )
-        system_prompt += f"\n\nRelevant Context:\n{context}"
-
-        prompt = ChatPromptTemplate.from_messages(
-            [
-                SystemMessagePromptTemplate.from_template(system_prompt),
-                MessagesPlaceholder(variable_name="history"),
-                HumanMessagePromptTemplate.from_template("{input}"),
-            ]
+        if "cached" in turn:
+            first_token_at = time.perf_counter()
+            yield turn["cached"]
+            await _afinish_turn(
+                turn, bot_id, user_input, turn["cached"], first_token_at - started
+            )
+            return
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + STAGE_TIMEOUTS["llm"]
+        stream = turn["chain"].astream(turn["inputs"])
+        try:
+            while True:
+                try:
+                    token = await asyncio.wait_for(
+                        _anext(stream), max(deadline - loop.time(), 0)
+                    )
+                except StopAsyncIteration:
+                    break
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                parts.append(token)
+                yield token
+        finally:
+            await stream.aclose()
+        await _afinish_turn(
+            turn,
+            bot_id,
+            user_input,
+            "".join(parts),
+            first_token_at - started if first_token_at else None,
         )
 
-        chain = prompt | llm | StrOutputParser()
-
-        chain_with_history = RunnableWithMessageHistory(
-            chain,
-            get_redis_history,
-            input_messages_key="input",
-            history_messages_key="history",
+    except Exception as e:
+        logger.error("Error in stream_bot_response: %s", str(e))
+        if not parts:
+            first_token_at = first_token_at or time.perf_counter()
+            yield FALLBACK_RESPONSE
+        if turn.get("recorded"):
+            return
+        # Keep the turn as the user saw it
+        await _stage(
+            "history",
+            arecord_turn(
+                bot_id,
+                session_id,
+                user_input,
+                "".join(parts) or FALLBACK_RESPONSE,
+                received_at,
+                time.perf_counter() - started,
+                first_token_at - started,
+            ),
+            default=None,
         )
 
-        result = chain_with_history.invoke(
-            {"input": user_input}, config={"configurable": {"session_id": session_id}}
+    finally:
+        total = time.perf_counter() - started
+        ttft = (first_token_at or time.perf_counter()) - started
+        logger.info(
+            "Response for bot %s: first token %.2fs, total %.2fs", bot_id, ttft, total
         )
+        if timings is not None:
+            timings.update({"time_to_first_token": ttft, "total": total})
 
-        logger.info("Successfully generated response for %s", username)
-        return result
 
-    except Exception as e:
-        logger.error("Error in get_bot_response: %s", str(e))
-        return "Apologies, I'm experiencing technical difficulties. Please try again later."
+def stream_bot_response(*args, **kwargs):
+    """Synchronous wrapper around `astream_bot_response`; same arguments."""
+    return iterate_sync(astream_bot_response(*args, **kwargs))
@@ -0,0 +1,353 @@
+"""
+# bot_stats.py
+Per-bot analytics, maintained as chat turns are committed.
+
+The conversation store calls `record_turns` in the transaction that writes
+the turns, so the rollups always match `chat_history`:
+- `bot_stats`: message, turn and conversation (session) counts and the
+  response-time sum of each bot
+- `bot_latency_histogram`: turns per response-time bucket, from which
+  `get_bot_stats` estimates p50/p95/p99
+- `bot_daily_stats`: the same counts per bot and day
+
+Reading a bot's metrics is a few primary-key lookups, however long its
+history is. History stored before the rollups existed is rolled up by the
+migration that creates them; the backfill command rebuilds the rollups from
+chat_history.
+
+Usage:
+    python src/bot_stats.py [--bot-id ID]
+"""
+
+import argparse
+import bisect
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+from database import connection, init_db
+from logger import setup_logger
+
+logger = setup_logger()
+
+# Upper bounds (seconds) of the latency histogram buckets; one more bucket
+# holds everything slower
+LATENCY_BUCKETS = (
+    0.25, 0.5, 0.75, 1, 1.5, 2, 3, 4, 5, 6, 8, 10, 15, 20, 30, 45, 60, 90, 120
+)  # fmt: skip
+
+# messages, turns, conversations, response_time_sum, response_time_count
+_FIELDS = 5
+
+
+class _Rollup:
+    """Stat increments of a set of messages, grouped per bot and per day."""
+
+    def __init__(self):
+        self.totals = {}  # bot_id -> [field, ...]
+        self.daily = {}  # (bot_id, day) -> [field, ...]
+        self.histogram = Counter()  # (bot_id, bucket) -> turns
+
+    def add_message(self, bot_id, day, role, response_time=None, new_session=False):
+        """
+        Count one message.
+
+        Args:
+            bot_id (int): The chatbot's database ID.
+            day (str): ISO date of the message.
+            role (str): "user" or "assistant".
+            response_time (float, optional): Seconds the reply took (assistant
+                messages only).
+            new_session (bool): Whether the message starts a conversation.
+        """
+        increments = [
+            1,
+            int(role == "user"),
+            int(new_session),
+            response_time or 0.0,
+            int(response_time is not None),
+        ]
+        for key, table in ((bot_id, self.totals), ((bot_id, day), self.daily)):
+            fields = table.setdefault(key, [0] * _FIELDS)
+            for i, value in enumerate(increments):
+                fields[i] += value
+        if response_time is not None:
+            bucket = bisect.bisect_left(LATENCY_BUCKETS, response_time)
+            self.histogram[(bot_id, bucket)] += 1
+
+    def apply(self, conn):
+        """Add the increments to the rollup tables."""
+        now = datetime.now()
+        conn.executemany(
+            """INSERT INTO bot_stats
+                    (bot_id, messages, turns, conversations,
+                     response_time_sum, response_time_count, updated_at)
+                    VALUES (?,?,?,?,?,?,?)
+                    ON CONFLICT(bot_id) DO UPDATE SET
+                        messages = messages + excluded.messages,
+                        turns = turns + excluded.turns,
+                        conversations = conversations + excluded.conversations,
+                        response_time_sum =
+                            response_time_sum + excluded.response_time_sum,
+                        response_time_count =
+                            response_time_count + excluded.response_time_count,
+                        updated_at = excluded.updated_at""",
+            [(bot_id, *fields, now) for bot_id, fields in self.totals.items()],
+        )
+        conn.executemany(
+            """INSERT INTO bot_daily_stats
+                    (bot_id, day, messages, turns, conversations,
+                     response_time_sum, response_time_count)
+                    VALUES (?,?,?,?,?,?,?)
+                    ON CONFLICT(bot_id, day) DO UPDATE SET
+                        messages = messages + excluded.messages,
+                        turns = turns + excluded.turns,
+                        conversations = conversations + excluded.conversations,
+                        response_time_sum =
+                            response_time_sum + excluded.response_time_sum,
+                        response_time_count =
+                            response_time_count + excluded.response_time_count""",
+            [(*key, *fields) for key, fields in self.daily.items()],
+        )
+        conn.executemany(
+            """INSERT INTO bot_latency_histogram (bot_id, bucket, turns)
+                    VALUES (?,?,?)
+                    ON CONFLICT(bot_id, bucket) DO UPDATE SET
+                        turns = turns + excluded.turns""",
+            [(*key, turns) for key, turns in self.histogram.items()],
+        )
+
+
+def record_turns(conn, turns):
+    """
+    Add a batch of turns to the rollups.
+
+    Call inside the transaction that stores the turns, before their rows
+    are inserted: a turn starts a conversation when its session has no
+    stored messages yet.
+
+    Args:
+        conn (sqlite3.Connection): The connection of that transaction.
+        turns (list): Turn dicts of the conversation store.
+    """
+    rollup = _Rollup()
+    seen = set()
+    for turn in turns:
+        session_id = turn["session_id"]
+        new_session = False
+        if session_id and session_id not in seen:
+            seen.add(session_id)
+            new_session = (
+                conn.execute(
+                    "SELECT 1 FROM chat_history WHERE session_id=? LIMIT 1",
+                    (session_id,),
+                ).fetchone()
+                is None
+            )
+        rollup.add_message(
+            turn["bot_id"],
+            turn["started_at"].date().isoformat(),
+            "user",
+            new_session=new_session,
+        )
+        rollup.add_message(
+            turn["bot_id"],
+            turn["finished_at"].date().isoformat(),
+            "assistant",
+            response_time=turn["response_time"],
+        )
+    rollup.apply(conn)
+
+
+def delete_bot_stats(conn, bot_ids):
+    """Remove the rollups of bots (inside the transaction deleting them)."""
+    for table in ("bot_stats", "bot_latency_histogram", "bot_daily_stats"):
+        conn.executemany(
+            f"DELETE FROM {table} WHERE bot_id=?", [(bot_id,) for bot_id in bot_ids]
+        )
+
+
+def _percentile(histogram, total, fraction):
+    """Estimate a percentile by interpolating inside its histogram bucket."""
+    rank = fraction * total
+    seen = 0
+    for bucket in sorted(histogram):
+        count = histogram[bucket]
+        if seen + count >= rank:
+            lower = LATENCY_BUCKETS[bucket - 1] if bucket else 0.0
+            if bucket >= len(LATENCY_BUCKETS):
+                return lower
+            upper = LATENCY_BUCKETS[bucket]
+            return lower + (upper - lower) * (rank - seen) / count
+        seen += count
+    return None
+
+
+def get_bot_stats(bot_id):
+    """
+    Return a bot's metrics from its rollups.
+
+    Args:
+        bot_id (int): The chatbot's database ID.
+
+    Returns:
+        dict: `messages`, `turns`, `conversations`, `avg_response_time` and
+        `p50`/`p95`/`p99` (seconds, None without recorded latencies).
+    """
+    with connection() as conn:
+        row = conn.execute(
+            """SELECT messages, turns, conversations,
+                      response_time_sum, response_time_count
+                    FROM bot_stats WHERE bot_id=?""",
+            (bot_id,),
+        ).fetchone() or (0, 0, 0, 0.0, 0)
+        histogram = dict(
+            conn.execute(
+                "SELECT bucket, turns FROM bot_latency_histogram WHERE bot_id=?",
+                (bot_id,),
+            ).fetchall()
+        )
+    total = sum(histogram.values())
+    stats = {
+        "messages": row[0],
+        "turns": row[1],
+        "conversations": row[2],
+        "avg_response_time": row[3] / row[4] if row[4] else None,
+    }
+    for name, fraction in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+        stats[name] = _percentile(histogram, total, fraction) if total else None
+    return stats
+
+
+def get_daily_stats(bot_id, days=30):
+    """
+    Return a bot's per-day counts for the last `days` days (days without
+    messages are omitted).
+
+    Returns:
+        list: Dicts with `day`, `messages`, `turns`, `conversations` and
+        `avg_response_time`, oldest first.
+    """
+    since = (date.today() - timedelta(days=days - 1)).isoformat()
+    with connection() as conn:
+        rows = conn.execute(
+            """SELECT day, messages, turns, conversations,
+                      response_time_sum, response_time_count
+                    FROM bot_daily_stats
+                    WHERE bot_id=? AND day>=?
+                    ORDER BY day""",
+            (bot_id, since),
+        ).fetchall()
+    return [
+        {
+            "day": row[0],
+            "messages": row[1],
+            "turns": row[2],
+            "conversations": row[3],
+            "avg_response_time": row[4] / row[5] if row[5] else None,
+        }
+        for row in rows
+    ]
+
+
+def _elapsed(start, end):
+    """Seconds between two stored timestamps, or None if unparseable."""
+    try:
+        seconds = (
+            datetime.fromisoformat(str(end)) - datetime.fromisoformat(str(start))
+        ).total_seconds()
+    except (TypeError, ValueError):
+        return None
+    return seconds if seconds >= 0 else None
+
+
+def rebuild_bot_stats(conn, bot_id):
+    """
+    Rebuild a bot's rollups from its stored chat history.
+
+    Messages stored before latencies were recorded get the time between the
+    user message and the reply, as the dashboard used to compute it.
+
+    Args:
+        conn (sqlite3.Connection): Connection inside a write transaction, so
+            no turns are committed while rebuilding.
+        bot_id (int): The chatbot's database ID.
+
+    Returns:
+        int: Number of messages rolled up.
+    """
+    delete_bot_stats(conn, [bot_id])
+    rollup = _Rollup()
+    sessions = set()
+    previous = None
+    count = 0
+    rows = conn.execute(
+        """SELECT role, timestamp, response_time, session_id
+                FROM chat_history
+                WHERE bot_id=?
+                ORDER BY timestamp, id""",
+        (bot_id,),
+    )
+    for role, timestamp, response_time, session_id in rows:
+        new_session = bool(session_id) and session_id not in sessions
+        sessions.add(session_id)
+        if role == "assistant" and response_time is None and previous:
+            if previous[0] == "user":
+                response_time = _elapsed(previous[1], timestamp)
+        rollup.add_message(
+            bot_id,
+            str(timestamp)[:10],
+            role,
+            response_time=response_time if role == "assistant" else None,
+            new_session=new_session,
+        )
+        previous = (role, timestamp)
+        count += 1
+    rollup.apply(conn)
+    return count
+
+
+def backfill_bot(bot_id):
+    """
+    Rebuild a bot's rollups in a transaction of its own.
+
+    Returns:
+        int: Number of messages rolled up.
+    """
+    with connection() as conn:
+        # Hold the write lock so no turns are committed while rebuilding
+        conn.execute("BEGIN IMMEDIATE")
+        return rebuild_bot_stats(conn, bot_id)
+
+
+def backfill(bot_id=None):
+    """
+    Rebuild the rollups of one bot or of every bot.
+
+    Returns:
+        int: Number of messages rolled up.
+    """
+    with connection() as conn:
+        if bot_id is None:
+            bot_ids = [row[0] for row in conn.execute("SELECT id FROM chatbots")]
+        else:
+            bot_ids = [bot_id]
+    total = 0
+    for current in bot_ids:
+        messages = backfill_bot(current)
+        logger.info("Rolled up %s messages of bot %s", messages, current)
+        total += messages
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--bot-id", type=int, help="only this bot (default: all)")
+    args = parser.parse_args()
+
+    init_db()
+    total = backfill(args.bot_id)
+    logger.info("Backfilled analytics from %s messages", total)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,59 +2,82 @@
 # chat_history.py
 Chat History Management Module
 
-This module handles the retrieval and storage of chatbot conversations.
+This module handles the retrieval of chatbot conversations. Turns are
+written through `conversation_store.arecord_turn`.
 """
 
-from datetime import datetime
+import os
 
-from database import get_connection
+from conversation_store import flush
+from database import connection
 from logger import setup_logger
 
 # Get the configured logger
 logger = setup_logger()
 
+CHAT_HISTORY_PAGE_SIZE = int(os.getenv("CHAT_HISTORY_PAGE_SIZE", "50"))
 
-def get_chat_history(bot_id):
-    """Retrieve conversation history for a chatbot"""
-    logger.info("Fetching chat history for bot %s", bot_id)
-    conn = get_connection()
-    c = conn.cursor()
 
+def get_chat_history(bot_id, before=None, limit=CHAT_HISTORY_PAGE_SIZE):
+    """
+    Retrieve one page of a chatbot's conversation history.
+
+    Pages are keyed on (timestamp, id), so every page is an index range
+    scan however deep it is.
+
+    Args:
+        bot_id (int): The chatbot's database ID.
+        before (tuple, optional): (timestamp, id) of the oldest message
+            already loaded; only older messages are returned. None returns
+            the most recent page.
+        limit (int): Maximum number of messages.
+
+    Returns:
+        list: Messages (`id`, `role`, `content`, `timestamp`,
+        `response_time`), oldest first.
+    """
+    logger.info("Fetching chat history for bot %s", bot_id)
     try:
-        c.execute(
-            """SELECT role, content 
-                    FROM chat_history 
-                    WHERE bot_id=? 
-                    ORDER BY timestamp""",
-            (bot_id,),
-        )
-        history = [{"role": row[0], "content": row[1]} for row in c.fetchall()]
+        # Commit buffered turns first so the history includes them
+        flush()
+        with connection() as conn:
+            if before is None:
+                rows = conn.execute(
+                    """SELECT id, role, content, timestamp, response_time
+                            FROM chat_history
+                            WHERE bot_id=?
+                            ORDER BY timestamp DESC, id DESC
+                            LIMIT ?""",
+                    (bot_id, limit),
+                ).fetchall()
+            else:
+                rows = conn.execute(
+                    """SELECT id, role, content, timestamp, response_time
+                            FROM chat_history
+                            WHERE bot_id=? AND (timestamp, id) < (?, ?)
+                            ORDER BY timestamp DESC, id DESC
+                            LIMIT ?""",
+                    (bot_id, *before, limit),
+                ).fetchall()
+        history = [
+            {
+                "id": row[0],
+                "role": row[1],
+                "content": row[2],
+                "timestamp": row[3],
+                "response_time": row[4],
+            }
+            for row in reversed(rows)
+        ]
         logger.debug("Found %s messages in history", len(history))
         return history
     except Exception as e:
         logger.error("Failed to fetch chat history: %s", str(e))
         return []
-    finally:
-        conn.close()
 
 
-def save_message(bot_id, role, content):
-    """Store a message in chat history"""
-    logger.debug("Saving %s message for bot %s", role, bot_id)
-    conn = get_connection()
-    c = conn.cursor()
+def history_cursor(messages):
+    """Return the `before` cursor that pages past the oldest of `messages`."""
+    oldest = messages[0]
+    return (oldest["timestamp"], oldest["id"])
 
-    try:
-        c.execute(
-            """INSERT INTO chat_history 
-                    (bot_id, role, content, timestamp)
-                    VALUES (?,?,?,?)""",
-            (bot_id, role, content, datetime.now()),
-        )
-        conn.commit()
-        return True
-    except Exception as e:
-        logger.error("Failed to save message: %s", str(e))
-        return False
-    finally:
-        conn.close()
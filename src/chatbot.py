@@ -2,17 +2,24 @@
 # chatbot.py
 Chatbot management module.
 
-This module handles chatbot creation, retrieval, deletion, 
-and chat history storage for users.
+This module handles chatbot creation, retrieval and deletion for users.
+Chat turns are written only through `conversation_store.arecord_turn` and
+read a page at a time through `chat_history.get_chat_history`.
 """
 
 import os
 import shutil
 from datetime import datetime
 import streamlit as st
-from document_processor import process_document  # Import the process_document function
-from database import get_connection
+from answer_cache import answer_cache
+from bot_stats import delete_bot_stats
+from chunking import normalize_chunking
+from context_assembly import DEFAULT_CONTEXT_BUDGET
+from conversation_store import flush as flush_conversations
+from database import connection
+from ingestion_queue import enqueue_ingestion_job
 from logger import setup_logger
+from prompt_chains import prompt_chain_cache
 
 logger = setup_logger()
 
@@ -20,67 +27,74 @@ logger = setup_logger()
 def create_chatbot(username, data, files):
     """Create a new chatbot with organized document storage"""
     logger.info("Creating chatbot for user: %s", username)
-    conn = get_connection()
-    c = conn.cursor()
     bot_id = None
 
     try:
-        # Create initial chatbot record
-        c.execute(
-            """INSERT INTO chatbots 
-                (username, bot_name, company_name, domain, industry, system_prompt, documents, created_at)
-                VALUES (?,?,?,?,?,?,?,?)""",
-            (
-                username,
-                data["bot_name"],
-                data["company_name"],
-                data["domain"],
-                data["industry"],
-                data["system_prompt"],
-                "",
-                datetime.now(),
-            ),
-        )
-        bot_id = c.lastrowid
-        bot_name = data["bot_name"]
-        logger.info("Created base chatbot record with ID: %s", bot_id)
-
-        # Create document directory structure
-        bot_dir = os.path.join("user_docs", username, str(bot_name))
-        os.makedirs(bot_dir, exist_ok=True)
-        logger.info("Created document directory: %s", bot_dir)
-
-        # Process uploaded files
-        doc_paths = []
-        if files:
-            for file in files:
-                safe_filename = "".join(
-                    c for c in file.name if c.isalnum() or c in (" ", ".", "_")
-                ).rstrip()
-                file_path = os.path.join(bot_dir, safe_filename)
-
-                # Handle duplicate filenames
-                counter = 1
-                while os.path.exists(file_path):
-                    name, ext = os.path.splitext(safe_filename)
-                    file_path = os.path.join(bot_dir, f"{name}_{counter}{ext}")
-                    counter += 1
-
-                with open(file_path, "wb") as f:
-                    f.write(file.getbuffer())
-                doc_paths.append(file_path)
-                logger.debug("Stored document: %s", file_path)
-
-            # Update record with document paths
+        with connection() as conn:
+            c = conn.cursor()
+            # Create initial chatbot record
+            chunking = normalize_chunking(data.get("chunking"))
             c.execute(
-                """UPDATE chatbots SET documents = ?
-                        WHERE id = ?""",
-                (",".join(doc_paths), bot_id),
+                """INSERT INTO chatbots 
+                    (username, bot_name, company_name, domain, industry, system_prompt, documents, created_at,
+                     chunking_strategy, chunk_size, chunk_overlap, context_token_budget)
+                    VALUES (?,?,?,?,?,?,?,?,?,?,?,?)""",
+                (
+                    username,
+                    data["bot_name"],
+                    data["company_name"],
+                    data["domain"],
+                    data["industry"],
+                    data["system_prompt"],
+                    "",
+                    datetime.now(),
+                    chunking["strategy"],
+                    chunking["chunk_size"],
+                    chunking["chunk_overlap"],
+                    data.get("context_token_budget"),
+                ),
             )
-
-        conn.commit()
-        # Call document processing and embedding generation after files are uploaded
-        process_document(bot_dir)  # Process documents and generate embeddings
+            bot_id = c.lastrowid
+            bot_name = data["bot_name"]
+            logger.info("Created base chatbot record with ID: %s", bot_id)
+
+            # Create document directory structure
+            bot_dir = os.path.join("user_docs", username, str(bot_name))
+            os.makedirs(bot_dir, exist_ok=True)
+            logger.info("Created document directory: %s", bot_dir)
+
+            # Process uploaded files
+            doc_paths = []
+            if files:
+                for file in files:
+                    safe_filename = "".join(
+                        c for c in file.name if c.isalnum() or c in (" ", ".", "_")
+                    ).rstrip()
+                    file_path = os.path.join(bot_dir, safe_filename)
+
+                    # Handle duplicate filenames
+                    counter = 1
+                    while os.path.exists(file_path):
+                        name, ext = os.path.splitext(safe_filename)
+                        file_path = os.path.join(bot_dir, f"{name}_{counter}{ext}")
+                        counter += 1
+
+                    with open(file_path, "wb") as f:
+                        f.write(file.getbuffer())
+                    doc_paths.append(file_path)
+                    logger.debug("Stored document: %s", file_path)
+
+                # Update record with document paths
+                c.execute(
+                    """UPDATE chatbots SET documents = ?
+                            WHERE id = ?""",
+                    (",".join(doc_paths), bot_id),
+                )
+
+        # Hand document processing and embedding generation to the background
+        # ingestion workers so this request returns immediately
+        if doc_paths:
+            enqueue_ingestion_job(bot_id, username, bot_dir)
 
         logger.info("Successfully created chatbot %s", bot_id)
         return True
@@ -100,59 +114,83 @@ def create_chatbot(username, data, files):
             except Exception as cleanup_error:
                 logger.error("Cleanup failed: %s", str(cleanup_error))
 
-        conn.rollback()
         return False
 
-    finally:
-        conn.close()
-
 
 def get_user_chatbots(username):
     """Retrieve all chatbots for a given user"""
     logger.info("Fetching chatbots for user: %s", username)
-    conn = get_connection()
-    c = conn.cursor()
-
     try:
-        c.execute("""SELECT * FROM chatbots WHERE username=?""", (username,))
-        results = c.fetchall()
+        with connection() as conn:
+            results = conn.execute(
+                """SELECT * FROM chatbots WHERE username=?""", (username,)
+            ).fetchall()
         logger.debug("Found %s chatbots for %s", len(results), username)
         return results
     except Exception as e:
         logger.error("Failed to fetch chatbots: %s", str(e))
         return []
-    finally:
-        conn.close()
+
+
+def get_chunking_settings(bot_id):
+    """Return the chunking settings stored for a chatbot (defaults if unset)."""
+    with connection() as conn:
+        row = conn.execute(
+            """SELECT chunking_strategy, chunk_size, chunk_overlap
+                    FROM chatbots WHERE id=?""",
+            (bot_id,),
+        ).fetchone() or (None, None, None)
+    return normalize_chunking(
+        {"strategy": row[0], "chunk_size": row[1], "chunk_overlap": row[2]}
+    )
+
+
+def get_context_budget(bot_id):
+    """Return the context token budget of a chatbot (the default if unset)."""
+    with connection() as conn:
+        row = conn.execute(
+            "SELECT context_token_budget FROM chatbots WHERE id=?", (bot_id,)
+        ).fetchone()
+    return (row and row[0]) or DEFAULT_CONTEXT_BUDGET
 
 
 def delete_chatbot(bot_id, username):
     """Permanently delete a chatbot and its associated data"""
     logger.critical("Deleting chatbot %s for %s", bot_id, username)
-    conn = get_connection()
-    c = conn.cursor()
-
     try:
-        # Get document paths from database
-        c.execute(
-            """SELECT documents FROM chatbots 
-                    WHERE id=? AND username=?""",
-            (bot_id, username),
-        )
-        result = c.fetchone()
-        doc_paths = result[0].split(",") if result and result[0] else []
-
-        # Delete database records
-        c.execute(
-            """DELETE FROM chat_history 
-                    WHERE bot_id=?""",
-            (bot_id,),
-        )
-        c.execute(
-            """DELETE FROM chatbots 
-                    WHERE id=? AND username=?""",
-            (bot_id, username),
-        )
-        conn.commit()
+        # Commit buffered turns so none are written after the delete
+        flush_conversations()
+
+        with connection() as conn:
+            c = conn.cursor()
+            # Get document paths from database
+            c.execute(
+                """SELECT documents FROM chatbots 
+                        WHERE id=? AND username=?""",
+                (bot_id, username),
+            )
+            result = c.fetchone()
+            doc_paths = result[0].split(",") if result and result[0] else []
+
+            # Delete database records
+            c.execute(
+                """DELETE FROM chat_history 
+                        WHERE bot_id=?""",
+                (bot_id,),
+            )
+            c.execute(
+                """DELETE FROM ingestion_jobs 
+                        WHERE bot_id=?""",
+                (bot_id,),
+            )
+            delete_bot_stats(conn, [bot_id])
+            c.execute(
+                """DELETE FROM chatbots 
+                        WHERE id=? AND username=?""",
+                (bot_id, username),
+            )
+        answer_cache.invalidate(bot_id)
+        prompt_chain_cache.invalidate(bot_id)
         logger.info("Deleted database records for chatbot %s", bot_id)
 
         # Delete document directory
@@ -175,54 +213,5 @@ def delete_chatbot(bot_id, username):
     except Exception as e:
         logger.error("Chatbot deletion failed: %s", str(e))
         st.error(f"Error deleting chatbot: {str(e)}")
-        conn.rollback()
         return False
 
-    finally:
-        conn.close()
-
-
-def get_chat_history(bot_id):
-    """Retrieve conversation history for a chatbot"""
-    logger.info("Fetching chat history for bot %s", bot_id)
-    conn = get_connection()
-    c = conn.cursor()
-
-    try:
-        c.execute(
-            """SELECT role, content 
-                    FROM chat_history 
-                    WHERE bot_id=? 
-                    ORDER BY timestamp""",
-            (bot_id,),
-        )
-        history = [{"role": row[0], "content": row[1]} for row in c.fetchall()]
-        logger.debug("Found %s messages in history", len(history))
-        return history
-    except Exception as e:
-        logger.error("Failed to fetch chat history: %s", str(e))
-        return []
-    finally:
-        conn.close()
-
-
-def save_message(bot_id, role, content):
-    """Store a message in chat history"""
-    logger.debug("Saving {role} message for bot %s", bot_id)
-    conn = get_connection()
-    c = conn.cursor()
-
-    try:
-        c.execute(
-            """INSERT INTO chat_history 
-                    (bot_id, role, content, timestamp)
-                    VALUES (?,?,?,?)""",
-            (bot_id, role, content, datetime.now()),
-        )
-        conn.commit()
-        return True
-    except Exception as e:
-        logger.error("Failed to save message: %s", str(e))
-        return False
-    finally:
-        conn.close()
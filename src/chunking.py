@@ -0,0 +1,188 @@
+"""
+# chunking.py
+Pluggable chunking stage for document ingestion.
+
+Supported strategies:
+- "token": our own token-sized chunker with overlap that never crosses a
+  heading and only breaks between sentences
+- "by_title": Unstructured's section-aware chunking
+- "basic": Unstructured's plain size-based chunking
+
+Sizes are always given in (approximate) tokens; for the Unstructured
+strategies they are converted to characters.
+"""
+
+import regex as re
+
+CHUNKING_STRATEGIES = ("token", "by_title", "basic")
+DEFAULT_CHUNKING = {"strategy": "token", "chunk_size": 400, "chunk_overlap": 50}
+
+# Rough characters-per-token ratio for English text
+CHARS_PER_TOKEN = 4
+
+TOKEN_REGEX = re.compile(r"\w+|[^\w\s]")
+SENTENCE_REGEX = re.compile(r"(?<=[.!?])\s+|\n{2,}")
+HEADING_CATEGORIES = {"Title", "Header"}
+
+
+def estimate_tokens(text):
+    """Approximate the number of LLM tokens in a text (words plus punctuation)."""
+    return len(TOKEN_REGEX.findall(text))
+
+
+def normalize_chunking(settings=None):
+    """
+    Fill in defaults and validate chunking settings.
+
+    Args:
+        settings (dict, optional): `strategy`, `chunk_size` and
+            `chunk_overlap`; missing or empty values use the defaults.
+
+    Returns:
+        dict: Complete, validated settings.
+
+    Raises:
+        ValueError: If the strategy is unknown or the sizes are inconsistent.
+    """
+    merged = dict(DEFAULT_CHUNKING)
+    merged.update({k: v for k, v in (settings or {}).items() if v is not None})
+    merged["chunk_size"] = int(merged["chunk_size"])
+    merged["chunk_overlap"] = int(merged["chunk_overlap"])
+
+    if merged["strategy"] not in CHUNKING_STRATEGIES:
+        raise ValueError(f"Unknown chunking strategy: {merged['strategy']}")
+    if merged["chunk_size"] <= 0:
+        raise ValueError("Chunk size must be positive")
+    if not 0 <= merged["chunk_overlap"] < merged["chunk_size"]:
+        raise ValueError("Chunk overlap must be smaller than the chunk size")
+    return merged
+
+
+def loader_kwargs(settings):
+    """
+    Return the UnstructuredLoader keyword arguments for a chunking strategy.
+
+    The "token" strategy asks Unstructured for raw elements and chunks them
+    itself in `chunk_elements`.
+    """
+    if settings["strategy"] == "token":
+        return {}
+    return {
+        "chunking_strategy": settings["strategy"],
+        "max_characters": settings["chunk_size"] * CHARS_PER_TOKEN,
+        "overlap": settings["chunk_overlap"] * CHARS_PER_TOKEN,
+        "include_orig_elements": False,
+    }
+
+
+def _split_sentences(text):
+    """Split text into sentences, keeping paragraph breaks as boundaries."""
+    return [s.strip() for s in SENTENCE_REGEX.split(text) if s and s.strip()]
+
+
+def truncate_to_tokens(text, max_tokens):
+    """
+    Cut text down to at most `max_tokens`, breaking between sentences.
+
+    Args:
+        text (str): The text to shorten.
+        max_tokens (int): Token budget.
+
+    Returns:
+        str: The leading whole sentences that fit; empty if not even the
+        first sentence does.
+    """
+    kept, used = [], 0
+    for sentence in _split_sentences(text):
+        tokens = estimate_tokens(sentence)
+        if used + tokens > max_tokens:
+            break
+        kept.append(sentence)
+        used += tokens
+    return " ".join(kept)
+
+
+def _split_long_sentence(sentence, chunk_size):
+    """Split a single sentence that exceeds the chunk size on word boundaries."""
+    words = sentence.split()
+    piece, piece_tokens = [], 0
+    for word in words:
+        tokens = estimate_tokens(word)
+        if piece and piece_tokens + tokens > chunk_size:
+            yield " ".join(piece)
+            piece, piece_tokens = [], 0
+        piece.append(word)
+        piece_tokens += tokens
+    if piece:
+        yield " ".join(piece)
+
+
+def _chunk_metadata(metadata):
+    """Keep only the scalar element metadata useful on a chunk."""
+    return {
+        key: value
+        for key, value in (metadata or {}).items()
+        if key in ("source", "filename", "page_number", "filetype")
+    }
+
+
+def chunk_elements(elements, chunk_size, chunk_overlap):
+    """
+    Group Unstructured elements into token-sized chunks.
+
+    Chunks break only between sentences, start fresh at every heading, and
+    repeat up to `chunk_overlap` tokens of trailing sentences from the
+    previous chunk of the same section.
+
+    Args:
+        elements (iterable): LangChain Documents, one per Unstructured element.
+        chunk_size (int): Maximum tokens per chunk.
+        chunk_overlap (int): Tokens of overlap between consecutive chunks.
+
+    Yields:
+        Document: The chunks, carrying the metadata of their first element.
+    """
+    # Imported here so the UI can read the chunking settings without
+    # loading LangChain
+    from langchain_core.documents import Document
+
+    sentences = []  # (text, tokens) pairs of the chunk being built
+    size = 0
+    metadata = None
+
+    def flush():
+        return Document(
+            page_content=" ".join(text for text, _ in sentences),
+            metadata=metadata,
+        )
+
+    for element in elements:
+        is_heading = element.metadata.get("category") in HEADING_CATEGORIES
+        if is_heading and sentences:
+            yield flush()
+            sentences, size, metadata = [], 0, None
+
+        for sentence in _split_sentences(element.page_content):
+            for piece in _split_long_sentence(sentence, chunk_size):
+                tokens = estimate_tokens(piece)
+                if sentences and size + tokens > chunk_size:
+                    yield flush()
+                    # Carry trailing sentences into the next chunk as overlap
+                    overlap, overlap_size = [], 0
+                    for text, count in reversed(sentences):
+                        if (
+                            overlap_size + count > chunk_overlap
+                            or overlap_size + count + tokens > chunk_size
+                        ):
+                            break
+                        overlap.insert(0, (text, count))
+                        overlap_size += count
+                    sentences, size = overlap, overlap_size
+                    metadata = _chunk_metadata(element.metadata)
+                if metadata is None:
+                    metadata = _chunk_metadata(element.metadata)
+                sentences.append((piece, tokens))
+                size += tokens
+
+    if sentences:
+        yield flush()
@@ -0,0 +1,189 @@
+"""
+# context_assembly.py
+Builds the "Relevant Context" section of the system prompt from retrieved
+chunks.
+
+Stages:
+1. drop chunks whose cosine similarity to the query is below a threshold,
+   unless they are strong lexical (BM25) matches
+2. drop exact duplicates (same normalized text) and near duplicates
+   (chunk embeddings almost identical to an already kept chunk)
+3. order the rest by maximal marginal relevance, trading relevance (the
+   fused retrieval score) against redundancy with the chunks already picked
+4. pack chunks into the bot's token budget, truncating the last one at a
+   sentence boundary
+"""
+
+import hashlib
+import math
+import os
+
+from chunking import estimate_tokens, truncate_to_tokens
+from logger import setup_logger
+
+logger = setup_logger()
+
+DEFAULT_CONTEXT_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+CONTEXT_FETCH_K = int(os.getenv("CONTEXT_FETCH_K", "12"))
+CONTEXT_MIN_SIMILARITY = float(os.getenv("CONTEXT_MIN_SIMILARITY", "0.3"))
+CONTEXT_DUPLICATE_SIMILARITY = float(
+    os.getenv("CONTEXT_DUPLICATE_SIMILARITY", "0.97")
+)
+CONTEXT_MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7"))
+
+# Do not bother adding a truncated chunk with less room than this
+MIN_TRUNCATED_TOKENS = 40
+
+NO_CONTEXT = "No additional context available"
+
+
+def _normalize(vector):
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+def _dot(a, b):
+    return sum(x * y for x, y in zip(a, b))
+
+
+def _text_key(text):
+    return hashlib.sha256(" ".join(text.lower().split()).encode("utf-8")).digest()
+
+
+def _mmr_order(candidates, lambda_mult):
+    """Order candidates by maximal marginal relevance."""
+    remaining = list(candidates)
+    ordered = []
+    while remaining:
+        best, best_score = None, -math.inf
+        for candidate in remaining:
+            redundancy = max(
+                (_dot(candidate["unit"], picked["unit"]) for picked in ordered),
+                default=0.0,
+            )
+            score = (
+                lambda_mult * candidate["relevance"]
+                - (1 - lambda_mult) * redundancy
+            )
+            if score > best_score:
+                best, best_score = candidate, score
+        remaining.remove(best)
+        ordered.append(best)
+    return ordered
+
+
+def assemble_context(
+    candidates,
+    query_vector,
+    budget=DEFAULT_CONTEXT_BUDGET,
+    min_similarity=CONTEXT_MIN_SIMILARITY,
+    duplicate_similarity=CONTEXT_DUPLICATE_SIMILARITY,
+    lambda_mult=CONTEXT_MMR_LAMBDA,
+):
+    """
+    Select, order and pack retrieved chunks into a token budget.
+
+    Candidates are ranked by their `relevance` (e.g. a fused hybrid score)
+    when given, else by cosine similarity to the query. Strong lexical
+    matches are exempt from the similarity threshold, and without a query
+    vector (lexical-only retrieval) no threshold is applied.
+
+    Args:
+        candidates (list): Dicts with `id`, `text`, `metadata` and `vector`
+            (the chunk embedding), optionally `relevance` in [0, 1] and
+            `lexical_match`.
+        query_vector (list): Embedding of the user's question; may be empty.
+        budget (int): Maximum tokens of context.
+        min_similarity (float): Cosine similarity below which a chunk is dropped.
+        duplicate_similarity (float): Cosine similarity between two chunks
+            above which the later one is a near duplicate.
+        lambda_mult (float): MMR weight of relevance versus diversity.
+
+    Returns:
+        dict: `context` (the text to put in the prompt), `included` (per
+        chunk `id`, `source`, `relevance`, `tokens`, `truncated`),
+        `tokens` used and `dropped` counts per reason.
+    """
+    query = _normalize(query_vector) if query_vector else None
+    dropped = {"low_score": 0, "duplicate": 0, "budget": 0}
+
+    scored = []
+    for candidate in candidates:
+        unit = _normalize(candidate["vector"])
+        similarity = _dot(query, unit) if query else None
+        if (
+            similarity is not None
+            and similarity < min_similarity
+            and not candidate.get("lexical_match")
+        ):
+            dropped["low_score"] += 1
+            continue
+        relevance = candidate.get("relevance", similarity or 0.0)
+        scored.append(dict(candidate, unit=unit, relevance=relevance))
+    scored.sort(key=lambda c: c["relevance"], reverse=True)
+
+    unique, seen_texts = [], set()
+    for candidate in scored:
+        key = _text_key(candidate["text"])
+        if key in seen_texts or any(
+            _dot(candidate["unit"], kept["unit"]) >= duplicate_similarity
+            for kept in unique
+        ):
+            dropped["duplicate"] += 1
+            continue
+        seen_texts.add(key)
+        unique.append(candidate)
+
+    parts, included, used = [], [], 0
+    for candidate in _mmr_order(unique, lambda_mult):
+        text = candidate["text"]
+        tokens = estimate_tokens(text)
+        truncated = False
+        if used + tokens > budget:
+            room = budget - used
+            text = (
+                truncate_to_tokens(text, room) if room >= MIN_TRUNCATED_TOKENS else ""
+            )
+            if not text:
+                dropped["budget"] += 1
+                continue
+            tokens, truncated = estimate_tokens(text), True
+        parts.append(text)
+        used += tokens
+        included.append(
+            {
+                "id": candidate["id"],
+                "source": (candidate.get("metadata") or {}).get("source"),
+                "relevance": round(candidate["relevance"], 3),
+                "tokens": tokens,
+                "truncated": truncated,
+            }
+        )
+
+    return {
+        "context": "\n\n".join(parts) if parts else NO_CONTEXT,
+        "included": included,
+        "tokens": used,
+        "dropped": dropped,
+    }
+
+
+def log_context(bot_id, assembled, budget):
+    """Log what went into a turn's context and how much of the budget it used."""
+    logger.info(
+        "Context for bot %s: %s chunks, %s/%s tokens, dropped %s",
+        bot_id,
+        len(assembled["included"]),
+        assembled["tokens"],
+        budget,
+        assembled["dropped"],
+    )
+    for chunk in assembled["included"]:
+        logger.info(
+            "  %s (%s) relevance %.3f, %s tokens%s",
+            chunk["id"],
+            chunk["source"],
+            chunk["relevance"],
+            chunk["tokens"],
+            ", truncated" if chunk["truncated"] else "",
+        )
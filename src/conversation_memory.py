@@ -0,0 +1,118 @@
+"""
+# conversation_memory.py
+History strategy for long chat sessions.
+
+Only the most recent turns are sent to the LLM verbatim, within a token
+budget. Older turns are folded into a rolling summary stored in Redis next
+to the session and trimmed from the session's Redis list (see
+`redis_store`). The summary is refreshed in a background task on the
+pipeline event loop, so a turn never waits for it; a turn that finds the
+summary lagging behind simply sends fewer old messages.
+"""
+
+import asyncio
+import os
+
+from langchain_core.messages import SystemMessage
+
+from chunking import estimate_tokens
+from logger import setup_logger
+from redis_store import asave_summary
+
+logger = setup_logger()
+
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1500"))
+HISTORY_RECENT_TURNS = int(os.getenv("HISTORY_RECENT_TURNS", "6"))
+
+_refreshing = {}  # session id -> summary refresh task in flight
+
+
+def message_tokens(message):
+    """Approximate the tokens of a chat message."""
+    return estimate_tokens(message.content) + 4
+
+
+def select_history(
+    messages,
+    state,
+    budget=HISTORY_TOKEN_BUDGET,
+    recent_turns=HISTORY_RECENT_TURNS,
+):
+    """
+    Choose what part of a conversation goes into the prompt.
+
+    The summary comes first, then the newest messages not covered by it,
+    up to `recent_turns` turns and the remaining token budget.
+
+    Args:
+        messages (list): The session's messages not trimmed into the
+            summary, oldest first.
+        state (dict): The session's rolling summary (`summary`, `covered`).
+        budget (int): Token budget for summary plus verbatim messages.
+        recent_turns (int): Maximum user/assistant turns sent verbatim.
+
+    Returns:
+        tuple: The messages to send, and the index up to which the summary
+        should be extended (None if it is up to date).
+    """
+    prompt_messages = []
+    used = 0
+    covered = min(state.get("covered", 0), len(messages))
+    if state.get("summary"):
+        summary = SystemMessage(
+            content=f"Summary of the earlier conversation:\n{state['summary']}"
+        )
+        prompt_messages.append(summary)
+        used += message_tokens(summary)
+
+    window = []
+    for message in reversed(messages[covered:]):
+        tokens = message_tokens(message)
+        if len(window) >= 2 * recent_turns or (window and used + tokens > budget):
+            break
+        window.insert(0, message)
+        used += tokens
+
+    first_verbatim = len(messages) - len(window)
+    refresh_upto = first_verbatim if first_verbatim > covered else None
+    return prompt_messages + window, refresh_upto
+
+
+def _transcript(messages):
+    return "\n".join(f"{message.type}: {message.content}" for message in messages)
+
+
+async def _refresh_summary(session_id, messages, state, upto, summarize):
+    try:
+        new_messages = messages[state.get("covered", 0) : upto]
+        summary = await summarize(state.get("summary", ""), _transcript(new_messages))
+        if await asave_summary(session_id, state, summary, upto):
+            logger.info("Summarized %s messages of session %s", upto, session_id)
+        else:
+            logger.info("Summary of session %s changed meanwhile", session_id)
+    except Exception as e:
+        logger.error("Summary refresh for session %s failed: %s", session_id, e)
+    finally:
+        _refreshing.pop(session_id, None)
+
+
+def schedule_summary_refresh(session_id, messages, state, upto, summarize):
+    """
+    Extend a session's summary up to `upto` in a background task.
+
+    At most one refresh per session runs at a time; if one is in flight the
+    request is dropped and the next turn asks again.
+
+    Args:
+        session_id (str): Unique session identifier.
+        messages (list): The session's messages, as loaded with `state`.
+        state (dict): The session's current rolling summary.
+        upto (int): Number of leading messages the new summary must cover;
+            they are then trimmed from the session's Redis list.
+        summarize (callable): Coroutine `(previous_summary, transcript) -> str`.
+    """
+    if session_id in _refreshing:
+        return
+    _refreshing[session_id] = asyncio.get_running_loop().create_task(
+        _refresh_summary(session_id, list(messages), state, upto, summarize)
+    )
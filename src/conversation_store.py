@@ -0,0 +1,249 @@
+"""
+# conversation_store.py
+Single write path for chat conversations.
+
+`arecord_turn` stores a complete turn (user message, assistant reply,
+timestamps and latency) once:
+- Redis, the hot cache the chat pipeline reads its history from, gets the
+  turn immediately in one pipelined append.
+- SQLite, the durable log behind the dashboard, gets it write-behind: turns
+  wait in an in-memory buffer that a background thread group-commits in one
+  transaction every `CONVERSATION_FLUSH_INTERVAL` seconds, or as soon as
+  `CONVERSATION_FLUSH_BATCH` turns are waiting.
+
+Turns are committed in the order they were recorded, with both messages of
+a turn in the same transaction, so the log never holds half a turn or a
+turn ahead of an earlier one. The same transaction updates the bot's
+analytics rollups (see bot_stats.py). A failed commit leaves the batch at the head
+of the buffer for the next attempt and the buffer is flushed at exit, so a
+crash loses at most the last flush interval. A session whose Redis history
+is missing (expired, evicted, Redis restarted) is rebuilt from SQLite by
+`aload_session`.
+"""
+
+import asyncio
+import atexit
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+from bot_stats import record_turns
+from database import connection
+from logger import setup_logger
+
+logger = setup_logger()
+
+CONVERSATION_FLUSH_INTERVAL = float(os.getenv("CONVERSATION_FLUSH_INTERVAL", "0.5"))
+CONVERSATION_FLUSH_BATCH = int(os.getenv("CONVERSATION_FLUSH_BATCH", "64"))
+
+INSERT_MESSAGE = """INSERT INTO chat_history
+                    (bot_id, session_id, role, content, timestamp,
+                     response_time, first_token_time)
+                    VALUES (?,?,?,?,?,?,?)"""
+
+_pending = []  # recorded turns not yet committed, oldest first
+_pending_lock = threading.Lock()
+_flush_lock = threading.Lock()  # one commit at a time
+_wakeup = threading.Event()
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def _rows(turn):
+    """The two chat_history rows of a turn."""
+    return [
+        (
+            turn["bot_id"],
+            turn["session_id"],
+            "user",
+            turn["user_message"],
+            turn["started_at"],
+            None,
+            None,
+        ),
+        (
+            turn["bot_id"],
+            turn["session_id"],
+            "assistant",
+            turn["assistant_message"],
+            turn["finished_at"],
+            turn["response_time"],
+            turn["first_token_time"],
+        ),
+    ]
+
+
+def flush():
+    """
+    Commit every buffered turn to SQLite now.
+
+    Returns:
+        int: Number of turns committed.
+
+    Raises:
+        sqlite3.Error: If the commit fails; the turns stay buffered.
+    """
+    with _flush_lock:
+        with _pending_lock:
+            batch = list(_pending)
+        if not batch:
+            return 0
+
+        try:
+            with connection() as conn:
+                record_turns(conn, batch)
+                conn.executemany(
+                    INSERT_MESSAGE, [row for t in batch for row in _rows(t)]
+                )
+        except sqlite3.IntegrityError:
+            # A turn of a bot deleted meanwhile; commit the others one by one
+            for turn in batch:
+                try:
+                    with connection() as conn:
+                        record_turns(conn, [turn])
+                        conn.executemany(INSERT_MESSAGE, _rows(turn))
+                except sqlite3.IntegrityError as e:
+                    logger.warning(
+                        "Dropped chat turn of bot %s: %s", turn["bot_id"], str(e)
+                    )
+
+        with _pending_lock:
+            del _pending[: len(batch)]
+        logger.debug("Committed %s chat turns", len(batch))
+        return len(batch)
+
+
+def _writer_loop():
+    while True:
+        _wakeup.wait(CONVERSATION_FLUSH_INTERVAL)
+        _wakeup.clear()
+        try:
+            flush()
+        except Exception as e:
+            logger.error("Failed to commit chat turns (will retry): %s", str(e))
+
+
+def _flush_at_exit():
+    try:
+        flush()
+    except Exception as e:
+        logger.error("Lost %s chat turns at exit: %s", len(_pending), str(e))
+
+
+def _ensure_writer():
+    """Start the background writer once per process."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = threading.Thread(
+                target=_writer_loop, name="conversation-writer", daemon=True
+            )
+            _writer.start()
+            atexit.register(_flush_at_exit)
+
+
+async def arecord_turn(
+    bot_id,
+    session_id,
+    user_message,
+    assistant_message,
+    started_at,
+    response_time,
+    first_token_time=None,
+):
+    """
+    Record a chat turn in SQLite (write-behind) and Redis.
+
+    Args:
+        bot_id (int): Chatbot's ID.
+        session_id (str): Unique session identifier.
+        user_message (str): The user's message.
+        assistant_message (str): The assistant's reply.
+        started_at (datetime): When the user's message was received.
+        response_time (float): Seconds until the reply was complete.
+        first_token_time (float, optional): Seconds until the first token
+            was streamed.
+    """
+    turn = {
+        "bot_id": bot_id,
+        "session_id": session_id,
+        "user_message": user_message,
+        "assistant_message": assistant_message,
+        "started_at": started_at,
+        "finished_at": datetime.now(),
+        "response_time": response_time,
+        "first_token_time": first_token_time,
+    }
+    _ensure_writer()
+    with _pending_lock:
+        _pending.append(turn)
+        waiting = len(_pending)
+    if waiting >= CONVERSATION_FLUSH_BATCH:
+        _wakeup.set()
+
+    # Imported here so modules that only flush (auth, chatbot, chat_history)
+    # do not load the Redis/LangChain stack at startup
+    import redis_store
+    from langchain_core.messages import AIMessage, HumanMessage
+
+    await redis_store.aappend_messages(
+        session_id,
+        [HumanMessage(content=user_message), AIMessage(content=assistant_message)],
+    )
+
+
+def _stored_messages(session_id):
+    """Read a session's messages from SQLite plus its still-buffered turns."""
+    from langchain_core.messages import AIMessage, HumanMessage
+
+    with _flush_lock:
+        with connection() as conn:
+            rows = conn.execute(
+                """SELECT role, content
+                        FROM chat_history
+                        WHERE session_id=?
+                        ORDER BY id""",
+                (session_id,),
+            ).fetchall()
+        with _pending_lock:
+            for turn in _pending:
+                if turn["session_id"] == session_id:
+                    rows.append(("user", turn["user_message"]))
+                    rows.append(("assistant", turn["assistant_message"]))
+
+    return [
+        HumanMessage(content=content) if role == "user" else AIMessage(content=content)
+        for role, content in rows
+    ]
+
+
+async def aload_session(session_id):
+    """
+    Read a session's history and rolling summary from Redis.
+
+    A missing Redis history is rebuilt from SQLite (and the turns still
+    buffered for it) and written back, and summarized again from scratch.
+
+    Args:
+        session_id (str): Unique session identifier.
+
+    Returns:
+        tuple: The messages (oldest first) and the summary state.
+    """
+    import redis_store
+
+    messages, summary = await redis_store.aload_session(session_id)
+    if not messages:
+        messages = await asyncio.to_thread(_stored_messages, session_id)
+        # The rebuilt list starts at the first message again, which a
+        # leftover summary would cover twice
+        summary = dict(redis_store.EMPTY_SUMMARY)
+        if messages:
+            logger.info(
+                "Rebuilt Redis history of %s from SQLite (%s messages)",
+                session_id,
+                len(messages),
+            )
+            await redis_store.areset_session(session_id, messages)
+    return messages, summary
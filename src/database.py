@@ -4,10 +4,16 @@ Database module for managing user authentication, chatbots, and chat history.
 
 This module initializes an SQLite database and provides utility functions 
 for connecting, validating emails, and setting up necessary tables.
+
+The schema is built by numbered migrations recorded in `schema_version`;
+schema changes are made by appending to `MIGRATIONS`.
 """
 
 import sqlite3
 import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime
 import regex as re
 from logger import setup_logger
 
@@ -15,6 +21,8 @@ from logger import setup_logger
 logger = setup_logger()
 
 DB_PATH = "ChatBridge.db"  # adjust the path as needed
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "16384"))
 EMAIL_REGEX = re.compile(r"^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+$")
 
 
@@ -24,26 +32,76 @@ def validate_email(email: str) -> bool:
 
 
 def get_connection():
-    """Establish a connection to the SQLite database with foreign key support."""
-    logger.info("Connecting to the %s", DB_PATH)
-    return sqlite3.connect(DB_PATH)
+    """
+    Open a new connection to the SQLite database.
 
+    The database runs in WAL mode, so readers do not block the writer and
+    concurrent sessions only contend for writes, which wait up to
+    `SQLITE_BUSY_TIMEOUT_MS` instead of failing. Foreign keys are enforced.
 
-def init_db():
-    """Initialize the SQLite database with required tables."""
-    logger.info("Initializing %s", DB_PATH)
-    conn = get_connection()
-    c = conn.cursor()
-    # Create users table
-    c.execute(
+    Most code should use `connection()`, which reuses one connection per
+    thread.
+    """
+    conn = sqlite3.connect(DB_PATH, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA foreign_keys=ON")
+    conn.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+    return conn
+
+
+_local = threading.local()
+
+
+@contextmanager
+def connection():
+    """
+    Run a block as one transaction on the calling thread's connection.
+
+    The connection is opened on first use and kept for the life of the
+    thread. The outermost block commits on success and rolls back on error;
+    nested blocks join the enclosing transaction.
+
+    Yields:
+        sqlite3.Connection: The thread's connection.
+    """
+    if getattr(_local, "conn", None) is None:
+        _local.conn = get_connection()
+        _local.depth = 0
+    conn = _local.conn
+    _local.depth += 1
+    try:
+        yield conn
+        if _local.depth == 1:
+            conn.commit()
+    except BaseException:
+        if _local.depth == 1:
+            conn.rollback()
+        raise
+    finally:
+        _local.depth -= 1
+
+
+def _add_missing_columns(cursor, table, columns):
+    """Add columns (name -> SQL type) that an existing table does not have yet."""
+    cursor.execute(f"PRAGMA table_info({table})")
+    existing = {row[1] for row in cursor.fetchall()}
+    for name, sql_type in columns.items():
+        if name not in existing:
+            logger.info("Adding column %s.%s", table, name)
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {sql_type}")
+
+
+def _create_base_schema(cursor):
+    """Tables and indexes of the original schema."""
+    cursor.execute(
         """CREATE TABLE IF NOT EXISTS users
                  (username TEXT PRIMARY KEY,
                   email TEXT UNIQUE NOT NULL,
                   password TEXT)"""
     )
-
-    # Create chatbots table
-    c.execute(
+    cursor.execute(
         """CREATE TABLE IF NOT EXISTS chatbots (
                      id INTEGER PRIMARY KEY AUTOINCREMENT,
                      bot_id TEXT UNIQUE DEFAULT (LOWER(HEX(RANDOMBLOB(16)))),
@@ -58,9 +116,7 @@ def init_db():
                      FOREIGN KEY(username) REFERENCES users(username)
                  )"""
     )
-
-    # Create chat_history table
-    c.execute(
+    cursor.execute(
         """CREATE TABLE IF NOT EXISTS chat_history (
                      id INTEGER PRIMARY KEY AUTOINCREMENT,
                      bot_id INTEGER,
@@ -71,12 +127,273 @@ def init_db():
                      FOREIGN KEY(bot_id) REFERENCES chatbots(id)
                  )"""
     )
+    # Background document processing queue
+    cursor.execute(
+        """CREATE TABLE IF NOT EXISTS ingestion_jobs (
+                     id INTEGER PRIMARY KEY AUTOINCREMENT,
+                     bot_id INTEGER,
+                     username TEXT,
+                     directory_path TEXT,
+                     state TEXT DEFAULT 'queued',
+                     attempts INTEGER DEFAULT 0,
+                     progress REAL DEFAULT 0,
+                     message TEXT,
+                     error TEXT,
+                     created_at DATETIME,
+                     updated_at DATETIME,
+                     started_at DATETIME,
+                     finished_at DATETIME,
+                     FOREIGN KEY(bot_id) REFERENCES chatbots(id)
+                 )"""
+    )
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_email ON users(email)")
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_ingestion_jobs_state ON ingestion_jobs(state)"
+    )
+
+
+def _add_bot_settings(cursor):
+    """Per-bot chunking and context settings."""
+    _add_missing_columns(
+        cursor,
+        "chatbots",
+        {
+            "chunking_strategy": "TEXT",
+            "chunk_size": "INTEGER",
+            "chunk_overlap": "INTEGER",
+            "context_token_budget": "INTEGER",
+        },
+    )
+
+
+def _add_turn_metadata(cursor):
+    """Turn metadata recorded by the conversation store."""
+    _add_missing_columns(
+        cursor,
+        "chat_history",
+        {
+            "session_id": "TEXT",
+            "response_time": "REAL",
+            "first_token_time": "REAL",
+        },
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_chat_history_session "
+        "ON chat_history(session_id)"
+    )
+
+
+def _add_hot_path_indexes(cursor):
+    """Indexes for the per-bot and per-user lookups and deletes."""
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_chat_history_bot_time "
+        "ON chat_history(bot_id, timestamp)"
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_chatbots_username ON chatbots(username)"
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_ingestion_jobs_bot ON ingestion_jobs(bot_id)"
+    )
+
+
+def _add_bot_stats(cursor):
+    """Per-bot analytics rollups maintained by bot_stats.py, backfilled."""
+    cursor.execute(
+        """CREATE TABLE IF NOT EXISTS bot_stats (
+                     bot_id INTEGER PRIMARY KEY,
+                     messages INTEGER DEFAULT 0,
+                     turns INTEGER DEFAULT 0,
+                     conversations INTEGER DEFAULT 0,
+                     response_time_sum REAL DEFAULT 0,
+                     response_time_count INTEGER DEFAULT 0,
+                     updated_at DATETIME,
+                     FOREIGN KEY(bot_id) REFERENCES chatbots(id)
+                 )"""
+    )
+    cursor.execute(
+        """CREATE TABLE IF NOT EXISTS bot_latency_histogram (
+                     bot_id INTEGER,
+                     bucket INTEGER,
+                     turns INTEGER DEFAULT 0,
+                     PRIMARY KEY (bot_id, bucket),
+                     FOREIGN KEY(bot_id) REFERENCES chatbots(id)
+                 )"""
+    )
+    cursor.execute(
+        """CREATE TABLE IF NOT EXISTS bot_daily_stats (
+                     bot_id INTEGER,
+                     day TEXT,
+                     messages INTEGER DEFAULT 0,
+                     turns INTEGER DEFAULT 0,
+                     conversations INTEGER DEFAULT 0,
+                     response_time_sum REAL DEFAULT 0,
+                     response_time_count INTEGER DEFAULT 0,
+                     PRIMARY KEY (bot_id, day),
+                     FOREIGN KEY(bot_id) REFERENCES chatbots(id)
+                 )"""
+    )
+    # Roll up the history stored so far. Imported here because bot_stats
+    # depends on this module.
+    from bot_stats import rebuild_bot_stats
+
+    cursor.execute("SELECT id FROM chatbots")
+    for (bot_id,) in cursor.fetchall():
+        rebuild_bot_stats(cursor.connection, bot_id)
+
+
+# (version, description, function applied to a cursor). Append only: a
+# released migration must never change. Databases created before versioning
+# start at 0, so every step has to tolerate objects that already exist.
+MIGRATIONS = [
+    (1, "base schema", _create_base_schema),
+    (2, "per-bot chunking and context settings", _add_bot_settings),
+    (3, "conversation store turn metadata", _add_turn_metadata),
+    (4, "hot-path indexes", _add_hot_path_indexes),
+    (5, "per-bot analytics rollups", _add_bot_stats),
+]
 
-    # Add index for faster email lookups
-    c.execute("CREATE INDEX IF NOT EXISTS idx_email ON users(email)")
+# Representative shapes of the hot queries; none may need a full table scan
+# or a temporary sort
+HOT_QUERIES = [
+    "SELECT * FROM users WHERE (username=? OR email=?) AND password=?",
+    "SELECT username FROM users WHERE email = ?",
+    "SELECT * FROM chatbots WHERE username=?",
+    "SELECT id FROM chatbots WHERE username=?",
+    "SELECT context_token_budget FROM chatbots WHERE id=?",
+    "SELECT id, role, content FROM chat_history "
+    "WHERE bot_id=? ORDER BY timestamp DESC, id DESC LIMIT ?",
+    "SELECT id, role, content FROM chat_history "
+    "WHERE bot_id=? AND (timestamp, id) < (?, ?) "
+    "ORDER BY timestamp DESC, id DESC LIMIT ?",
+    "SELECT role, content FROM chat_history WHERE session_id=? ORDER BY id",
+    "SELECT 1 FROM chat_history WHERE session_id=? LIMIT 1",
+    "SELECT messages, turns FROM bot_stats WHERE bot_id=?",
+    "SELECT bucket, turns FROM bot_latency_histogram WHERE bot_id=?",
+    "SELECT day, turns FROM bot_daily_stats WHERE bot_id=? AND day>=? ORDER BY day",
+    "DELETE FROM chat_history WHERE bot_id=?",
+    "DELETE FROM chat_history "
+    "WHERE bot_id IN (SELECT id FROM chatbots WHERE username=?)",
+    "DELETE FROM ingestion_jobs WHERE bot_id=?",
+    "SELECT id, state FROM ingestion_jobs WHERE bot_id=? ORDER BY id DESC LIMIT 1",
+    "SELECT id, bot_id FROM ingestion_jobs WHERE state=? ORDER BY id LIMIT 1",
+]
 
+
+def schema_version(conn):
+    """Return the highest migration applied to a database (0 if none)."""
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS schema_version (
+                     version INTEGER PRIMARY KEY,
+                     description TEXT,
+                     applied_at DATETIME
+                 )"""
+    )
     conn.commit()
-    conn.close()
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+
+def migrate(conn, migrations=MIGRATIONS):
+    """
+    Apply pending migrations in order, each in its own transaction.
+
+    The write lock is taken before the version is re-read, so concurrent
+    processes apply each migration exactly once.
+
+    Args:
+        conn (sqlite3.Connection): Connection to the database.
+        migrations (list): (version, description, function) tuples.
+
+    Returns:
+        int: The schema version after migrating.
+    """
+    current = schema_version(conn)
+    for version, description, apply in migrations:
+        if version <= current:
+            continue
+        c = conn.cursor()
+        try:
+            c.execute("BEGIN IMMEDIATE")
+            c.execute("SELECT MAX(version) FROM schema_version")
+            if (c.fetchone()[0] or 0) >= version:
+                conn.rollback()
+                continue
+            logger.info("Applying migration %s: %s", version, description)
+            apply(c)
+            c.execute(
+                "INSERT INTO schema_version VALUES (?,?,?)",
+                (version, description, datetime.now()),
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        current = version
+    return current
+
+
+def explain_query_plan(conn, sql):
+    """
+    Return the EXPLAIN QUERY PLAN details of a query (parameters bound to NULL).
+
+    Args:
+        conn (sqlite3.Connection): Connection to the database.
+        sql (str): The query, with `?` placeholders.
+
+    Returns:
+        list: One detail string per plan step, e.g. "SEARCH chatbots USING
+        INDEX idx_chatbots_username (username=?)".
+    """
+    params = (None,) * sql.count("?")
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+
+def find_slow_queries(conn, queries=HOT_QUERIES):
+    """
+    Check that queries are served by indexes.
+
+    Args:
+        conn (sqlite3.Connection): Connection to the database.
+        queries (list): Queries to check.
+
+    Returns:
+        dict: query -> plan, for every query whose plan has a full table
+        scan or a temporary B-tree (an unindexed sort).
+    """
+    slow = {}
+    for sql in queries:
+        plan = explain_query_plan(conn, sql)
+        if any(step.startswith("SCAN") or "TEMP B-TREE" in step for step in plan):
+            slow[sql] = plan
+    return slow
+
+
+_initialized = False
+_init_lock = threading.Lock()
+
+
+def init_db():
+    """
+    Bring the SQLite database up to the current schema.
+
+    Runs the migrations and the query plan check once per process; later
+    calls (e.g. on every Streamlit rerun) return immediately.
+    """
+    global _initialized
+    with _init_lock:
+        if _initialized:
+            return
+        logger.info("Initializing %s", DB_PATH)
+        conn = get_connection()
+        try:
+            version = migrate(conn)
+            logger.info("%s is at schema version %s", DB_PATH, version)
+            for sql, plan in find_slow_queries(conn).items():
+                logger.warning("Query is not index-backed: %s -> %s", sql, plan)
+        finally:
+            conn.close()
+        _initialized = True
 
 
 def init_file_storage():
@@ -1,17 +1,35 @@
 """
 # document_processor.py
-This module processes documents, generates embeddings using Google Generative AI,
-and stores them in a Chroma vector database. It also integrates email notifications.
+This module processes documents, generates embeddings with the configured
+embedding provider (Google Generative AI by default), and stores them in a
+Chroma vector database. It also integrates email notifications.
 """
 
+import multiprocessing
 import os
-from uuid import uuid4
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from langchain_chroma import Chroma
-from langchain.schema import Document
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from langchain_unstructured import UnstructuredLoader
 from dotenv import load_dotenv
 from logger import setup_logger
+from chunking import chunk_elements, loader_kwargs, normalize_chunking
+from embedding_client import BatchedEmbeddingClient, EmbeddingError, shared_limiter
+from embedding_cache import get_embedding_cache
+from embedding_providers import get_embedding_provider
+from lexical_index import build_bot_index
+from vector_stores import (
+    BOT_COLLECTION,
+    open_vector_store,
+    persist_directory_for,
+    persist_lock,
+    vector_store_pool,
+)
+from ingest_manifest import (
+    chunk_id,
+    file_fingerprint,
+    load_manifest,
+    save_manifest,
+)
 from autogenerated_email import (
     send_email_bot_completion,
     get_email_for_username,
@@ -26,40 +44,64 @@ logger = setup_logger()
 # Load environment variables
 load_dotenv()
 
-# Load your API key for Google Generative AI Embeddings
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+# Concurrency limit for parsing and embedding files of one bot
+INGEST_MAX_WORKERS = int(os.getenv("INGEST_MAX_WORKERS", "4"))
+# Chunks embedded and upserted together; bounds peak memory per file
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "64"))
+# Files at least this large are streamed instead of parsed on the process pool
+INGEST_STREAMING_MIN_MB = float(os.getenv("INGEST_STREAMING_MIN_MB", "10"))
+
+EMBEDDING_TASK_TYPE = "retrieval_document"
 
-# Initialize the Google Embeddings model
-embeddings = GoogleGenerativeAIEmbeddings(
-    model="models/embedding-001",  # Specify the embedding model
-    google_api_key=GEMINI_API_KEY,
-    task_type="retrieval_document",  # Adjust if necessary for your use case
+# The configured embedding provider (see embedding_providers.py)
+embeddings = get_embedding_provider()
+EMBEDDING_MODEL = embeddings.provider_id
+
+# Batched access to the embeddings model; remote providers are rate-limited
+# by a limiter shared by every ingestion running in this process
+embedding_client = BatchedEmbeddingClient(
+    embeddings.embed_documents, limiter=shared_limiter if embeddings.remote else None
 )
 
+# Function to stream the chunks of a document
+def iter_document_chunks(file_path, chunking=None):
+    """
+    Yields the chunks of a document as they are produced.
+
+    Args:
+        file_path (str): Path to the document.
+        chunking (dict, optional): Chunking settings (`strategy`,
+            `chunk_size`, `chunk_overlap`); see `chunking.normalize_chunking`.
+
+    Yields:
+        Document: LangChain Document objects, one per chunk.
+    """
+    settings = normalize_chunking(chunking)
+    # Initialize the UnstructuredLoader with lazy loading
+    loader = UnstructuredLoader(file_path, **loader_kwargs(settings))
+    if settings["strategy"] == "token":
+        yield from chunk_elements(
+            loader.lazy_load(), settings["chunk_size"], settings["chunk_overlap"]
+        )
+    else:
+        yield from loader.lazy_load()
+
+
 # Function to load the document and chunk it
-def load_document(file_path, chunk_size=10000):
+def load_document(file_path, chunking=None):
     """
-    Loads and chunks a document using UnstructuredLoader.
+    Loads and chunks a whole document.
 
     Args:
         file_path (str): Path to the document.
-        chunk_size (int): Maximum character size per chunk.
+        chunking (dict, optional): Chunking settings; see
+            `iter_document_chunks`.
 
     Returns:
         list: List of LangChain Document objects.
     """
     try:
-        # Initialize the UnstructuredLoader with lazy loading
-        loader = UnstructuredLoader(
-            file_path,
-            chunking_strategy="basic",  # You can adjust chunking strategy here
-            max_characters=chunk_size,
-            include_orig_elements=False,
-        )
-        # Lazy load the document and append pages to the pages list
-        pages = []
-        for doc in loader.lazy_load():  # Use lazy_load to process document pages
-            pages.append(doc)
+        pages = list(iter_document_chunks(file_path, chunking))
         # Print the number of pages and the length of text in the first page
         print(f"File: {file_path}")
         print("Number of LangChain pages:", len(pages))
@@ -69,27 +111,77 @@ def load_document(file_path, chunk_size=10000):
         print(f"Error loading document {file_path}: {e}")
         return None
 
+
+def _batched(iterable, batch_size):
+    """Yields lists of at most `batch_size` items from an iterable."""
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
 # Function to generate embeddings using Google Embeddings
 def generate_embeddings(pages):
     """
     Generates embeddings for a list of documents.
 
+    Chunks already present in the shared embedding cache are not sent to
+    the API; newly embedded chunks are added to the cache.
+
     Args:
         pages (list): List of LangChain Document objects.
 
     Returns:
         list: List of embedding vectors.
     """
+    cache = get_embedding_cache()
+    missing_texts = []
     try:
         # Extract text content for embedding generation
         page_texts = [
             page.page_content for page in pages
         ]  # Use pages directly since chunking is already done
-        # Generate embeddings for each page using Google Embeddings
-        embeddings_list = embeddings.embed_documents(page_texts)
+        cached = cache.get_many(EMBEDDING_MODEL, EMBEDDING_TASK_TYPE, page_texts)
+        # Embed each distinct uncached text once
+        missing_texts = list(
+            dict.fromkeys(
+                text for i, text in enumerate(page_texts) if i not in cached
+            )
+        )
+        if missing_texts:
+            # Generate embeddings in rate-limited batches; failed batches are retried
+            new_vectors = embedding_client.embed_documents(missing_texts)
+            cache.put_many(
+                EMBEDDING_MODEL, EMBEDDING_TASK_TYPE, missing_texts, new_vectors
+            )
+            new_by_text = dict(zip(missing_texts, new_vectors))
+            for i, text in enumerate(page_texts):
+                if i not in cached:
+                    cached[i] = new_by_text[text]
+        embeddings_list = [cached[i] for i in range(len(page_texts))]
         # Print embeddings shape (for debugging)
-        print(f"Embeddings shape: {len(embeddings_list)} embeddings generated")
+        print(
+            f"Embeddings shape: {len(embeddings_list)} embeddings generated "
+            f"({len(missing_texts)} from the API)"
+        )
         return embeddings_list
+    except EmbeddingError as e:
+        # Keep what was embedded so a retry only pays for the rest
+        if e.partial:
+            cache.put_many(
+                EMBEDDING_MODEL,
+                EMBEDDING_TASK_TYPE,
+                [missing_texts[i] for i in e.partial],
+                list(e.partial.values()),
+            )
+        print(
+            f"Error generating embeddings ({len(e.partial)}/{len(missing_texts)} done): {e}"
+        )
+        return None
     except Exception as e:
         print(f"Error generating embeddings: {e}")
         return None
@@ -97,72 +189,233 @@ def generate_embeddings(pages):
 
 # Function to store embeddings in Chroma vector store
 def store_embeddings_in_chroma(
-    pages, embeddings_list, collection_name, persist_directory
+    pages, embeddings_list, collection_name, persist_directory, ids, metadatas=None
 ):
     """
-    Stores embeddings into a Chroma vector database.
+    Upserts embeddings into a Chroma vector database.
 
     Args:
         pages (list): List of langchain.schema.Document objects.
         embeddings_list (list): Generated embeddings.
         collection_name (str): Name of the Chroma collection.
         persist_directory (str): Directory to store the Chroma database.
+        ids (list): Deterministic chunk ids, one per page.
+        metadatas (list, optional): Chunk metadata, one dict per page.
+
+    Returns:
+        bool: True if the embeddings were stored.
     """
     try:
         # Initialize Chroma vector store
-        vector_store = Chroma(
-            collection_name=collection_name,
-            embedding_function=embeddings,  # Pass the embedding function to Chroma
-            persist_directory=persist_directory,  # Where to save data locally
+        vector_store = open_vector_store(
+            persist_directory, embeddings, collection_name=collection_name
         )
-        # Generate unique IDs for the documents
-        uuids = [str(uuid4()) for _ in range(len(pages))]
-        # Prepare the documents as langchain Document objects
-        documents = [Document(page_content=page.page_content) for page in pages]
-        # Add each embedding to the Chroma collection using add_documents method
-        vector_store.add_documents(
-            documents=documents, embeddings=embeddings_list, ids=uuids
+        # Write the precomputed vectors directly; `add_documents` would
+        # re-embed every chunk through the embedding function
+        vector_store._collection.upsert(
+            ids=ids,
+            embeddings=embeddings_list,
+            documents=[page.page_content for page in pages],
+            metadatas=metadatas,
         )
         print(f"Embeddings have been stored in Chroma collection: {collection_name}.")
+        vector_store_pool.invalidate(persist_directory)
+        return True
     except Exception as e:
         print(f"Error storing embeddings in Chroma: {e}")
+        return False
+
+
+def delete_chunks_from_chroma(collection_name, persist_directory, ids):
+    """
+    Removes chunks from a Chroma collection.
+
+    Args:
+        collection_name (str): Name of the Chroma collection.
+        persist_directory (str): Directory of the Chroma database.
+        ids (list): Chunk ids to delete.
+    """
+    if not ids:
+        return
+    try:
+        vector_store = open_vector_store(
+            persist_directory, embeddings, collection_name=collection_name
+        )
+        vector_store.delete(ids=list(ids))
+        vector_store_pool.invalidate(persist_directory)
+        logger.info("Removed %s stale chunks from %s", len(ids), collection_name)
+    except Exception as e:
+        logger.error("Error removing chunks from %s: %s", collection_name, e)
+
+
+def _embed_and_store(
+    file_name, pages, persist_directory, fingerprint, previous, batch_size
+):
+    """
+    Embeds one file in fixed-size batches and upserts each batch into the
+    bot collection.
+
+    `pages` may be a list or a generator straight from the loader; only one
+    batch of chunks and vectors is held in memory at a time. Runs on the
+    embedding thread pool; every Chroma write is serialized per persist
+    directory. Chunks of the previous version of the file that are not part
+    of the new version are removed once the whole file is stored.
+
+    Args:
+        file_name (str): Name of the file inside the bot directory.
+        pages (iterable): Parsed chunks of the file.
+        persist_directory (str): The bot's Chroma persist directory.
+        fingerprint (dict): Current `size`, `mtime` and `sha256` of the file.
+        previous (dict): The file's previous manifest entry, if any.
+        batch_size (int): Chunks embedded and upserted per batch.
+
+    Returns:
+        dict: Per-file result with `status`, `chunks` and, on success, the
+        new manifest `entry`.
+    """
+    # All files of a bot share one collection; chunks carry file metadata
+    collection_name = BOT_COLLECTION
+    previous_ids = set()
+    if previous and previous["collection"] == collection_name:
+        previous_ids = set(previous["chunk_ids"])
+    ids = []
+    status = "ok"
+
+    try:
+        for batch in _batched(pages, batch_size):
+            batch_ids = [
+                chunk_id(file_name, fingerprint["sha256"], len(ids) + i)
+                for i in range(len(batch))
+            ]
+            metadatas = [
+                {
+                    "source": file_name,
+                    "page": page.metadata.get("page_number") or 0,
+                    "chunk_index": len(ids) + i,
+                }
+                for i, page in enumerate(batch)
+            ]
+            embeddings_list = generate_embeddings(batch)
+            if not embeddings_list:
+                status = "embed_failed"
+                break
+            with persist_lock(persist_directory):
+                stored = store_embeddings_in_chroma(
+                    batch,
+                    embeddings_list,
+                    collection_name,
+                    persist_directory,
+                    batch_ids,
+                    metadatas,
+                )
+            if not stored:
+                status = "store_failed"
+                break
+            ids.extend(batch_ids)
+    except Exception as e:
+        print(f"Error loading document {file_name}: {e}")
+        status = "load_failed"
+
+    if status == "ok" and not ids:
+        status = "load_failed"
+
+    with persist_lock(persist_directory):
+        if status != "ok":
+            # Roll back the batches of this run that the old version lacks
+            delete_chunks_from_chroma(
+                collection_name, persist_directory, set(ids) - previous_ids
+            )
+            return {"status": status, "chunks": len(ids)}
+        if previous:
+            # Only the chunks the new version no longer has (all of them if
+            # the file still lives in a legacy per-file collection)
+            stale = previous_ids - set(ids) if previous_ids else previous["chunk_ids"]
+            delete_chunks_from_chroma(
+                previous["collection"], persist_directory, stale
+            )
+    entry = {**fingerprint, "collection": collection_name, "chunk_ids": ids}
+    return {"status": "ok", "chunks": len(ids), "entry": entry}
+
+
+def _rebuild_lexical_index(persist_directory):
+    """Rebuilds the bot's BM25 index after its chunks changed."""
+    with persist_lock(persist_directory):
+        try:
+            build_bot_index(persist_directory)
+        except Exception as e:
+            logger.error("BM25 index build for %s failed: %s", persist_directory, e)
+
+
+def _notify_owner(directory_path):
+    """Sends the "bot is ready" email to the owner of a bot directory."""
+    path_components = directory_path.split("/")
+    username = path_components[1]
+    if username:
+        logger.info("username: %s", username)
+
+    extracted_mail = get_email_for_username(username)
+    if extracted_mail:
+        logger.info("extracted_mail: %s", extracted_mail)
+    try:
+        send_email_bot_completion(
+            sender_email, sender_password, extracted_mail, subject, body
+        )
+        logger.info("Email Sended")
+    except Exception as e:
+        logger.error("%s", e)
+
 
 # Main function to process all files in a directory
-def process_document(directory_path):
+def process_document(
+    directory_path,
+    progress_callback=None,
+    max_workers=None,
+    incremental=True,
+    streaming=None,
+    batch_size=None,
+    chunking=None,
+):
     """
     Processes all files in a given directory:
-    - Extracts text
-    - Generates embeddings
-    - Stores embeddings in Chroma DB
+    - Skips files whose content is unchanged since the last run
+    - Removes the chunks of files that were deleted
+    - Extracts text (on a process pool, CPU-bound)
+    - Generates embeddings (on a bounded thread pool, network-bound)
+    - Stores embeddings in Chroma DB (serialized per persist directory)
+    - Rebuilds the bot's BM25 index from the stored chunks
     - Sends an email notification
 
+    Parsing of the next files overlaps with embedding of the files that are
+    already parsed. Large files are streamed instead: their chunks flow from
+    the loader straight into fixed-size embed-and-upsert batches, so peak
+    memory is bounded by the batch size rather than the document size.
+
     Args:
         directory_path (str): Path to the directory containing documents.
-    """
-    # path_components = directory_path.split("/")
-    # if path_components:
-    #     logger.critical("path_components")
-
-    # username = path_components[1]
-    # if username:
-    #     logger.critical("username: %s", username)
-
-    # extracted_mail = get_email_for_username(username)
-    # if extracted_mail:
-    #     logger.critical("extracted_mail: %s", extracted_mail)
-    # # logger.error(f"{sender_email, sender_password}")
-    # try:
-    #     send_email_bot_completion(
-    #         sender_email, sender_password, extracted_mail, subject, body
-    #     )
-    #     logger.critical("Email Sended")
-    # except Exception as e:
-    #     logger.error("%s", e)
+        progress_callback (callable, optional): Called as
+            `progress_callback(done, total, file_name)` after each file.
+        max_workers (int, optional): Concurrency limit for both pools.
+            Defaults to `INGEST_MAX_WORKERS`.
+        incremental (bool): Skip files recorded as unchanged in the bot's
+            manifest. With False every file is re-ingested; deterministic
+            chunk ids still keep the upserts idempotent.
+        streaming (bool, optional): Stream every file (True), none (False),
+            or only files of at least `INGEST_STREAMING_MIN_MB` (None).
+        batch_size (int, optional): Chunks per embed-and-upsert batch.
+            Defaults to `INGEST_BATCH_SIZE`.
+        chunking (dict, optional): The bot's chunking settings. Files that
+            were ingested with different settings are re-chunked.
 
+    Returns:
+        list: Per-file report dictionaries with `file`, `status`
+        (`ok`, `unchanged`, `load_failed`, `embed_failed` or
+        `store_failed`), `chunks` and `seconds` elapsed until the file
+        finished.
+    """
     # List all files in the directory
     if not os.path.isdir(directory_path):
         print(f"The provided path is not a valid directory: {directory_path}")
-        return
+        return []
 
     files = [
         f
@@ -171,44 +424,144 @@ def process_document(directory_path):
     ]
     if not files:
         print(f"No files found in the directory: {directory_path}")
-        return
+        return []
+
+    persist_directory = persist_directory_for(directory_path)
+    chunking = normalize_chunking(chunking)
+    manifest = load_manifest(persist_directory)
+    started = time.perf_counter()
+    report = []
+
+    # Drop the chunks of files that no longer exist
+    removed = [name for name in manifest if name not in files]
+    for file_name in removed:
+        entry = manifest.pop(file_name)
+        delete_chunks_from_chroma(
+            entry["collection"], persist_directory, entry["chunk_ids"]
+        )
+
+    def record(file_name, result):
+        result = {
+            "file": file_name,
+            "seconds": round(time.perf_counter() - started, 2),
+            **result,
+        }
+        entry = result.pop("entry", None)
+        if entry:
+            with persist_lock(persist_directory):
+                manifest[file_name] = entry
+                save_manifest(persist_directory, manifest)
+        report.append(result)
+        logger.info("Ingested %s: %s", file_name, result)
+        if progress_callback:
+            progress_callback(len(report), len(files), file_name)
 
-    # Process each file in the directory
+    # Fingerprint every file; unchanged ones are not parsed or embedded again
+    fingerprints = {}
     for file_name in files:
-        file_path = os.path.join(directory_path, file_name)
-        print(f"\nProcessing file: {file_path}")
-        pages = load_document(file_path)
-        if pages:
-            embeddings_list = generate_embeddings(pages)
-            if embeddings_list:
-                # Create a unique collection name for each file
-                collection_name = f"{os.path.splitext(file_name)[0]}_collection"
-                logger.critical("Collection Name: %s", collection_name)
-                persist_directory = os.path.join(directory_path, "Chroma_db")
-                store_embeddings_in_chroma(
-                    pages, embeddings_list, collection_name, persist_directory
-                )
-                path_components = directory_path.split("/")
-                if path_components:
-                    logger.critical("path_components")
-
-                username = path_components[1]
-                if username:
-                    logger.critical("username: %s", username)
-
-                extracted_mail = get_email_for_username(username)
-                if extracted_mail:
-                    logger.critical("extracted_mail: %s", extracted_mail)
-                # logger.error(f"{sender_email, sender_password}")
-                try:
-                    send_email_bot_completion(
-                        sender_email, sender_password, extracted_mail, subject, body
-                    )
-                    logger.critical("Email Sended")
-                except Exception as e:
-                    logger.error("%s", e)
-
-            else:
-                print(f"Failed to generate embeddings for file: {file_name}")
+        previous = manifest.get(file_name)
+        fingerprint = file_fingerprint(
+            os.path.join(directory_path, file_name), previous
+        )
+        fingerprint["chunking"] = chunking
+        if (
+            incremental
+            and previous
+            and previous["sha256"] == fingerprint["sha256"]
+            and previous.get("chunking") == chunking
+        ):
+            if previous["mtime"] != fingerprint["mtime"]:
+                manifest[file_name] = {**previous, **fingerprint}
+            record(
+                file_name,
+                {"status": "unchanged", "chunks": len(previous["chunk_ids"])},
+            )
         else:
-            print(f"Failed to load the document: {file_name}")
+            fingerprints[file_name] = fingerprint
+    save_manifest(persist_directory, manifest)
+    if not fingerprints:
+        if removed:
+            _rebuild_lexical_index(persist_directory)
+        return report
+
+    max_workers = max(1, min(max_workers or INGEST_MAX_WORKERS, len(fingerprints)))
+    batch_size = batch_size or INGEST_BATCH_SIZE
+    if streaming is None:
+        # Stream only the large documents; small ones parse faster on the pool
+        streamed = {
+            f
+            for f, fingerprint in fingerprints.items()
+            if fingerprint["size"] >= INGEST_STREAMING_MIN_MB * 1024 * 1024
+        }
+    else:
+        streamed = set(fingerprints) if streaming else set()
+
+    def submit_embed(pool, file_name, pages):
+        future = pool.submit(
+            _embed_and_store,
+            file_name,
+            pages,
+            persist_directory,
+            fingerprints[file_name],
+            manifest.get(file_name),
+            batch_size,
+        )
+        embed_futures[future] = file_name
+
+    embed_futures = {}
+    with ThreadPoolExecutor(
+        max_workers=max_workers, thread_name_prefix="embed"
+    ) as embed_pool:
+        # Streamed files are parsed lazily inside the embedding thread, so
+        # chunks flow from the loader into embed-and-upsert batches
+        for file_name in streamed:
+            submit_embed(
+                embed_pool,
+                file_name,
+                iter_document_chunks(
+                    os.path.join(directory_path, file_name), chunking
+                ),
+            )
+
+        parsed = [f for f in fingerprints if f not in streamed]
+        if parsed:
+            # Spawn rather than fork: the caller is usually a multi-threaded
+            # Streamlit/worker process.
+            with ProcessPoolExecutor(
+                max_workers=min(max_workers, os.cpu_count() or 1),
+                mp_context=multiprocessing.get_context("spawn"),
+            ) as parse_pool:
+                parse_futures = {
+                    parse_pool.submit(
+                        load_document, os.path.join(directory_path, f), chunking
+                    ): f
+                    for f in parsed
+                }
+                for future in as_completed(parse_futures):
+                    file_name = parse_futures[future]
+                    try:
+                        pages = future.result()
+                    except Exception as e:
+                        logger.error("Parser crashed on %s: %s", file_name, e)
+                        pages = None
+                    if not pages:
+                        print(f"Failed to load the document: {file_name}")
+                        record(file_name, {"status": "load_failed", "chunks": 0})
+                        continue
+                    submit_embed(embed_pool, file_name, pages)
+
+        for future in as_completed(embed_futures):
+            file_name = embed_futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.error("Embedding %s failed: %s", file_name, e)
+                result = {"status": "embed_failed", "chunks": 0}
+            record(file_name, result)
+
+    if removed or any(result["status"] == "ok" for result in report):
+        _rebuild_lexical_index(persist_directory)
+    if any(result["status"] == "ok" for result in report):
+        _notify_owner(directory_path)
+
+    return report
@@ -0,0 +1,319 @@
+"""
+# embedding_cache.py
+Content-addressed on-disk embedding cache.
+
+Vectors are keyed by (embedding model, task type, sha256 of the chunk text),
+so the same document uploaded to several bots, or re-ingested unchanged,
+is only embedded once. Vectors are stored as float32 blobs in a small SQLite
+database and evicted least-recently-used once the cache exceeds its size bound.
+
+`query_embedding_cache` is a separate in-process LRU with a TTL for chat
+queries, so a repeated question skips the embedding round trip entirely.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+from logger import setup_logger
+
+logger = setup_logger()
+
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.db")
+EMBEDDING_CACHE_MAX_MB = int(os.getenv("EMBEDDING_CACHE_MAX_MB", "512"))
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "3600"))
+
+# SQLite limits the number of bound parameters per statement
+_LOOKUP_CHUNK = 500
+
+
+def text_hash(text):
+    """Return the sha256 hex digest used as the content address of a chunk."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Size-bounded LRU cache of embedding vectors backed by SQLite.
+
+    A single connection is shared by all threads and guarded by a lock;
+    every operation is a short statement, so contention stays low.
+
+    Args:
+        path (str): SQLite file holding the cache.
+        max_bytes (int): Total vector bytes kept before LRU eviction.
+    """
+
+    def __init__(
+        self,
+        path=EMBEDDING_CACHE_PATH,
+        max_bytes=EMBEDDING_CACHE_MAX_MB * 1024 * 1024,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS embedding_cache (
+                     model TEXT,
+                     task_type TEXT,
+                     text_hash TEXT,
+                     vector BLOB,
+                     last_access REAL,
+                     PRIMARY KEY (model, task_type, text_hash)
+                 )"""
+        )
+        self._conn.execute(
+            """CREATE INDEX IF NOT EXISTS idx_embedding_cache_access
+                 ON embedding_cache(last_access)"""
+        )
+        self._conn.commit()
+        self._bytes = self._conn.execute(
+            "SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embedding_cache"
+        ).fetchone()[0]
+
+    def get_many(self, model, task_type, texts):
+        """
+        Look up cached vectors.
+
+        Args:
+            model (str): Embedding model name.
+            task_type (str): Embedding task type.
+            texts (list): Chunk texts.
+
+        Returns:
+            dict: Vectors keyed by the index of their text in `texts`.
+        """
+        hashes = [text_hash(text) for text in texts]
+        found = {}
+        now = time.time()
+
+        with self._lock:
+            unique = list(dict.fromkeys(hashes))
+            for start in range(0, len(unique), _LOOKUP_CHUNK):
+                chunk = unique[start : start + _LOOKUP_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"""SELECT text_hash, vector FROM embedding_cache
+                        WHERE model=? AND task_type=? AND text_hash IN ({placeholders})""",
+                    (model, task_type, *chunk),
+                ).fetchall()
+                for digest, blob in rows:
+                    found[digest] = array("f", blob).tolist()
+                if rows:
+                    self._conn.execute(
+                        f"""UPDATE embedding_cache SET last_access=?
+                            WHERE model=? AND task_type=? AND text_hash IN ({placeholders})""",
+                        (now, model, task_type, *chunk),
+                    )
+            self._conn.commit()
+
+            results = {i: found[h] for i, h in enumerate(hashes) if h in found}
+            self.hits += len(results)
+            self.misses += len(texts) - len(results)
+        return results
+
+    def put_many(self, model, task_type, texts, vectors):
+        """
+        Store vectors for texts, then evict if the cache is over its bound.
+
+        Args:
+            model (str): Embedding model name.
+            task_type (str): Embedding task type.
+            texts (list): Chunk texts.
+            vectors (list): One vector per text.
+        """
+        now = time.time()
+        rows = {
+            text_hash(text): array("f", vector).tobytes()
+            for text, vector in zip(texts, vectors)
+        }
+
+        with self._lock:
+            for digest, blob in rows.items():
+                cursor = self._conn.execute(
+                    """INSERT OR IGNORE INTO embedding_cache
+                        (model, task_type, text_hash, vector, last_access)
+                        VALUES (?,?,?,?,?)""",
+                    (model, task_type, digest, blob, now),
+                )
+                if cursor.rowcount:
+                    self._bytes += len(blob)
+            self._conn.commit()
+            if self._bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Drop least-recently-used vectors until the cache is at 90% of its bound."""
+        target = int(self.max_bytes * 0.9)
+        evicted = 0
+        while self._bytes > target:
+            rows = self._conn.execute(
+                """SELECT rowid, LENGTH(vector) FROM embedding_cache
+                    ORDER BY last_access LIMIT 500"""
+            ).fetchall()
+            if not rows:
+                self._bytes = 0
+                break
+            dropped = []
+            for rowid, size in rows:
+                if self._bytes <= target:
+                    break
+                dropped.append(rowid)
+                self._bytes -= size
+            self._conn.executemany(
+                "DELETE FROM embedding_cache WHERE rowid=?",
+                [(rowid,) for rowid in dropped],
+            )
+            evicted += len(dropped)
+        self._conn.commit()
+        logger.info("Evicted %s vectors from the embedding cache", evicted)
+
+    def stats(self):
+        """
+        Return cache counters.
+
+        Returns:
+            dict: `hits`, `misses`, `hit_rate`, `entries` and `bytes`.
+        """
+        with self._lock:
+            entries = self._conn.execute(
+                "SELECT COUNT(*) FROM embedding_cache"
+            ).fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": entries,
+                "bytes": self._bytes,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache():
+    """Return the process-wide embedding cache, opening it on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = EmbeddingCache()
+        return _cache
+
+
+def normalize_query(text):
+    """Normalize a query for cache lookups (case and whitespace insensitive)."""
+    return " ".join(text.lower().split())
+
+
+class QueryEmbeddingCache:
+    """
+    Thread-safe in-process LRU cache of query vectors with a TTL.
+
+    Args:
+        max_entries (int): Entries kept before the least recently used is dropped.
+        ttl (float): Seconds an entry stays valid.
+    """
+
+    def __init__(self, max_entries=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # (model, text) -> (vector, expires_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get_or_compute(self, model, text, embed_fn):
+        """
+        Return the cached vector for a query, computing it on a miss.
+
+        Args:
+            model (str): Embedding model name.
+            text (str): The raw query.
+            embed_fn (callable): Maps a query string to its vector.
+
+        Returns:
+            list: The query vector.
+        """
+        key = (model, normalize_query(text))
+        vector = self._lookup(key)
+        if vector is None:
+            vector = embed_fn(text)
+            self._store(key, vector)
+        return vector
+
+    async def aget_or_compute(self, model, text, aembed_fn):
+        """
+        Async variant of `get_or_compute`.
+
+        Args:
+            model (str): Embedding model name.
+            text (str): The raw query.
+            aembed_fn (callable): Coroutine function mapping a query to its vector.
+
+        Returns:
+            list: The query vector.
+        """
+        key = (model, normalize_query(text))
+        vector = self._lookup(key)
+        if vector is None:
+            vector = await aembed_fn(text)
+            self._store(key, vector)
+        return vector
+
+    def _lookup(self, key):
+        """Return a live cached vector, counting the hit or miss."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[1] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry:
+                del self._entries[key]
+                self.expirations += 1
+            self.misses += 1
+        return None
+
+    def _store(self, key, vector):
+        """Insert a freshly computed vector and evict beyond the size bound."""
+        with self._lock:
+            self._entries[key] = (vector, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        """
+        Return cache counters.
+
+        Returns:
+            dict: `entries`, `hits`, `misses`, `hit_rate`, `evictions` and
+            `expirations`.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+query_embedding_cache = QueryEmbeddingCache()
@@ -0,0 +1,225 @@
+"""
+# embedding_client.py
+Rate-limit-aware batched embedding client.
+
+Wraps any `embed_documents`-style callable with:
+- adaptive batch sizing (halved on throttling, grown back after successes)
+- a token-bucket limiter shared by every ingestion running in the process
+- exponential backoff with jitter on 429/5xx errors
+- partial-progress retry, so only the batches that failed are re-sent
+
+The wrapped callable only needs to map a list of texts to a list of vectors,
+which keeps the client testable against a local fake embedding server that
+injects throttling.
+"""
+
+import os
+import random
+import re
+import threading
+import time
+
+from logger import setup_logger
+
+logger = setup_logger()
+
+EMBED_TEXTS_PER_MINUTE = int(os.getenv("EMBED_TEXTS_PER_MINUTE", "1500"))
+EMBED_MAX_BATCH_SIZE = int(os.getenv("EMBED_MAX_BATCH_SIZE", "100"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "6"))
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+# Fallbacks for errors that only carry a message; status codes match as whole
+# words so counts such as "15000 tokens" are not mistaken for a 500
+THROTTLE_PATTERN = re.compile(r"\b429\b|resource[_ ]exhausted|quota|rate limit")
+SERVER_ERROR_PATTERN = re.compile(r"\b50[0234]\b|unavailable|deadline|internal error")
+
+
+class EmbeddingError(Exception):
+    """Raised when a batch still fails after all retries.
+
+    Attributes:
+        partial (dict): Vectors that were embedded successfully, keyed by the
+            index of their text in the original request.
+    """
+
+    def __init__(self, message, partial=None):
+        super().__init__(message)
+        self.partial = partial or {}
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket.
+
+    Tokens refill continuously at `rate` per second up to `capacity`;
+    `acquire` blocks until enough tokens are available.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    def acquire(self, tokens=1):
+        """Block until `tokens` tokens can be taken from the bucket."""
+        tokens = min(tokens, self.capacity)
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+# Shared by every client in the process so concurrent ingestions together
+# stay under the provider quota.
+shared_limiter = TokenBucket(
+    rate=EMBED_TEXTS_PER_MINUTE / 60.0,
+    capacity=max(EMBED_MAX_BATCH_SIZE, 1),
+)
+
+
+def classify_error(error):
+    """
+    Classify an embedding error.
+
+    Returns:
+        str: "throttled" for 429/quota errors, "server" for 5xx/transient
+        errors, or None if the error should not be retried.
+    """
+    code = getattr(error, "code", None) or getattr(error, "status_code", None)
+    if callable(code):
+        code = code()
+    code = getattr(code, "value", code)
+    if isinstance(code, tuple):  # grpc.StatusCode values are (int, str)
+        code = code[1]
+    if code == 429 or str(code).lower().replace(" ", "_") == "resource_exhausted":
+        return "throttled"
+    if code in RETRYABLE_STATUS_CODES:
+        return "server"
+
+    message = str(error).lower()
+    if THROTTLE_PATTERN.search(message):
+        return "throttled"
+    if SERVER_ERROR_PATTERN.search(message):
+        return "server"
+    return None
+
+
+class BatchedEmbeddingClient:
+    """
+    Embeds large lists of texts in rate-limited, adaptively sized batches.
+
+    Args:
+        embed_fn (callable): Maps a list of texts to a list of vectors,
+            e.g. `GoogleGenerativeAIEmbeddings.embed_documents`.
+        limiter (TokenBucket): Limiter charged one token per text.
+        max_batch_size (int): Upper bound for the adaptive batch size.
+        max_retries (int): Attempts per batch before giving up.
+        base_delay (float): First backoff delay in seconds.
+        max_delay (float): Cap for the backoff delay in seconds.
+    """
+
+    def __init__(
+        self,
+        embed_fn,
+        limiter=shared_limiter,
+        max_batch_size=EMBED_MAX_BATCH_SIZE,
+        max_retries=EMBED_MAX_RETRIES,
+        base_delay=1.0,
+        max_delay=60.0,
+    ):
+        self.embed_fn = embed_fn
+        self.limiter = limiter
+        self.max_batch_size = max_batch_size
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._batch_size = max_batch_size
+        self._successes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def batch_size(self):
+        """Current adaptive batch size."""
+        return self._batch_size
+
+    def _on_success(self):
+        # Grow back towards the maximum after a run of clean batches
+        with self._lock:
+            self._successes += 1
+            if self._successes >= 5 and self._batch_size < self.max_batch_size:
+                self._batch_size = min(self.max_batch_size, self._batch_size * 2)
+                self._successes = 0
+
+    def _on_throttle(self):
+        # Multiplicative decrease on 429s
+        with self._lock:
+            self._batch_size = max(1, self._batch_size // 2)
+            self._successes = 0
+
+    def _backoff(self, attempt):
+        delay = min(self.max_delay, self.base_delay * (2**attempt))
+        time.sleep(random.uniform(0, delay))  # full jitter
+
+    def embed_documents(self, texts):
+        """
+        Embed texts, retrying only the batches that fail.
+
+        Args:
+            texts (list): Texts to embed.
+
+        Returns:
+            list: One vector per text, in input order.
+
+        Raises:
+            EmbeddingError: If a batch fails with a non-retryable error or
+                exhausts its retries. `partial` holds the finished vectors.
+        """
+        results = {}
+        pending = list(range(len(texts)))
+        attempts = 0
+
+        while pending:
+            batch = pending[: self._batch_size]
+            if self.limiter:
+                self.limiter.acquire(len(batch))
+            try:
+                vectors = self.embed_fn([texts[i] for i in batch])
+            except Exception as e:
+                kind = classify_error(e)
+                attempts += 1
+                if kind is None or attempts > self.max_retries:
+                    raise EmbeddingError(
+                        f"Embedding failed after {attempts} attempts: {e}",
+                        partial=results,
+                    ) from e
+                if kind == "throttled":
+                    self._on_throttle()
+                logger.warning(
+                    "Embedding batch of %s %s (attempt %s), batch size now %s",
+                    len(batch),
+                    kind,
+                    attempts,
+                    self._batch_size,
+                )
+                self._backoff(attempts - 1)
+                continue
+
+            results.update(zip(batch, vectors))
+            pending = pending[len(batch) :]
+            attempts = 0
+            self._on_success()
+
+        return [results[i] for i in range(len(texts))]
@@ -0,0 +1,299 @@
+"""
+# embedding_providers.py
+Embedding backends selected by configuration.
+
+`EMBEDDING_PROVIDER` picks the backend used for both ingestion and queries:
+- "google": Google Generative AI `models/embedding-001` (network, default)
+- "local": a small model on the CPU, loaded from `EMBEDDING_LOCAL_MODEL_PATH`;
+  a directory with `model.onnx` and `tokenizer.json` runs through ONNX
+  Runtime, anything else through sentence-transformers
+- "hashing": deterministic feature hashing, for tests and offline use
+
+Each provider has a `provider_id` and a `dimension`. Bot collections are
+stamped with both on first write, and opening a collection with a different
+provider raises `EmbeddingProviderMismatch`, so vectors from different
+models are never mixed in one index.
+"""
+
+import hashlib
+import math
+import os
+import threading
+
+from dotenv import load_dotenv
+from langchain_core.embeddings import Embeddings
+
+from logger import setup_logger
+
+# The provider settings may come from .env
+load_dotenv()
+logger = setup_logger()
+
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "google")
+EMBEDDING_LOCAL_MODEL_PATH = os.getenv(
+    "EMBEDDING_LOCAL_MODEL_PATH", "models/embedder"
+)
+EMBEDDING_LOCAL_BATCH_SIZE = int(os.getenv("EMBEDDING_LOCAL_BATCH_SIZE", "32"))
+EMBEDDING_LOCAL_MAX_TOKENS = int(os.getenv("EMBEDDING_LOCAL_MAX_TOKENS", "256"))
+EMBEDDING_HASH_DIMENSION = int(os.getenv("EMBEDDING_HASH_DIMENSION", "256"))
+
+GOOGLE_EMBEDDING_MODEL = "models/embedding-001"
+GOOGLE_EMBEDDING_DIMENSION = 768
+
+# Collections built before providers were recorded used Google embeddings
+LEGACY_PROVIDER_ID = f"google:{GOOGLE_EMBEDDING_MODEL}"
+
+PROVIDER_KEY = "embedding_provider"
+DIMENSION_KEY = "embedding_dimension"
+
+
+class EmbeddingProviderMismatch(ValueError):
+    """A collection was built by a different embedding provider or dimension."""
+
+
+class GoogleEmbeddings(Embeddings):
+    """Google Generative AI embeddings (network)."""
+
+    remote = True
+
+    def __init__(self, model=GOOGLE_EMBEDDING_MODEL):
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+        self.provider_id = f"google:{model}"
+        self.dimension = GOOGLE_EMBEDDING_DIMENSION
+        self._client = GoogleGenerativeAIEmbeddings(
+            model=model,
+            google_api_key=os.getenv("GEMINI_API_KEY"),
+            task_type="retrieval_document",
+        )
+
+    def embed_documents(self, texts):
+        return self._client.embed_documents(texts)
+
+    def embed_query(self, text):
+        return self._client.embed_query(text)
+
+    async def aembed_documents(self, texts):
+        return await self._client.aembed_documents(texts)
+
+    async def aembed_query(self, text):
+        return await self._client.aembed_query(text)
+
+
+class LocalEmbeddings(Embeddings):
+    """
+    CPU embeddings from a small local model, batched through NumPy.
+
+    The model is loaded on first use, so processes that never embed (e.g.
+    document parsing workers) do not pay for it.
+
+    Args:
+        model_path (str): Directory of an ONNX export (`model.onnx` plus
+            `tokenizer.json`) or of a sentence-transformers model.
+        batch_size (int): Texts per forward pass.
+        max_tokens (int): Tokens per text; longer texts are truncated.
+    """
+
+    remote = False
+
+    def __init__(
+        self,
+        model_path=EMBEDDING_LOCAL_MODEL_PATH,
+        batch_size=EMBEDDING_LOCAL_BATCH_SIZE,
+        max_tokens=EMBEDDING_LOCAL_MAX_TOKENS,
+    ):
+        self.model_path = model_path
+        self.batch_size = batch_size
+        self.max_tokens = max_tokens
+        self.provider_id = f"local:{os.path.basename(os.path.normpath(model_path))}"
+        self._model = None
+        self._dimension = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._model is not None:
+                return
+            onnx_path = os.path.join(self.model_path, "model.onnx")
+            if os.path.exists(onnx_path):
+                import onnxruntime
+                from tokenizers import Tokenizer
+
+                tokenizer = Tokenizer.from_file(
+                    os.path.join(self.model_path, "tokenizer.json")
+                )
+                tokenizer.enable_truncation(self.max_tokens)
+                tokenizer.enable_padding()
+                session = onnxruntime.InferenceSession(
+                    onnx_path, providers=["CPUExecutionProvider"]
+                )
+                self._model = ("onnx", session, tokenizer)
+                self._dimension = session.get_outputs()[0].shape[-1]
+            else:
+                from sentence_transformers import SentenceTransformer
+
+                model = SentenceTransformer(self.model_path, device="cpu")
+                model.max_seq_length = self.max_tokens
+                self._model = ("sentence_transformers", model, None)
+                self._dimension = model.get_sentence_embedding_dimension()
+            logger.info(
+                "Loaded local embedding model %s (%s, %s dimensions)",
+                self.model_path,
+                self._model[0],
+                self._dimension,
+            )
+
+    @property
+    def dimension(self):
+        self._load()
+        return self._dimension
+
+    def _encode_onnx(self, session, tokenizer, texts):
+        import numpy as np
+
+        encodings = tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array(
+            [e.attention_mask for e in encodings], dtype=np.int64
+        )
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        input_names = {i.name for i in session.get_inputs()}
+        if "token_type_ids" in input_names:
+            feeds["token_type_ids"] = np.zeros_like(input_ids)
+        hidden = session.run(None, feeds)[0]
+
+        # Mean pooling over real tokens, then L2 normalization
+        mask = attention_mask[..., None].astype(hidden.dtype)
+        counts = np.clip(mask.sum(axis=1), 1e-9, None)
+        pooled = (hidden * mask).sum(axis=1) / counts
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+        return pooled / np.clip(norms, 1e-12, None)
+
+    def embed_documents(self, texts):
+        self._load()
+        kind, model, tokenizer = self._model
+        if kind == "sentence_transformers":
+            vectors = model.encode(
+                list(texts),
+                batch_size=self.batch_size,
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+            )
+            return vectors.tolist()
+
+        # Sort by length so each batch pads to similar lengths
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vectors = [None] * len(texts)
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start : start + self.batch_size]
+            encoded = self._encode_onnx(model, tokenizer, [texts[i] for i in batch])
+            for i, vector in zip(batch, encoded):
+                vectors[i] = vector.tolist()
+        return vectors
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Deterministic feature-hashing embeddings.
+
+    Each word is hashed to a signed bucket; the bucket counts are L2
+    normalized. No model, no network, identical output on every machine.
+
+    Args:
+        dimension (int): Vector size.
+    """
+
+    remote = False
+
+    def __init__(self, dimension=EMBEDDING_HASH_DIMENSION):
+        self.dimension = dimension
+        self.provider_id = f"hashing:{dimension}"
+
+    def _embed(self, text):
+        vector = [0.0] * self.dimension
+        for word in text.lower().split():
+            digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+            value = int.from_bytes(digest, "little")
+            sign = 1.0 if value & 1 else -1.0
+            vector[(value >> 1) % self.dimension] += sign
+        norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+        return [x / norm for x in vector]
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+PROVIDERS = {
+    "google": GoogleEmbeddings,
+    "local": LocalEmbeddings,
+    "hashing": HashingEmbeddings,
+}
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def get_embedding_provider():
+    """
+    Return the process-wide embedding provider chosen by `EMBEDDING_PROVIDER`.
+
+    Raises:
+        ValueError: If the configured provider is unknown.
+    """
+    global _provider
+    with _provider_lock:
+        if _provider is None:
+            if EMBEDDING_PROVIDER not in PROVIDERS:
+                raise ValueError(f"Unknown embedding provider: {EMBEDDING_PROVIDER}")
+            _provider = PROVIDERS[EMBEDDING_PROVIDER]()
+            logger.info("Using embedding provider %s", _provider.provider_id)
+    return _provider
+
+
+def check_collection_provider(collection, provider):
+    """
+    Make sure a collection is only ever used with one embedding provider.
+
+    Unstamped collections are stamped with `provider`: empty ones directly,
+    non-empty ones only if `provider` is the legacy Google provider that
+    built them.
+
+    Args:
+        collection: A chromadb collection.
+        provider: The embedding provider about to read or write it.
+
+    Raises:
+        EmbeddingProviderMismatch: If the collection was built by another
+            provider or with another dimension.
+    """
+    metadata = collection.metadata or {}
+    recorded = metadata.get(PROVIDER_KEY)
+    if recorded is None:
+        recorded = LEGACY_PROVIDER_ID if collection.count() else provider.provider_id
+        if recorded == provider.provider_id:
+            # Chroma does not allow re-sending the index settings
+            kept = {k: v for k, v in metadata.items() if not k.startswith("hnsw:")}
+            collection.modify(
+                metadata={
+                    **kept,
+                    PROVIDER_KEY: provider.provider_id,
+                    DIMENSION_KEY: provider.dimension,
+                }
+            )
+            return
+
+    if recorded != provider.provider_id or metadata.get(
+        DIMENSION_KEY, provider.dimension
+    ) != provider.dimension:
+        raise EmbeddingProviderMismatch(
+            f"Collection {collection.name} was built with {recorded} "
+            f"({metadata.get(DIMENSION_KEY, '?')} dimensions), not "
+            f"{provider.provider_id} ({provider.dimension} dimensions); "
+            "delete its Chroma_db directory and re-ingest to switch providers"
+        )
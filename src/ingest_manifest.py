@@ -0,0 +1,100 @@
+"""
+# ingest_manifest.py
+Per-bot file manifest for incremental re-ingestion.
+
+The manifest lives next to the bot's Chroma database and records, for every
+ingested file, its size, mtime, content hash, collection and chunk ids.
+`document_processor` uses it to skip unchanged files, replace the chunks of
+changed files and remove the chunks of deleted files. Chunk ids are derived
+from the file name, content hash and chunk index, so re-running ingestion
+upserts the same ids instead of duplicating chunks.
+"""
+
+import hashlib
+import json
+import os
+
+from logger import setup_logger
+
+logger = setup_logger()
+
+MANIFEST_FILE = "ingest_manifest.json"
+
+
+def manifest_path(persist_directory):
+    """Return the manifest location for a Chroma persist directory."""
+    return os.path.join(persist_directory, MANIFEST_FILE)
+
+
+def load_manifest(persist_directory):
+    """
+    Load a bot's manifest.
+
+    Args:
+        persist_directory (str): The bot's Chroma persist directory.
+
+    Returns:
+        dict: Entries keyed by file name; empty if there is no manifest yet.
+    """
+    path = manifest_path(persist_directory)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.error("Unreadable manifest %s, re-ingesting everything: %s", path, e)
+        return {}
+
+
+def save_manifest(persist_directory, manifest):
+    """
+    Atomically write a bot's manifest.
+
+    Args:
+        persist_directory (str): The bot's Chroma persist directory.
+        manifest (dict): Entries keyed by file name.
+    """
+    os.makedirs(persist_directory, exist_ok=True)
+    path = manifest_path(persist_directory)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def file_sha256(file_path):
+    """Return the sha256 hex digest of a file, read in 1 MiB blocks."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def file_fingerprint(file_path, entry=None):
+    """
+    Return size, mtime and content hash of a file.
+
+    The hash is only recomputed when size or mtime differ from the
+    previous manifest entry.
+
+    Args:
+        file_path (str): Path to the file.
+        entry (dict, optional): The file's previous manifest entry.
+
+    Returns:
+        dict: `size`, `mtime` and `sha256`.
+    """
+    stat = os.stat(file_path)
+    if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+        sha256 = entry["sha256"]
+    else:
+        sha256 = file_sha256(file_path)
+    return {"size": stat.st_size, "mtime": stat.st_mtime, "sha256": sha256}
+
+
+def chunk_id(file_name, content_hash, index):
+    """Return the deterministic Chroma id of a chunk."""
+    key = f"{file_name}\0{content_hash}\0{index}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
@@ -0,0 +1,302 @@
+"""
+# ingestion_queue.py
+Background ingestion job queue.
+
+Chatbot creation only enqueues a job into the persistent `ingestion_jobs`
+table; a pool of daemon worker threads drains the table and runs
+`process_document` for each bot directory. Jobs left in the `running`
+state by a previous process are re-queued when the workers start, so
+ingestion resumes after a restart or a browser refresh.
+"""
+
+import os
+import threading
+from datetime import datetime
+
+from database import connection
+from logger import setup_logger
+
+logger = setup_logger()
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+INGEST_MAX_ATTEMPTS = int(os.getenv("INGEST_MAX_ATTEMPTS", "3"))
+POLL_INTERVAL = 5.0  # seconds an idle worker sleeps before re-checking the table
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+# Per-file statuses of a `process_document` report worth retrying the job for;
+# "load_failed" (empty, scanned or unsupported file) fails the same way again
+INGEST_RETRY_STATUSES = ("embed_failed", "store_failed")
+
+_workers = []
+_workers_lock = threading.Lock()
+_wakeup = threading.Event()
+
+
+def enqueue_ingestion_job(bot_id, username, directory_path):
+    """
+    Add an ingestion job for a bot directory.
+
+    Args:
+        bot_id (int): The chatbot's database ID.
+        username (str): Owner of the chatbot.
+        directory_path (str): Directory holding the uploaded documents.
+
+    Returns:
+        int: The new job ID, or None if the job could not be stored.
+    """
+    logger.info("Enqueuing ingestion job for bot %s", bot_id)
+    now = datetime.now()
+
+    try:
+        with connection() as conn:
+            job_id = conn.execute(
+                """INSERT INTO ingestion_jobs
+                        (bot_id, username, directory_path, state,
+                         created_at, updated_at)
+                        VALUES (?,?,?,?,?,?)""",
+                (bot_id, username, directory_path, JOB_QUEUED, now, now),
+            ).lastrowid
+        _wakeup.set()
+        return job_id
+    except Exception as e:
+        logger.error("Failed to enqueue ingestion job: %s", str(e))
+        return None
+
+
+def _claim_next_job():
+    """Atomically move the oldest queued job to `running` and return it."""
+    try:
+        with connection() as conn:
+            c = conn.cursor()
+            c.execute("BEGIN IMMEDIATE")
+            c.execute(
+                """SELECT id, bot_id, username, directory_path, attempts
+                        FROM ingestion_jobs
+                        WHERE state=?
+                        ORDER BY id LIMIT 1""",
+                (JOB_QUEUED,),
+            )
+            row = c.fetchone()
+            if row is None:
+                return None
+
+            now = datetime.now()
+            c.execute(
+                """UPDATE ingestion_jobs
+                        SET state=?, attempts=attempts + 1, progress=0,
+                            started_at=?, updated_at=?
+                        WHERE id=?""",
+                (JOB_RUNNING, now, now, row[0]),
+            )
+        return {
+            "id": row[0],
+            "bot_id": row[1],
+            "username": row[2],
+            "directory_path": row[3],
+            "attempts": row[4] + 1,
+        }
+    except Exception as e:
+        logger.error("Failed to claim ingestion job: %s", str(e))
+        return None
+
+
+def _update_job(job_id, **fields):
+    """Update columns of a job row and bump its `updated_at` timestamp."""
+    fields["updated_at"] = datetime.now()
+    assignments = ", ".join(f"{column}=?" for column in fields)
+
+    try:
+        with connection() as conn:
+            conn.execute(
+                f"UPDATE ingestion_jobs SET {assignments} WHERE id=?",
+                (*fields.values(), job_id),
+            )
+    except Exception as e:
+        logger.error("Failed to update ingestion job %s: %s", job_id, str(e))
+
+
+def requeue_stale_jobs():
+    """
+    Re-queue jobs that were `running` when the previous process stopped.
+
+    Returns:
+        int: Number of jobs moved back to the queue.
+    """
+    try:
+        with connection() as conn:
+            requeued = conn.execute(
+                """UPDATE ingestion_jobs SET state=?, updated_at=?
+                        WHERE state=?""",
+                (JOB_QUEUED, datetime.now(), JOB_RUNNING),
+            ).rowcount
+        if requeued:
+            logger.warning("Re-queued %s interrupted ingestion jobs", requeued)
+        return requeued
+    except Exception as e:
+        logger.error("Failed to re-queue ingestion jobs: %s", str(e))
+        return 0
+
+
+def _run_job(job):
+    """Run `process_document` for a claimed job and record the outcome."""
+    # Imported here so the queue can be used without loading the
+    # Unstructured/LangChain stack until a job actually runs.
+    from chatbot import get_chunking_settings
+    from document_processor import process_document
+
+    job_id = job["id"]
+    logger.info("Running ingestion job %s for bot %s", job_id, job["bot_id"])
+
+    def report_progress(done, total, file_name):
+        _update_job(
+            job_id,
+            progress=done / total if total else 1.0,
+            message=f"Processed {done}/{total}: {file_name}",
+        )
+
+    try:
+        report = process_document(
+            job["directory_path"],
+            progress_callback=report_progress,
+            chunking=get_chunking_settings(job["bot_id"]),
+        )
+        # process_document reports per-file failures instead of raising
+        failed = [
+            result["file"]
+            for result in report
+            if result["status"] in INGEST_RETRY_STATUSES
+        ]
+        if failed:
+            raise RuntimeError(f"Failed to ingest {', '.join(failed)}")
+        unloadable = [
+            result["file"] for result in report if result["status"] == "load_failed"
+        ]
+        error = f"Could not load {', '.join(unloadable)}" if unloadable else None
+        _update_job(
+            job_id,
+            state=JOB_DONE,
+            progress=1.0,
+            message=error,
+            error=error,
+            finished_at=datetime.now(),
+        )
+        logger.info("Ingestion job %s finished", job_id)
+    except Exception as e:
+        logger.error("Ingestion job %s failed: %s", job_id, str(e))
+        if job["attempts"] < INGEST_MAX_ATTEMPTS:
+            _update_job(job_id, state=JOB_QUEUED, error=str(e))
+        else:
+            _update_job(
+                job_id, state=JOB_FAILED, error=str(e), finished_at=datetime.now()
+            )
+
+
+def _worker_loop():
+    """Drain the job table forever, sleeping while it is empty."""
+    while True:
+        job = _claim_next_job()
+        if job is None:
+            _wakeup.wait(POLL_INTERVAL)
+            _wakeup.clear()
+            continue
+        _run_job(job)
+
+
+def start_ingestion_workers(num_workers=INGEST_WORKERS):
+    """
+    Start the background worker pool once per process.
+
+    Safe to call on every Streamlit rerun; only the first call spawns threads
+    and re-queues jobs interrupted by a previous process.
+
+    Args:
+        num_workers (int): Number of worker threads to start.
+    """
+    with _workers_lock:
+        if _workers:
+            return
+        requeue_stale_jobs()
+        for i in range(num_workers):
+            worker = threading.Thread(
+                target=_worker_loop, name=f"ingestion-worker-{i}", daemon=True
+            )
+            worker.start()
+            _workers.append(worker)
+        logger.info("Started %s ingestion workers", num_workers)
+
+
+def get_ingestion_status(bot_id):
+    """
+    Return the most recent ingestion job for a bot.
+
+    Args:
+        bot_id (int): The chatbot's database ID.
+
+    Returns:
+        dict or None: Job state, attempts, progress, message, error and
+        timestamps, or None if the bot never had an ingestion job.
+    """
+    try:
+        with connection() as conn:
+            row = conn.execute(
+                """SELECT id, state, attempts, progress, message, error,
+                          created_at, updated_at
+                        FROM ingestion_jobs
+                        WHERE bot_id=?
+                        ORDER BY id DESC LIMIT 1""",
+                (bot_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "id": row[0],
+            "state": row[1],
+            "attempts": row[2],
+            "progress": row[3] or 0.0,
+            "message": row[4],
+            "error": row[5],
+            "created_at": row[6],
+            "updated_at": row[7],
+        }
+    except Exception as e:
+        logger.error("Failed to fetch ingestion status: %s", str(e))
+        return None
+
+
+def get_active_jobs(username):
+    """
+    Return queued and running ingestion jobs for a user's chatbots.
+
+    Args:
+        username (str): Owner of the chatbots.
+
+    Returns:
+        list: Dictionaries with the bot name, state, progress and message.
+    """
+    try:
+        with connection() as conn:
+            rows = conn.execute(
+                """SELECT j.bot_id, b.bot_name, j.state, j.progress, j.message
+                        FROM ingestion_jobs j
+                        JOIN chatbots b ON b.id = j.bot_id
+                        WHERE j.username=? AND j.state IN (?, ?)
+                        ORDER BY j.id""",
+                (username, JOB_QUEUED, JOB_RUNNING),
+            ).fetchall()
+        return [
+            {
+                "bot_id": row[0],
+                "bot_name": row[1],
+                "state": row[2],
+                "progress": row[3] or 0.0,
+                "message": row[4],
+            }
+            for row in rows
+        ]
+    except Exception as e:
+        logger.error("Failed to fetch active ingestion jobs: %s", str(e))
+        return []
@@ -0,0 +1,272 @@
+"""
+# lexical_index.py
+Per-bot BM25 inverted index over the chunks of the bot collection.
+
+The index is written to `bm25_index.json` inside the bot's Chroma persist
+directory and rebuilt from the collection after every ingestion run, so it
+always matches the stored chunks. Tokens keep identifiers such as ticket
+numbers, SKUs and error codes whole ("err-1042") as well as their parts
+("err", "1042"), so exact identifiers match even when embeddings do not.
+
+`reciprocal_rank_fusion` merges the lexical and vector rankings.
+"""
+
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+from collections import Counter, OrderedDict
+
+import regex as re
+
+from logger import setup_logger
+from vector_stores import open_vector_store, persist_lock
+
+logger = setup_logger()
+
+INDEX_FILE = "bm25_index.json"
+INDEX_VERSION = 1
+BM25_K1 = 1.5
+BM25_B = 0.75
+RRF_K = 60
+LEXICAL_INDEX_CACHE_SIZE = int(os.getenv("LEXICAL_INDEX_CACHE_SIZE", "32"))
+
+TOKEN_REGEX = re.compile(r"\w+(?:[-_./:#]\w+)*")
+PART_REGEX = re.compile(r"[^\W_]+")
+
+
+def index_path(persist_directory):
+    """Return the BM25 index location for a Chroma persist directory."""
+    return os.path.join(persist_directory, INDEX_FILE)
+
+
+def tokenize(text):
+    """
+    Split text into lowercase index terms.
+
+    Compound identifiers are kept whole and also split into their parts.
+    """
+    terms = []
+    for token in TOKEN_REGEX.findall(text.lower()):
+        terms.append(token)
+        parts = PART_REGEX.findall(token)
+        if len(parts) > 1:
+            terms.extend(parts)
+    return terms
+
+
+class LexicalIndex:
+    """
+    In-memory BM25 index.
+
+    Args:
+        ids (list): Chunk ids, one per document.
+        files (list): Distinct source file names.
+        doc_files (list): Index into `files` of each document's source.
+        lengths (list): Term count of each document.
+        postings (dict): term -> "doc tf doc tf ..." string. Postings are
+            kept encoded and only decoded for the terms of a query, so
+            loading a large index is a single cheap JSON parse.
+    """
+
+    def __init__(self, ids, files, doc_files, lengths, postings):
+        self.ids = ids
+        self.files = files
+        self.doc_files = doc_files
+        self.lengths = lengths
+        self.postings = postings
+        self.avg_length = sum(lengths) / len(lengths) if lengths else 0.0
+
+    @classmethod
+    def build(cls, ids, texts, sources):
+        """
+        Index a set of chunks.
+
+        Args:
+            ids (list): Chunk ids.
+            texts (list): Chunk texts.
+            sources (list): Source file name of each chunk.
+
+        Returns:
+            LexicalIndex: The index.
+        """
+        files, file_numbers, doc_files, lengths = [], {}, [], []
+        postings = {}
+        for number, (text, source) in enumerate(zip(texts, sources)):
+            if source not in file_numbers:
+                file_numbers[source] = len(files)
+                files.append(source)
+            doc_files.append(file_numbers[source])
+            counts = Counter(tokenize(text or ""))
+            lengths.append(sum(counts.values()))
+            for term, frequency in counts.items():
+                postings.setdefault(term, []).append(f"{number} {frequency}")
+        encoded = {term: " ".join(entries) for term, entries in postings.items()}
+        return cls(list(ids), files, doc_files, lengths, encoded)
+
+    def search(self, query, k=10, files=None):
+        """
+        Rank chunks against a query with BM25.
+
+        Args:
+            query (str): The user's question.
+            k (int): Number of chunks to return.
+            files (list, optional): File names to restrict the search to.
+
+        Returns:
+            list: (chunk id, score) pairs, best first.
+        """
+        allowed = None
+        if files:
+            allowed = {i for i, name in enumerate(self.files) if name in files}
+
+        total = len(self.ids)
+        scores = {}
+        for term in set(tokenize(query)):
+            encoded = self.postings.get(term)
+            if not encoded:
+                continue
+            values = [int(value) for value in encoded.split()]
+            postings = list(zip(values[::2], values[1::2]))
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for number, frequency in postings:
+                if allowed is not None and self.doc_files[number] not in allowed:
+                    continue
+                norm = BM25_K1 * (
+                    1 - BM25_B + BM25_B * self.lengths[number] / self.avg_length
+                )
+                scores[number] = scores.get(number, 0.0) + idf * frequency * (
+                    BM25_K1 + 1
+                ) / (frequency + norm)
+
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(self.ids[number], score) for number, score in best]
+
+    def save(self, path):
+        """Atomically write the index as compact JSON."""
+        payload = {
+            "version": INDEX_VERSION,
+            "ids": self.ids,
+            "files": self.files,
+            "doc_files": self.doc_files,
+            "lengths": self.lengths,
+            "postings": self.postings,
+        }
+        # A unique temp file, so concurrent saves never interleave their writes
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(path) or ".", prefix=".bm25-", suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(payload, f, separators=(",", ":"))
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    @classmethod
+    def load(cls, path):
+        """Read an index written by `save`."""
+        with open(path, "r", encoding="utf-8") as f:
+            payload = json.load(f)
+        if payload.get("version") != INDEX_VERSION:
+            raise ValueError(f"Unsupported index version in {path}")
+        return cls(
+            payload["ids"],
+            payload["files"],
+            payload["doc_files"],
+            payload["lengths"],
+            payload["postings"],
+        )
+
+
+def build_bot_index(persist_directory):
+    """
+    Rebuild a bot's BM25 index from its Chroma collection.
+
+    Callers hold `persist_lock(persist_directory)`.
+
+    Args:
+        persist_directory (str): The bot's Chroma persist directory.
+
+    Returns:
+        LexicalIndex: The new index.
+    """
+    started = time.perf_counter()
+    collection = open_vector_store(persist_directory, None)._collection
+    data = collection.get(include=["documents", "metadatas"])
+    index = LexicalIndex.build(
+        data["ids"],
+        data["documents"],
+        [(metadata or {}).get("source", "") for metadata in data["metadatas"]],
+    )
+    index.save(index_path(persist_directory))
+    logger.info(
+        "Built BM25 index of %s: %s chunks, %s terms in %.2fs",
+        persist_directory,
+        len(index.ids),
+        len(index.postings),
+        time.perf_counter() - started,
+    )
+    return index
+
+
+_indexes = OrderedDict()  # path -> (mtime, LexicalIndex)
+_indexes_lock = threading.Lock()
+
+
+def get_bot_index(persist_directory):
+    """
+    Return a bot's BM25 index, loading it on first use or after a rebuild.
+
+    Bots ingested before the index existed get it built on first use.
+
+    Args:
+        persist_directory (str): The bot's Chroma persist directory.
+
+    Returns:
+        LexicalIndex: The index.
+    """
+    path = index_path(persist_directory)
+    if not os.path.exists(path):
+        # Same lock as ingestion, so only one build of an index runs at a time
+        with persist_lock(persist_directory):
+            if not os.path.exists(path):
+                logger.info("No BM25 index in %s; building it", persist_directory)
+                build_bot_index(persist_directory)
+    mtime = os.stat(path).st_mtime_ns
+
+    with _indexes_lock:
+        cached = _indexes.get(path)
+        if cached and cached[0] == mtime:
+            _indexes.move_to_end(path)
+            return cached[1]
+
+    index = LexicalIndex.load(path)
+    with _indexes_lock:
+        _indexes[path] = (mtime, index)
+        _indexes.move_to_end(path)
+        while len(_indexes) > LEXICAL_INDEX_CACHE_SIZE:
+            _indexes.popitem(last=False)
+    return index
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """
+    Merge several rankings of chunk ids.
+
+    Args:
+        rankings (list): Lists of chunk ids, best first.
+        k (int): RRF damping constant.
+
+    Returns:
+        list: (chunk id, fused score) pairs, best first.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
@@ -15,6 +15,7 @@ def compute_avg_response_time(messages):
             - 'role' (str): Either 'user' or 'assistant'.
             - 'content' (str): The message text.
             - 'timestamp' (str): The ISO-formatted timestamp.
+            - 'response_time' (float, optional): Seconds the reply took.
 
     Returns:
         str: The average response time formatted as "<time> sec", or "N/A" if no valid pairs exist.
@@ -24,14 +25,21 @@ def compute_avg_response_time(messages):
     # Loop through messages, looking for a user message followed by an assistant message.
     for i in range(len(messages) - 1):
         if messages[i]["role"] == "user" and messages[i + 1]["role"] == "assistant":
-            # Ensure both messages have timestamps.
-            if messages[i].get("timestamp") and messages[i + 1].get("timestamp"):
+            # Prefer the latency measured when the turn was recorded.
+            if messages[i + 1].get("response_time") is not None:
+                response_times.append(messages[i + 1]["response_time"])
+            # Otherwise ensure both messages have timestamps.
+            elif messages[i].get("timestamp") and messages[i + 1].get("timestamp"):
                 t_user = datetime.datetime.fromisoformat(messages[i]["timestamp"])
                 t_assistant = datetime.datetime.fromisoformat(messages[i + 1]["timestamp"])
                 response_times.append((t_assistant - t_user).total_seconds())
 
     if response_times:
-        avg_time = sum(response_times) / len(response_times)
-        return f"{avg_time:.1f} sec"
+        return format_response_time(sum(response_times) / len(response_times))
 
     return "N/A"  # Removed unnecessary else
+
+
+def format_response_time(seconds):
+    """Format a response time as "<time> sec", or "N/A" if unknown."""
+    return f"{seconds:.1f} sec" if seconds is not None else "N/A"
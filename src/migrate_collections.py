@@ -0,0 +1,154 @@
+"""
+# migrate_collections.py
+Migrates bots from one Chroma collection per file to one collection per bot.
+
+Older ingestion wrote every uploaded file into its own `<file>_collection`.
+This command copies the stored chunks, vectors and metadata of those
+collections into the bot collection, tagging each chunk with its source
+file, page and chunk index, then drops the per-file collections and records
+each migrated file in the bot's ingest manifest. Nothing is re-embedded,
+and the next ingestion run keeps the copied chunks instead of adding them
+again.
+
+Usage:
+    python src/migrate_collections.py [user_docs_root] [--dry-run]
+"""
+
+import argparse
+import glob
+import os
+
+import chromadb
+
+from chunking import normalize_chunking
+from ingest_manifest import file_fingerprint, load_manifest, save_manifest
+from logger import setup_logger
+from vector_stores import BOT_COLLECTION, PERSIST_DIRNAME
+
+logger = setup_logger()
+
+LEGACY_SUFFIX = "_collection"
+BATCH_SIZE = 500
+
+
+def _source_file(directory_path, collection_name):
+    """Map a legacy collection name back to the file it was built from."""
+    stem = collection_name[: -len(LEGACY_SUFFIX)]
+    for file_name in sorted(os.listdir(directory_path)):
+        path = os.path.join(directory_path, file_name)
+        if os.path.isfile(path) and os.path.splitext(file_name)[0] == stem:
+            return file_name
+    return stem
+
+
+def _manifest_entry(directory_path, source, entry, ids):
+    """
+    Return the manifest entry of a migrated file.
+
+    Without an entry, the next ingestion would treat the file as new and
+    store its chunks again under deterministic ids. The copied chunks are
+    recorded as built with the default chunking settings, which legacy bots
+    use, so they are kept until the file or the settings change. A file
+    that no longer exists keeps only its chunk ids, so the next ingestion
+    removes them.
+    """
+    path = os.path.join(directory_path, source)
+    fingerprint = {}
+    if os.path.isfile(path):
+        fingerprint = file_fingerprint(path, entry)
+        fingerprint["chunking"] = (entry or {}).get("chunking") or normalize_chunking()
+    return {
+        **(entry or {}),
+        **fingerprint,
+        "collection": BOT_COLLECTION,
+        "chunk_ids": ids,
+    }
+
+
+def migrate_bot(directory_path, dry_run=False):
+    """
+    Merge the per-file collections of one bot into its bot collection.
+
+    Args:
+        directory_path (str): The bot's document directory.
+        dry_run (bool): Only report what would be migrated.
+
+    Returns:
+        int: Number of chunks copied.
+    """
+    persist_directory = os.path.join(directory_path, PERSIST_DIRNAME)
+    client = chromadb.PersistentClient(path=persist_directory)
+    names = [getattr(c, "name", c) for c in client.list_collections()]
+    legacy = [name for name in names if name.endswith(LEGACY_SUFFIX)]
+    if not legacy:
+        return 0
+
+    # Same settings langchain_chroma uses, so ingestion can keep writing to it
+    target = client.get_or_create_collection(BOT_COLLECTION, embedding_function=None)
+    manifest = load_manifest(persist_directory)
+    copied = 0
+
+    for name in legacy:
+        source = _source_file(directory_path, name)
+        collection = client.get_collection(name)
+        data = collection.get(include=["embeddings", "documents", "metadatas"])
+        ids = data["ids"]
+        logger.info(
+            "%s: %s -> %s (%s chunks)", directory_path, name, source, len(ids)
+        )
+        if dry_run:
+            copied += len(ids)
+            continue
+
+        metadatas = [
+            {
+                "source": source,
+                "page": (metadata or {}).get("page_number")
+                or (metadata or {}).get("page")
+                or 0,
+                "chunk_index": index,
+            }
+            for index, metadata in enumerate(data["metadatas"] or [None] * len(ids))
+        ]
+        for start in range(0, len(ids), BATCH_SIZE):
+            end = start + BATCH_SIZE
+            target.upsert(
+                ids=ids[start:end],
+                embeddings=data["embeddings"][start:end],
+                documents=data["documents"][start:end],
+                metadatas=metadatas[start:end],
+            )
+        client.delete_collection(name)
+        copied += len(ids)
+
+        for file_name, entry in list(manifest.items()):
+            if entry.get("collection") == name and file_name != source:
+                entry["collection"] = BOT_COLLECTION
+        manifest[source] = _manifest_entry(
+            directory_path, source, manifest.get(source), ids
+        )
+
+    if not dry_run:
+        save_manifest(persist_directory, manifest)
+    return copied
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("root", nargs="?", default="user_docs")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    total = 0
+    pattern = os.path.join(args.root, "*", "*", PERSIST_DIRNAME)
+    for persist_directory in sorted(glob.glob(pattern)):
+        directory_path = os.path.dirname(persist_directory)
+        try:
+            total += migrate_bot(directory_path, dry_run=args.dry_run)
+        except Exception as e:
+            logger.error("Migration of %s failed: %s", directory_path, e)
+    logger.info("Migrated %s chunks%s", total, " (dry run)" if args.dry_run else "")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,19 +5,41 @@ This module defines the Streamlit-based user interface for the ChatBridge AI cha
 It provides authentication, chatbot management, chat interactions, and account settings.
 """
 
+import os
+
 import streamlit as st
-from database import get_connection
+from database import connection
 from auth import create_user, verify_user, delete_user_account
-from chatbot import create_chatbot, get_user_chatbots, delete_chatbot
-from chat_history import get_chat_history, save_message
-from bot_interaction import get_bot_response
-from metric import compute_avg_response_time
+from chatbot import (
+    create_chatbot,
+    get_user_chatbots,
+    delete_chatbot,
+    get_context_budget,
+)
+from chat_history import (
+    CHAT_HISTORY_PAGE_SIZE,
+    get_chat_history,
+    history_cursor,
+)
+from bot_stats import get_bot_stats
+from ingestion_queue import (
+    get_active_jobs,
+    get_ingestion_status,
+    JOB_DONE,
+    JOB_FAILED,
+)
+from metric import format_response_time
+from chunking import CHUNKING_STRATEGIES, DEFAULT_CHUNKING
+from context_assembly import DEFAULT_CONTEXT_BUDGET
 
 from logger import setup_logger
 
 # Get the configured logger
 logger = setup_logger()
 
+# Most messages of the open chat kept in a session while paging back
+CHAT_HISTORY_MAX_MESSAGES = int(os.getenv("CHAT_HISTORY_MAX_MESSAGES", "500"))
+
 
 def login_page():
     """Renders the login/signup page for users."""
@@ -38,14 +60,11 @@ def login_page():
                     # Ensure no chatbot is selected upon login.
                     st.session_state.current_bot = None
                     if "@" in identifier:
-                        conn = get_connection()
-                        c = conn.cursor()
-                        c.execute(
-                            "SELECT username FROM users WHERE email = ?",
-                            (identifier.lower(),),
-                        )
-                        result = c.fetchone()
-                        conn.close()
+                        with connection() as conn:
+                            result = conn.execute(
+                                "SELECT username FROM users WHERE email = ?",
+                                (identifier.lower(),),
+                            ).fetchone()
                         if result:
                             st.session_state.current_user = result[0]
                             st.rerun()
@@ -71,11 +90,20 @@ def login_page():
                     st.error(str(e))
 
 
+@st.fragment(run_every=3)
+def ingestion_status_panel(username):
+    """Polls and renders the progress of the user's pending document ingestion."""
+    for job in get_active_jobs(username):
+        label = job["message"] or f"{job['state'].capitalize()}..."
+        st.progress(job["progress"], text=f"{job['bot_name']}: {label}")
+
+
 def chatbot_creation_form():
     if "bot_created" not in st.session_state:
         st.session_state.bot_created = False
 
     logger.info("Function chatbot_creation_form.")
+    ingestion_status_panel(st.session_state.current_user)
 
     with st.form("Create Chatbot"):
         st.subheader("Create New Chatbot")
@@ -101,6 +129,38 @@ def chatbot_creation_form():
             ),
         }
 
+        with st.expander("Advanced: document chunking and answer context"):
+            data["chunking"] = {
+                "strategy": st.selectbox(
+                    "Chunking strategy",
+                    CHUNKING_STRATEGIES,
+                    help="token: sentence/heading-aware token chunks; "
+                    "by_title: section-aware; basic: plain size-based",
+                ),
+                "chunk_size": st.number_input(
+                    "Chunk size (tokens)",
+                    min_value=50,
+                    max_value=4000,
+                    value=DEFAULT_CHUNKING["chunk_size"],
+                    step=50,
+                ),
+                "chunk_overlap": st.number_input(
+                    "Chunk overlap (tokens)",
+                    min_value=0,
+                    max_value=1000,
+                    value=DEFAULT_CHUNKING["chunk_overlap"],
+                    step=10,
+                ),
+            }
+            data["context_token_budget"] = st.number_input(
+                "Answer context budget (tokens)",
+                min_value=200,
+                max_value=30000,
+                value=DEFAULT_CONTEXT_BUDGET,
+                step=100,
+                help="Maximum document text added to the prompt for each answer",
+            )
+
         submitted = st.form_submit_button("Create Chatbot")
 
         if submitted:
@@ -141,6 +201,30 @@ def chatbot_creation_form():
                     #     st.rerun()  # Redirect to the home page
 
 
+def load_latest_history(bot_id):
+    """Load the most recent page of a bot's history, dropping any other."""
+    messages = get_chat_history(bot_id)
+    st.session_state.messages = {bot_id: messages}
+    st.session_state.history_state = {
+        "has_older": len(messages) == CHAT_HISTORY_PAGE_SIZE,
+        "detached": False,
+    }
+
+
+def load_older_history(bot_id):
+    """Prepend the next older page, keeping at most CHAT_HISTORY_MAX_MESSAGES."""
+    messages = st.session_state.messages[bot_id]
+    older = get_chat_history(bot_id, before=history_cursor(messages))
+    messages = older + messages
+    state = st.session_state.history_state
+    state["has_older"] = len(older) == CHAT_HISTORY_PAGE_SIZE
+    if len(messages) > CHAT_HISTORY_MAX_MESSAGES:
+        # Drop the newest messages; "Back to latest" reloads them
+        messages = messages[:CHAT_HISTORY_MAX_MESSAGES]
+        state["detached"] = True
+    st.session_state.messages[bot_id] = messages
+
+
 def main_app():
     logger.info("Function main_app.")
     st.set_page_config(page_title="ChatBridge", page_icon="🤖")
@@ -207,11 +291,17 @@ def main_app():
                         key=f"bot_{bot[0]}",
                     ):
                         st.session_state.current_bot = bot
-                        st.session_state.messages[bot[0]] = get_chat_history(bot[0])
+                        load_latest_history(bot[0])
                         st.rerun()
                 with cols[1]:
                     if st.button("🗑️", key=f"del_{bot[0]}"):
                         st.session_state.delete_confirm = bot[0]
+                job = get_ingestion_status(bot[0])
+                if job and job["state"] == JOB_FAILED:
+                    st.caption(f"⚠️ Document processing failed: {job['error']}")
+                elif job and job["state"] == JOB_DONE and job["error"]:
+                    st.caption(f"⚠️ {job['error']}")
+            ingestion_status_panel(st.session_state.current_user)
             st.divider()
         st.markdown("</div>", unsafe_allow_html=True)  # End of bot-list container
 
@@ -329,28 +419,31 @@ def main_app():
             bot_id = current_bot[0]
 
             if bot_id not in st.session_state.messages:
-                st.session_state.messages[bot_id] = get_chat_history(bot_id)
+                load_latest_history(bot_id)
+            history_state = st.session_state.history_state
 
             st.markdown(f"# {current_bot[2]} Chatbot Dashboard")
 
+            # Metrics cover the whole history, not just the loaded pages
+            stats = get_bot_stats(bot_id)
             col1, col2, col3 = st.columns(3)
             with col1:
-                conv_count = len(
-                    [
-                        m
-                        for m in st.session_state.messages[bot_id]
-                        if m["role"] == "user"
-                    ]
-                )
-                st.metric("Total Conversations", conv_count)
+                st.metric("Total Conversations", stats["turns"])
             with col2:
-                avg_response_time = compute_avg_response_time(
-                    st.session_state.messages[bot_id]
+                st.metric(
+                    "Avg. Response Time",
+                    format_response_time(stats["avg_response_time"]),
+                    help=" / ".join(
+                        f"{name}: {format_response_time(stats[name])}"
+                        for name in ("p50", "p95", "p99")
+                    ),
                 )
-                st.metric("Avg. Response Time", avg_response_time)
             with col3:
-                total_interactions = len(st.session_state.messages[bot_id])
-                st.metric("Total Interactions", total_interactions)
+                st.metric("Total Interactions", stats["messages"])
+
+            if history_state["has_older"] and st.button("Load older messages"):
+                load_older_history(bot_id)
+                st.rerun()
 
             for message in st.session_state.messages.get(bot_id, []):
                 if "role" == "user":
@@ -362,6 +455,12 @@ def main_app():
                     with st.chat_message(message["role"]):
                         st.markdown(message["content"])
 
+            if history_state["detached"]:
+                st.caption("Showing older messages.")
+                if st.button("Back to latest"):
+                    load_latest_history(bot_id)
+                    st.rerun()
+
             if prompt := st.chat_input("Ask about tickets, services, or support..."):
                 # Save the user message locally and in the DB
                 st.session_state.messages[bot_id].append(
@@ -371,7 +470,6 @@ def main_app():
                     "user"
                 ):
                     st.markdown(prompt)
-                save_message(bot_id, "user", prompt)
                 # print(current_bot)
                 # Extract bot configuration details from the current bot record.
                 bot_name = current_bot[2]
@@ -385,22 +483,28 @@ def main_app():
                 logger.error(f"{session_id}")
                 logger.warning(f"botid: {session_id}")
 
-                # Get the dynamic AI response using the LangChain chain
-                ai_response = get_bot_response(
-                    bot_name,
-                    company_name,
-                    domain,
-                    industry,
-                    bot_behavior,
-                    prompt,
-                    session_id,
-                    bot_id,
-                    username=st.session_state.current_user,
-                )
-
-                st.session_state.messages[bot_id].append(
-                    {"role": "assistant", "content": ai_response}
-                )
-                save_message(bot_id, "assistant", ai_response)
+                # Imported on first chat so the login page does not load the
+                # LangChain/Chroma stack
+                from bot_interaction import stream_bot_response
+
+                # Stream the dynamic AI response from the LangChain chain; the
+                # turn is recorded by the conversation store
+                with st.chat_message("assistant"):
+                    st.write_stream(
+                        stream_bot_response(
+                            bot_name,
+                            company_name,
+                            domain,
+                            industry,
+                            bot_behavior,
+                            prompt,
+                            session_id,
+                            bot_id,
+                            username=st.session_state.current_user,
+                            context_budget=get_context_budget(bot_id),
+                        )
+                    )
 
+                # Show the latest page, which now ends with this turn
+                load_latest_history(bot_id)
                 st.rerun()
@@ -0,0 +1,117 @@
+"""
+# prompt_chains.py
+Per-bot cache of compiled prompt chains.
+
+A bot's system prompt only changes when its configuration does, so the
+`prompt | llm | parser` chain is built once per (bot_id, config version)
+and reused for every turn. The retrieved context and the conversation are
+passed in as template variables (`context`, `history`, `input`), and the
+bot's own fields are brace-escaped so text like `{` in a persona or a
+document never breaks templating.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from logger import setup_logger
+
+logger = setup_logger()
+
+PROMPT_CHAIN_CACHE_SIZE = int(os.getenv("PROMPT_CHAIN_CACHE_SIZE", "256"))
+
+
+def config_version(bot_config):
+    """
+    Return a short digest identifying a bot configuration.
+
+    Args:
+        bot_config (list): The fields the system prompt is built from.
+
+    Returns:
+        str: A short hex digest.
+    """
+    payload = json.dumps(bot_config, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def escape_braces(text):
+    """Escape `{` and `}` so text is taken literally by an f-string template."""
+    return text.replace("{", "{{").replace("}", "}}")
+
+
+class PromptChainCache:
+    """
+    Thread-safe LRU of compiled chains, one entry per bot.
+
+    An entry is rebuilt when the bot's config version changes and dropped
+    by `invalidate` when the bot record is deleted.
+
+    Args:
+        max_entries (int): Maximum number of cached bots.
+    """
+
+    def __init__(self, max_entries=PROMPT_CHAIN_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._chains = OrderedDict()  # bot_id -> (version, chain)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, bot_id, bot_config, build_fn):
+        """
+        Return the bot's compiled chain, building it on a miss.
+
+        Args:
+            bot_id (int): The chatbot's ID.
+            bot_config (list): The fields the system prompt is built from.
+            build_fn (callable): Builds the chain from `bot_config`.
+
+        Returns:
+            Runnable: The compiled chain.
+        """
+        version = config_version(bot_config)
+        with self._lock:
+            entry = self._chains.get(bot_id)
+            if entry and entry[0] == version:
+                self._chains.move_to_end(bot_id)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        if entry:
+            logger.info("Bot %s configuration changed; rebuilding its chain", bot_id)
+        chain = build_fn(bot_config)
+
+        with self._lock:
+            self._chains[bot_id] = (version, chain)
+            self._chains.move_to_end(bot_id)
+            while len(self._chains) > self.max_entries:
+                self._chains.popitem(last=False)
+        return chain
+
+    def invalidate(self, bot_id):
+        """Drop the cached chain of a bot."""
+        with self._lock:
+            self._chains.pop(bot_id, None)
+
+    def stats(self):
+        """
+        Return cache counters.
+
+        Returns:
+            dict: `entries`, `hits`, `misses` and `hit_rate`.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._chains),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+prompt_chain_cache = PromptChainCache()
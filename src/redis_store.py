@@ -0,0 +1,306 @@
+"""
+# redis_store.py
+Process-wide Redis connection pools and the chat session store.
+
+Every Redis access goes through one blocking connection pool per flavour
+(asyncio for the chat pipeline, sync for LangChain callers), sized by
+`REDIS_POOL_SIZE`, with socket timeouts and periodic health checks.
+
+A session is a Redis list of JSON-serialized messages under
+`chat_history:<session_id>` plus its rolling summary under
+`chat_summary:<session_id>`. Messages folded into the summary are trimmed
+from the list, so the list only holds the tail the summary does not cover
+and reading a session costs the same however long it has run (SQLite keeps
+the full conversation). A chat turn costs two round trips: one pipelined
+read of history and summary, and one pipelined append (which also
+refreshes the session TTL).
+"""
+
+import json
+import os
+import threading
+import time
+
+import redis
+import redis.asyncio as aioredis
+from dotenv import load_dotenv
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import message_to_dict, messages_from_dict
+
+from logger import setup_logger
+
+load_dotenv()
+logger = setup_logger()
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+REDIS_POOL_SIZE = int(os.getenv("REDIS_POOL_SIZE", "50"))
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", "5"))
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "5"))
+REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", "2"))
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", "30"))
+SESSION_TTL = int(os.getenv("SESSION_TTL", str(30 * 24 * 3600)))
+
+HISTORY_KEY_PREFIX = "chat_history:"
+SUMMARY_KEY_PREFIX = "chat_summary:"
+
+# `covered`: leading messages of the list that the summary already covers.
+# It is 0 once they are trimmed; sessions summarized before trimming was
+# introduced may still hold them.
+EMPTY_SUMMARY = {"summary": "", "covered": 0}
+
+
+def _pool_kwargs():
+    return {
+        "max_connections": REDIS_POOL_SIZE,
+        "timeout": REDIS_POOL_TIMEOUT,
+        "socket_timeout": REDIS_SOCKET_TIMEOUT,
+        "socket_connect_timeout": REDIS_CONNECT_TIMEOUT,
+        "health_check_interval": REDIS_HEALTH_CHECK_INTERVAL,
+        "retry_on_timeout": True,
+    }
+
+
+class _Metrics:
+    """Thread-safe round-trip counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.round_trips = 0
+        self.commands = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+
+    def record(self, commands, seconds, failed=False):
+        with self._lock:
+            self.round_trips += 1
+            self.commands += commands
+            self.errors += int(failed)
+            self.seconds += seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+
+
+_metrics = _Metrics()
+_async_pool = None
+_sync_pool = None
+_pools_lock = threading.Lock()
+
+
+def get_async_redis():
+    """Return an asyncio Redis client on the shared pool."""
+    global _async_pool
+    with _pools_lock:
+        if _async_pool is None:
+            _async_pool = aioredis.BlockingConnectionPool.from_url(
+                REDIS_URL, **_pool_kwargs()
+            )
+            logger.info("Connecting to Redis at: %s", REDIS_URL)
+    return aioredis.Redis(connection_pool=_async_pool)
+
+
+def get_sync_redis():
+    """Return a synchronous Redis client on the shared pool."""
+    global _sync_pool
+    with _pools_lock:
+        if _sync_pool is None:
+            _sync_pool = redis.BlockingConnectionPool.from_url(
+                REDIS_URL, **_pool_kwargs()
+            )
+    return redis.Redis(connection_pool=_sync_pool)
+
+
+async def _aexecute(pipeline, commands):
+    """Send a pipeline as one round trip, recording its latency."""
+    started = time.perf_counter()
+    try:
+        result = await pipeline.execute()
+    except Exception:
+        _metrics.record(commands, time.perf_counter() - started, failed=True)
+        raise
+    _metrics.record(commands, time.perf_counter() - started)
+    return result
+
+
+def _execute(pipeline, commands):
+    started = time.perf_counter()
+    try:
+        result = pipeline.execute()
+    except Exception:
+        _metrics.record(commands, time.perf_counter() - started, failed=True)
+        raise
+    _metrics.record(commands, time.perf_counter() - started)
+    return result
+
+
+def _encode(messages):
+    return [json.dumps(message_to_dict(message)) for message in messages]
+
+
+def _decode(raw_messages):
+    return messages_from_dict([json.loads(raw) for raw in raw_messages])
+
+
+async def aload_session(session_id):
+    """
+    Read a session's history and rolling summary in one round trip.
+
+    Args:
+        session_id (str): Unique session identifier.
+
+    Returns:
+        tuple: The messages not trimmed into the summary (oldest first) and
+        the summary state.
+    """
+    pipeline = get_async_redis().pipeline(transaction=False)
+    pipeline.lrange(HISTORY_KEY_PREFIX + session_id, 0, -1)
+    pipeline.get(SUMMARY_KEY_PREFIX + session_id)
+    raw_messages, raw_summary = await _aexecute(pipeline, 2)
+    summary = json.loads(raw_summary) if raw_summary else dict(EMPTY_SUMMARY)
+    return _decode(raw_messages), summary
+
+
+async def aappend_messages(session_id, messages):
+    """
+    Append messages to a session in one round trip and refresh its TTL.
+
+    Args:
+        session_id (str): Unique session identifier.
+        messages (list): LangChain messages to append.
+    """
+    key = HISTORY_KEY_PREFIX + session_id
+    pipeline = get_async_redis().pipeline(transaction=True)
+    pipeline.rpush(key, *_encode(messages))
+    pipeline.expire(key, SESSION_TTL)
+    pipeline.expire(SUMMARY_KEY_PREFIX + session_id, SESSION_TTL)
+    await _aexecute(pipeline, 3)
+
+
+async def areset_session(session_id, messages):
+    """
+    Replace a session's history with `messages` and drop its summary.
+
+    Args:
+        session_id (str): Unique session identifier.
+        messages (list): LangChain messages, oldest first.
+    """
+    key = HISTORY_KEY_PREFIX + session_id
+    pipeline = get_async_redis().pipeline(transaction=True)
+    pipeline.delete(key, SUMMARY_KEY_PREFIX + session_id)
+    pipeline.rpush(key, *_encode(messages))
+    pipeline.expire(key, SESSION_TTL)
+    await _aexecute(pipeline, 3)
+
+
+async def asave_summary(session_id, previous, summary, upto):
+    """
+    Store a session's new rolling summary and trim the messages it covers.
+
+    The summary key is watched, so the summary and the list are only
+    changed if no other process replaced the summary since `previous` was
+    read; otherwise the list could be trimmed twice.
+
+    Args:
+        session_id (str): Unique session identifier.
+        previous (dict): The summary state the new summary extends.
+        summary (str): The new summary.
+        upto (int): Number of leading messages of the list it covers.
+
+    Returns:
+        bool: False if the summary changed meanwhile and nothing was saved.
+    """
+    key = HISTORY_KEY_PREFIX + session_id
+    summary_key = SUMMARY_KEY_PREFIX + session_id
+    async with get_async_redis().pipeline(transaction=True) as pipeline:
+        try:
+            started = time.perf_counter()
+            await pipeline.watch(summary_key)
+            raw_summary = await pipeline.get(summary_key)
+            _metrics.record(2, time.perf_counter() - started)
+            current = json.loads(raw_summary) if raw_summary else EMPTY_SUMMARY
+            if current != previous:
+                return False
+            pipeline.multi()
+            pipeline.ltrim(key, upto, -1)
+            pipeline.set(
+                summary_key,
+                json.dumps({"summary": summary, "covered": 0}),
+                ex=SESSION_TTL,
+            )
+            await _aexecute(pipeline, 2)
+        except redis.WatchError:
+            return False
+    return True
+
+
+class PooledRedisChatHistory(BaseChatMessageHistory):
+    """
+    LangChain chat history backed by the shared Redis pools.
+
+    Args:
+        session_id (str): Unique session identifier.
+    """
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.key = HISTORY_KEY_PREFIX + session_id
+
+    @property
+    def messages(self):
+        pipeline = get_sync_redis().pipeline(transaction=False)
+        pipeline.lrange(self.key, 0, -1)
+        (raw_messages,) = _execute(pipeline, 1)
+        return _decode(raw_messages)
+
+    def add_messages(self, messages):
+        pipeline = get_sync_redis().pipeline(transaction=True)
+        pipeline.rpush(self.key, *_encode(messages))
+        pipeline.expire(self.key, SESSION_TTL)
+        _execute(pipeline, 2)
+
+    def clear(self):
+        pipeline = get_sync_redis().pipeline(transaction=False)
+        pipeline.delete(self.key, SUMMARY_KEY_PREFIX + self.session_id)
+        _execute(pipeline, 1)
+
+    async def aget_messages(self):
+        messages, _ = await aload_session(self.session_id)
+        return messages
+
+    async def aadd_messages(self, messages):
+        await aappend_messages(self.session_id, messages)
+
+
+def _pool_stats(pool):
+    """Count the connections of a pool (redis-py keeps them in private fields)."""
+    if pool is None:
+        in_use = idle = 0
+    elif hasattr(pool, "_in_use_connections"):  # asyncio pool
+        in_use = len(pool._in_use_connections)
+        idle = len(pool._available_connections)
+    else:  # sync blocking pool: idle connections wait in a queue padded with None
+        idle = sum(1 for connection in list(pool.pool.queue) if connection)
+        in_use = len(pool._connections) - idle
+    return {"created": in_use + idle, "in_use": in_use, "idle": idle}
+
+
+def redis_stats():
+    """
+    Return pool and round-trip metrics.
+
+    Returns:
+        dict: `pool_size`, per-pool `async`/`sync` connection counts
+        (`created`, `in_use`, `idle`), `round_trips`, `commands`, `errors`,
+        `avg_ms` and `max_ms`.
+    """
+    with _metrics._lock:
+        trips = _metrics.round_trips
+        return {
+            "pool_size": REDIS_POOL_SIZE,
+            "async": _pool_stats(_async_pool),
+            "sync": _pool_stats(_sync_pool),
+            "round_trips": trips,
+            "commands": _metrics.commands,
+            "errors": _metrics.errors,
+            "avg_ms": 1000 * _metrics.seconds / trips if trips else 0.0,
+            "max_ms": 1000 * _metrics.max_seconds,
+        }
@@ -0,0 +1,124 @@
+"""
+# services.py
+Lazily created, process-wide service clients.
+
+Heavy clients (the chat LLM, the embedding provider, the LangSmith tracer)
+are registered as factories and built on first use, so a process that only
+renders the login page never imports or constructs them. Each service is
+created at most once per process, even when several Streamlit sessions
+ask for it at the same time.
+
+`run_once` gives startup work (migrations, worker threads) the same
+once-per-process guarantee.
+"""
+
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+
+from logger import setup_logger
+
+load_dotenv()
+logger = setup_logger()
+
+CHAT_MODEL = os.getenv("CHAT_MODEL", "gemini-1.5-flash")
+
+_factories = {}
+_instances = {}
+_created = {}  # name -> seconds spent creating the service
+_lock = threading.RLock()
+_done = set()
+
+
+def register(name, factory):
+    """
+    Register how to build a service.
+
+    Args:
+        name (str): Service name.
+        factory (callable): Builds the service; called at most once.
+    """
+    with _lock:
+        _factories[name] = factory
+
+
+def get(name):
+    """
+    Return a service, creating it on first use.
+
+    Raises:
+        KeyError: If no factory is registered under `name`.
+    """
+    instance = _instances.get(name)
+    if instance is not None:
+        return instance
+    with _lock:
+        if name not in _instances:
+            started = time.perf_counter()
+            _instances[name] = _factories[name]()
+            _created[name] = time.perf_counter() - started
+            logger.info("Created service %s in %.2fs", name, _created[name])
+        return _instances[name]
+
+
+def run_once(name, func):
+    """
+    Run `func` the first time `name` is seen in this process.
+
+    A failed run is retried on the next call.
+    """
+    if name in _done:
+        return
+    with _lock:
+        if name in _done:
+            return
+        func()
+        _done.add(name)
+
+
+def stats():
+    """Return the creation time (seconds) of every service created so far."""
+    with _lock:
+        return dict(_created)
+
+
+def _create_llm():
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    return ChatGoogleGenerativeAI(
+        model=CHAT_MODEL, api_key=os.getenv("GEMINI_API_KEY")
+    )
+
+
+def _create_embeddings():
+    from embedding_providers import get_embedding_provider
+
+    return get_embedding_provider()
+
+
+def _create_tracer():
+    from langchain.callbacks.tracers import LangChainTracer
+
+    return LangChainTracer()
+
+
+register("llm", _create_llm)
+register("embeddings", _create_embeddings)
+register("tracer", _create_tracer)
+
+
+def get_llm():
+    """Return the chat model."""
+    return get("llm")
+
+
+def get_embeddings():
+    """Return the configured embedding provider (see embedding_providers.py)."""
+    return get("embeddings")
+
+
+def get_tracer():
+    """Return the LangSmith tracer."""
+    return get("tracer")
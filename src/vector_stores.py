@@ -0,0 +1,221 @@
+"""
+# vector_stores.py
+Shared layout and access helpers for the per-bot Chroma databases.
+
+Every bot keeps a single collection, `BOT_COLLECTION`, in
+`user_docs/<username>/<bot_name>/Chroma_db`. Each chunk carries `source`
+(file name), `page` and `chunk_index` metadata so searches can be scoped to
+specific files.
+
+`vector_store_pool` keeps opened stores alive across chat turns so the
+persistent SQLite/HNSW files are not re-opened on every message.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from langchain_chroma import Chroma
+from embedding_providers import check_collection_provider
+from logger import setup_logger
+
+logger = setup_logger()
+
+BOT_COLLECTION = "bot_documents"
+PERSIST_DIRNAME = "Chroma_db"
+
+VECTOR_STORE_POOL_SIZE = int(os.getenv("VECTOR_STORE_POOL_SIZE", "32"))
+VECTOR_STORE_POOL_MAX_MB = int(os.getenv("VECTOR_STORE_POOL_MAX_MB", "1024"))
+
+# One lock per Chroma persist directory so concurrent ingestions and index
+# builds never write to the same files at once
+_persist_locks = {}
+_persist_locks_guard = threading.Lock()
+
+
+def bot_directory(username, bot_name):
+    """Return the document directory of a bot."""
+    return os.path.join("user_docs", username, str(bot_name))
+
+
+def persist_directory_for(directory_path):
+    """Return the Chroma persist directory inside a bot directory."""
+    return os.path.join(directory_path, PERSIST_DIRNAME)
+
+
+def open_vector_store(
+    persist_directory, embedding_function, collection_name=BOT_COLLECTION
+):
+    """
+    Open a Chroma collection.
+
+    Args:
+        persist_directory (str): The bot's Chroma persist directory.
+        embedding_function: Embeddings used by Chroma for text queries.
+        collection_name (str): Collection to open; defaults to the bot collection.
+
+    Returns:
+        Chroma: The vector store.
+
+    Raises:
+        EmbeddingProviderMismatch: If the collection was built by a different
+            embedding provider than `embedding_function`.
+    """
+    store = Chroma(
+        collection_name=collection_name,
+        embedding_function=embedding_function,
+        persist_directory=persist_directory,
+    )
+    if getattr(embedding_function, "provider_id", None):
+        check_collection_provider(store._collection, embedding_function)
+    return store
+
+
+def persist_lock(persist_directory):
+    """Return the lock that serializes writes to a persist directory."""
+    with _persist_locks_guard:
+        return _persist_locks.setdefault(
+            os.path.abspath(persist_directory), threading.Lock()
+        )
+
+
+def source_filter(files):
+    """Return a Chroma `where` filter restricting a search to some files."""
+    if not files:
+        return None
+    if len(files) == 1:
+        return {"source": files[0]}
+    return {"source": {"$in": list(files)}}
+
+
+def _directory_size(path):
+    """Approximate the memory footprint of a store by its size on disk."""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+class VectorStorePool:
+    """
+    Thread-safe, process-wide LRU registry of opened vector stores.
+
+    Stores are keyed by (persist directory, collection) and evicted least
+    recently used once the pool holds more than `max_stores` stores or their
+    estimated size exceeds `max_bytes`. Ingestion calls `invalidate` after
+    writing to a bot so readers re-open a fresh handle.
+
+    Args:
+        max_stores (int): Maximum number of open stores.
+        max_bytes (int): Maximum estimated size of all open stores.
+    """
+
+    def __init__(
+        self,
+        max_stores=VECTOR_STORE_POOL_SIZE,
+        max_bytes=VECTOR_STORE_POOL_MAX_MB * 1024 * 1024,
+    ):
+        self.max_stores = max_stores
+        self.max_bytes = max_bytes
+        self._stores = OrderedDict()  # key -> (store, estimated bytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.open_seconds = 0.0
+        self.max_open_seconds = 0.0
+
+    def get(
+        self, persist_directory, embedding_function, collection_name=BOT_COLLECTION
+    ):
+        """
+        Return an open store, opening it on first use.
+
+        Args:
+            persist_directory (str): The bot's Chroma persist directory.
+            embedding_function: Embeddings used by Chroma for text queries.
+            collection_name (str): Collection to open.
+
+        Returns:
+            Chroma: The vector store.
+        """
+        key = (os.path.abspath(persist_directory), collection_name)
+        with self._lock:
+            if key in self._stores:
+                self._stores.move_to_end(key)
+                self.hits += 1
+                return self._stores[key][0]
+            self.misses += 1
+
+        # Open outside the lock so a slow open does not block other bots
+        started = time.perf_counter()
+        store = open_vector_store(
+            persist_directory, embedding_function, collection_name=collection_name
+        )
+        size = _directory_size(persist_directory)
+        elapsed = time.perf_counter() - started
+
+        with self._lock:
+            self.open_seconds += elapsed
+            self.max_open_seconds = max(self.max_open_seconds, elapsed)
+            if key in self._stores:  # another thread opened it meanwhile
+                self._stores.move_to_end(key)
+                return self._stores[key][0]
+            self._stores[key] = (store, size)
+            self._bytes += size
+            self._evict()
+        return store
+
+    def _evict(self):
+        """Drop least recently used stores until the pool is within bounds."""
+        while len(self._stores) > 1 and (
+            len(self._stores) > self.max_stores or self._bytes > self.max_bytes
+        ):
+            key, (_, size) = self._stores.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
+            logger.info("Evicted vector store %s from the pool", key)
+
+    def invalidate(self, persist_directory):
+        """Forget every open store of a persist directory."""
+        path = os.path.abspath(persist_directory)
+        with self._lock:
+            for key in [key for key in self._stores if key[0] == path]:
+                _, size = self._stores.pop(key)
+                self._bytes -= size
+                self.invalidations += 1
+
+    def stats(self):
+        """
+        Return pool counters.
+
+        Returns:
+            dict: `open_stores`, `estimated_bytes`, `hits`, `misses`,
+            `hit_rate`, `evictions`, `invalidations`, `avg_open_ms` and
+            `max_open_ms`.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "open_stores": len(self._stores),
+                "estimated_bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "avg_open_ms": 1000 * self.open_seconds / self.misses
+                if self.misses
+                else 0.0,
+                "max_open_ms": 1000 * self.max_open_seconds,
+            }
+
+
+vector_store_pool = VectorStorePool()
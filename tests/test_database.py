@@ -0,0 +1,56 @@
+"""
+# test_database.py
+Schema migrations and the EXPLAIN QUERY PLAN guard on the hot queries.
+"""
+
+import pytest
+
+import database
+from database import MIGRATIONS, find_slow_queries, migrate, schema_version
+
+
+@pytest.fixture
+def conn(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "ChatBridge.db"))
+    conn = database.get_connection()
+    yield conn
+    conn.close()
+
+
+def test_fresh_database_serves_hot_queries_from_indexes(conn):
+    assert migrate(conn) == MIGRATIONS[-1][0]
+    assert find_slow_queries(conn) == {}
+
+
+def test_unversioned_database_migrates_to_current_schema(conn):
+    # The schema as it was before migrations were versioned
+    conn.executescript(
+        """CREATE TABLE users (username TEXT PRIMARY KEY, email TEXT, password TEXT);
+           CREATE TABLE chatbots (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                                  bot_name TEXT, username TEXT);
+           CREATE TABLE chat_history (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                                      bot_id INTEGER, role TEXT, content TEXT,
+                                      timestamp DATETIME);"""
+    )
+    assert schema_version(conn) == 0
+
+    assert migrate(conn) == MIGRATIONS[-1][0]
+    assert find_slow_queries(conn) == {}
+
+
+def test_missing_index_is_reported(conn):
+    migrate(conn)
+    conn.execute("DROP INDEX idx_chatbots_username")
+
+    slow = find_slow_queries(conn)
+
+    assert "SELECT * FROM chatbots WHERE username=?" in slow
+
+
+def test_migrate_is_idempotent(conn):
+    version = migrate(conn)
+
+    assert migrate(conn) == version
+    assert conn.execute("SELECT COUNT(*) FROM schema_version").fetchone()[0] == len(
+        MIGRATIONS
+    )
@@ -0,0 +1,187 @@
+"""
+# test_embedding_client.py
+BatchedEmbeddingClient against a fake embedding server that throttles
+(429) and fails (5xx) on demand.
+"""
+
+import threading
+import time
+
+import pytest
+
+import embedding_client
+from embedding_client import (
+    BatchedEmbeddingClient,
+    EmbeddingError,
+    TokenBucket,
+    classify_error,
+)
+
+
+class FakeHTTPError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"{status_code} error from fake embedding server")
+        self.status_code = status_code
+
+
+class FakeEmbeddingServer:
+    """
+    Embeds "t<i>" as [i], recording every request.
+
+    Args:
+        failures (dict): Request number -> status code (or exception) to fail
+            that request with.
+        max_batch (int): Requests with more texts are throttled with a 429.
+    """
+
+    def __init__(self, failures=None, max_batch=None):
+        self.failures = failures or {}
+        self.max_batch = max_batch
+        self.requests = []
+
+    def __call__(self, texts):
+        number = len(self.requests)
+        self.requests.append(list(texts))
+        failure = self.failures.get(number)
+        if failure is None and self.max_batch and len(texts) > self.max_batch:
+            failure = 429
+        if isinstance(failure, Exception):
+            raise failure
+        if failure:
+            raise FakeHTTPError(failure)
+        return [[float(text[1:])] for text in texts]
+
+    @property
+    def batch_sizes(self):
+        return [len(request) for request in self.requests]
+
+
+def _texts(n):
+    return [f"t{i}" for i in range(n)]
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Record backoff sleeps instead of sleeping; jitter takes its maximum."""
+    recorded = []
+    monkeypatch.setattr(embedding_client.time, "sleep", recorded.append)
+    monkeypatch.setattr(embedding_client.random, "uniform", lambda low, high: high)
+    return recorded
+
+
+def test_backoff_is_exponential_and_capped(sleeps):
+    server = FakeEmbeddingServer(failures={0: 503, 1: 502, 2: 429, 3: 500})
+    client = BatchedEmbeddingClient(server, limiter=None, base_delay=1, max_delay=5)
+
+    vectors = client.embed_documents(_texts(3))
+
+    assert vectors == [[0.0], [1.0], [2.0]]
+    assert sleeps == [1, 2, 4, 5]
+
+
+def test_gives_up_after_max_retries(sleeps):
+    server = FakeEmbeddingServer(failures={i: 503 for i in range(10)})
+    client = BatchedEmbeddingClient(server, limiter=None, max_retries=3)
+
+    with pytest.raises(EmbeddingError):
+        client.embed_documents(_texts(3))
+
+    assert len(server.requests) == 4
+
+
+def test_batch_shrinks_on_throttling(sleeps):
+    server = FakeEmbeddingServer(max_batch=25)
+    client = BatchedEmbeddingClient(server, limiter=None, max_batch_size=100)
+
+    vectors = client.embed_documents(_texts(100))
+
+    assert vectors == [[float(i)] for i in range(100)]
+    assert server.batch_sizes == [100, 50, 25, 25, 25, 25]
+    assert client.batch_size == 25
+
+
+def test_batch_grows_back_after_successes(sleeps):
+    server = FakeEmbeddingServer(failures={0: 429})
+    client = BatchedEmbeddingClient(server, limiter=None, max_batch_size=100)
+
+    client.embed_documents(_texts(450))
+
+    assert server.batch_sizes == [100, 50, 50, 50, 50, 50, 100, 100]
+    assert client.batch_size == 100
+
+
+def test_only_failed_batch_is_retried(sleeps):
+    server = FakeEmbeddingServer(failures={1: 500})
+    client = BatchedEmbeddingClient(server, limiter=None, max_batch_size=10)
+
+    vectors = client.embed_documents(_texts(30))
+
+    assert vectors == [[float(i)] for i in range(30)]
+    assert server.requests == [_texts(30)[0:10]] + [_texts(30)[10:20]] * 2 + [
+        _texts(30)[20:30]
+    ]
+
+
+def test_non_retryable_error_keeps_partial_results(sleeps):
+    server = FakeEmbeddingServer(failures={2: ValueError("bad input")})
+    client = BatchedEmbeddingClient(server, limiter=None, max_batch_size=10)
+
+    with pytest.raises(EmbeddingError) as excinfo:
+        client.embed_documents(_texts(30))
+
+    assert excinfo.value.partial == {i: [float(i)] for i in range(20)}
+    assert len(server.requests) == 3
+    assert sleeps == []
+
+
+@pytest.mark.parametrize(
+    "message, expected",
+    [
+        ("429 Resource has been exhausted", "throttled"),
+        ("RESOURCE_EXHAUSTED: quota exceeded", "throttled"),
+        ("503 Service Unavailable", "server"),
+        ("upstream returned 502", "server"),
+        ("DEADLINE_EXCEEDED", "server"),
+        ("400 input has 15000 tokens, limit 2048", None),
+        ("batch of 1500 texts is too large", None),
+        ("request id 4290: invalid argument", None),
+    ],
+)
+def test_classify_error_by_message(message, expected):
+    assert classify_error(ValueError(message)) == expected
+
+
+def test_client_error_with_large_number_is_not_retried(sleeps):
+    error = ValueError("400 input has 15000 tokens, limit 2048")
+    server = FakeEmbeddingServer(failures={0: error})
+    client = BatchedEmbeddingClient(server, limiter=None)
+
+    with pytest.raises(EmbeddingError):
+        client.embed_documents(_texts(3))
+
+    assert len(server.requests) == 1
+    assert sleeps == []
+
+
+def test_shared_limiter_caps_all_clients():
+    # 60 texts through a bucket of 10 refilling 100/s: at least 0.5s
+    limiter = TokenBucket(rate=100, capacity=10)
+    servers = [FakeEmbeddingServer(), FakeEmbeddingServer()]
+    clients = [
+        BatchedEmbeddingClient(server, limiter=limiter, max_batch_size=10)
+        for server in servers
+    ]
+    threads = [
+        threading.Thread(target=client.embed_documents, args=(_texts(30),))
+        for client in clients
+    ]
+
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    assert elapsed >= 0.45
+    assert sum(len(server.requests) for server in servers) == 6
@@ -0,0 +1,122 @@
+"""
+# test_redis_store.py
+Round trips, TTLs and pool metrics of the Redis session store, against
+fakeredis.
+"""
+
+import asyncio
+import json
+
+import fakeredis
+import fakeredis.aioredis
+import pytest
+import redis
+import redis.asyncio as aioredis
+from langchain_core.messages import AIMessage, HumanMessage
+
+import redis_store
+from redis_store import HISTORY_KEY_PREFIX, SESSION_TTL, SUMMARY_KEY_PREFIX
+
+
+@pytest.fixture
+def server(monkeypatch):
+    """Point both shared pools at a fresh fake server with fresh metrics."""
+    server = fakeredis.FakeServer()
+    pool_size = redis_store.REDIS_POOL_SIZE
+    monkeypatch.setattr(
+        redis_store,
+        "_async_pool",
+        aioredis.BlockingConnectionPool(
+            connection_class=fakeredis.aioredis.FakeConnection,
+            server=server,
+            max_connections=pool_size,
+        ),
+    )
+    monkeypatch.setattr(
+        redis_store,
+        "_sync_pool",
+        redis.BlockingConnectionPool(
+            connection_class=fakeredis.FakeConnection,
+            server=server,
+            max_connections=pool_size,
+        ),
+    )
+    monkeypatch.setattr(redis_store, "_metrics", redis_store._Metrics())
+    return server
+
+
+def _turn(i):
+    return [HumanMessage(content=f"question {i}"), AIMessage(content=f"answer {i}")]
+
+
+async def _chat(session_id, turns):
+    """Load the session and append one turn, as the chat pipeline does."""
+    for i in range(turns):
+        await redis_store.aload_session(session_id)
+        await redis_store.aappend_messages(session_id, _turn(i))
+
+
+def test_turn_costs_two_round_trips(server):
+    asyncio.run(_chat("s1", 1))
+    assert redis_store.redis_stats()["round_trips"] == 2
+
+    asyncio.run(_chat("s1", 10))
+    stats = redis_store.redis_stats()
+    assert stats["round_trips"] == 2 + 2 * 10
+    assert stats["errors"] == 0
+
+
+def test_load_returns_messages_and_summary(server):
+    asyncio.run(_chat("s1", 3))
+    client = fakeredis.FakeRedis(server=server)
+    client.set(SUMMARY_KEY_PREFIX + "s1", json.dumps({"summary": "hi", "covered": 0}))
+
+    messages, summary = asyncio.run(redis_store.aload_session("s1"))
+
+    assert [m.content for m in messages][-2:] == ["question 2", "answer 2"]
+    assert len(messages) == 6
+    assert summary == {"summary": "hi", "covered": 0}
+
+
+def test_append_refreshes_session_ttl(server):
+    client = fakeredis.FakeRedis(server=server)
+    asyncio.run(_chat("s1", 1))
+    client.set(SUMMARY_KEY_PREFIX + "s1", json.dumps(redis_store.EMPTY_SUMMARY))
+    client.expire(HISTORY_KEY_PREFIX + "s1", 10)
+    client.expire(SUMMARY_KEY_PREFIX + "s1", 10)
+
+    asyncio.run(redis_store.aappend_messages("s1", _turn(1)))
+
+    assert client.ttl(HISTORY_KEY_PREFIX + "s1") > SESSION_TTL - 5
+    assert client.ttl(SUMMARY_KEY_PREFIX + "s1") > SESSION_TTL - 5
+
+
+def test_pool_stats_are_reported(server):
+    async def concurrent_sessions():
+        await asyncio.gather(*(_chat(f"s{i}", 2) for i in range(8)))
+
+    asyncio.run(concurrent_sessions())
+    redis_store.PooledRedisChatHistory("s0").messages
+
+    stats = redis_store.redis_stats()
+    assert stats["pool_size"] == redis_store.REDIS_POOL_SIZE
+    assert 1 <= stats["async"]["created"] <= 8
+    assert stats["async"]["in_use"] == 0
+    assert stats["sync"] == {"created": 1, "in_use": 0, "idle": 1}
+    assert stats["round_trips"] == 8 * 2 * 2 + 1
+    assert stats["commands"] == 8 * 2 * (2 + 3) + 1
+    assert stats["avg_ms"] > 0
+
+
+def test_save_summary_trims_covered_messages_once(server):
+    asyncio.run(_chat("s1", 5))
+    messages, state = asyncio.run(redis_store.aload_session("s1"))
+
+    assert asyncio.run(redis_store.asave_summary("s1", state, "first turns", 4))
+    # A second refresh from the same stale state must not trim again
+    assert not asyncio.run(redis_store.asave_summary("s1", state, "stale", 4))
+
+    messages, state = asyncio.run(redis_store.aload_session("s1"))
+    assert [m.content for m in messages][0] == "question 2"
+    assert len(messages) == 6
+    assert state == {"summary": "first turns", "covered": 0}